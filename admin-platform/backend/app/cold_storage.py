@@ -0,0 +1,377 @@
+"""Cold storage for old telemetry and events rows.
+
+A background job moves rows older than a cutoff out of SQLite into one
+compressed, columnar segment file per device, kind and UTC day:
+
+    {COLD_STORAGE_DIR}/{kind}/{device_id}/{YYYY-MM-DD}.seg
+
+A segment is a small JSON header (row count, ts range, column directory)
+followed by one zlib-compressed block per column: timestamps are delta
+encoded, numeric series XOR-encoded against the previous value (slowly
+changing metrics become runs of zero bytes), text columns length-prefixed.
+Readers memory-map the file and only inflate the columns they need, so the
+hot DB stays small while history stays queryable.
+"""
+
+import calendar
+import json
+import logging
+import math
+import mmap
+import os
+import shutil
+import struct
+import threading
+import time
+import zlib
+from array import array
+from typing import Optional
+from urllib.parse import quote
+
+from sqlalchemy import select, delete, Integer
+
+from .db import SessionLocal
+from .models import Telemetry, Event
+from .settings import COLD_STORAGE_DIR, TELEMETRY_COLD_AFTER_DAYS, EVENTS_COLD_AFTER_DAYS, COLD_RETENTION_DAYS
+from .telemetry_metrics import TELEMETRY_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"IOCSEG1\0"
+DAY_MS = 86_400_000
+NULL_LENGTH = 0xFFFFFFFF
+
+# kind -> model, text columns and XOR-encoded numeric columns
+KINDS = {
+    "telemetry": {"model": Telemetry, "text": ("payload",), "numeric": TELEMETRY_COLUMNS},
+    "events": {"model": Event, "text": ("type", "payload"), "numeric": ()},
+}
+
+
+def _delta_encode(values: list) -> bytes:
+    deltas = array("q", [0]) * len(values)
+    previous = 0
+    for i, value in enumerate(values):
+        deltas[i] = value - previous
+        previous = value
+    return deltas.tobytes()
+
+
+def _delta_decode(data) -> list:
+    deltas = array("q")
+    deltas.frombytes(data)
+    values, total = [], 0
+    for delta in deltas:
+        total += delta
+        values.append(total)
+    return values
+
+
+def _xor_encode(values: list) -> bytes:
+    bits = array("Q")
+    bits.frombytes(array("d", [math.nan if v is None else v for v in values]).tobytes())
+    previous = 0
+    for i, word in enumerate(bits):
+        bits[i] = word ^ previous
+        previous = word
+    return bits.tobytes()
+
+
+def _xor_decode(data) -> list:
+    bits = array("Q")
+    bits.frombytes(data)
+    previous = 0
+    for i, word in enumerate(bits):
+        previous = bits[i] = word ^ previous
+    floats = array("d")
+    floats.frombytes(bits.tobytes())
+    return [None if math.isnan(v) else v for v in floats]
+
+
+def _text_encode(values: list) -> bytes:
+    lengths = array("I")
+    chunks = []
+    for value in values:
+        if value is None:
+            lengths.append(NULL_LENGTH)
+            continue
+        encoded = value.encode()
+        lengths.append(len(encoded))
+        chunks.append(encoded)
+    return lengths.tobytes() + b"".join(chunks)
+
+
+def _text_decode(data, rows: int) -> list:
+    lengths = array("I")
+    lengths.frombytes(data[:rows * 4])
+    values, pos = [], rows * 4
+    for length in lengths:
+        if length == NULL_LENGTH:
+            values.append(None)
+            continue
+        values.append(bytes(data[pos:pos + length]).decode())
+        pos += length
+    return values
+
+
+def write_segment(path: str, meta: dict, columns: dict) -> None:
+    """Write {name: (encoding, values)} atomically as a segment file."""
+    encoders = {"delta": _delta_encode, "xor": _xor_encode, "text": _text_encode}
+    blocks, directory, offset = [], {}, 0
+    for name, (encoding, values) in columns.items():
+        block = zlib.compress(encoders[encoding](values), 6)
+        directory[name] = [encoding, offset, len(block)]
+        blocks.append(block)
+        offset += len(block)
+    header = json.dumps({**meta, "columns": directory}).encode()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        for block in blocks:
+            f.write(block)
+    os.replace(tmp, path)
+
+
+def read_header(mm) -> tuple:
+    """(header dict, body offset) of a mapped segment."""
+    if mm[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a cold storage segment")
+    (length,) = struct.unpack_from("<I", mm, len(MAGIC))
+    start = len(MAGIC) + 4
+    return json.loads(mm[start:start + length]), start + length
+
+
+def read_segment(path: str, columns=None) -> tuple:
+    """(header, {column: values}) for the requested columns (all when None)."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        header, body = read_header(mm)
+        rows = header["rows"]
+        data = {}
+        for name, (encoding, offset, length) in header["columns"].items():
+            if columns is not None and name != "ts" and name not in columns:
+                continue
+            raw = zlib.decompress(mm[body + offset:body + offset + length])
+            if encoding == "delta":
+                data[name] = _delta_decode(raw)
+            elif encoding == "xor":
+                data[name] = _xor_decode(raw)
+            else:
+                data[name] = _text_decode(memoryview(raw), rows)
+        return header, data
+
+
+def _int_ts(value) -> int:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+class ColdStorage:
+    """Tiering job and reader for per-device, per-day segment files."""
+
+    TIER_INTERVAL = 3600  # seconds between tiering passes
+    TIER_BATCH = 200  # (device, day) segments per DB round trip
+
+    def __init__(self, root: str, after_days: dict, retention_days: float) -> None:
+        self.root = root
+        # kind -> days a row stays in the DB (0 = never moved)
+        self.after_days = after_days
+        # Days a segment is kept (0 = forever)
+        self.retention_days = retention_days
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        self.rows_moved = dict.fromkeys(KINDS, 0)
+        self.segments_written = dict.fromkeys(KINDS, 0)
+        self.segments_pruned = 0
+        self.last_pass_ms = 0.0
+
+    def hot_cutoff(self, kind: str) -> int:
+        """Rows before this ts (start of a UTC day) live in segments; 0 when disabled."""
+        days = self.after_days.get(kind)
+        if not days:
+            return 0
+        cutoff = int(time.time() * 1000 - days * DAY_MS)
+        return cutoff - cutoff % DAY_MS
+
+    def _device_dir(self, kind: str, device_id: str) -> str:
+        return os.path.join(self.root, kind, quote(device_id, safe=""))
+
+    def _segment_path(self, kind: str, device_id: str, day_ts: int) -> str:
+        day = time.strftime("%Y-%m-%d", time.gmtime(day_ts / 1000))
+        return os.path.join(self._device_dir(kind, device_id), f"{day}.seg")
+
+    def _row_values(self, kind: str, row) -> dict:
+        spec = KINDS[kind]
+        values = {"ts": _int_ts(row.ts)}
+        for name in spec["text"]:
+            values[name] = getattr(row, name)
+        for name in spec["numeric"]:
+            values[name] = getattr(row, name)
+        return values
+
+    def _write(self, kind: str, device_id: str, day_ts: int, rows: list) -> None:
+        """Merge rows into the day's segment (existing rows first, duplicates dropped)."""
+        spec = KINDS[kind]
+        names = ("ts", *spec["text"], *spec["numeric"])
+        path = self._segment_path(kind, device_id, day_ts)
+        if os.path.exists(path):
+            _, data = read_segment(path)
+            existing = [{name: data.get(name, [None] * len(data["ts"]))[i] for name in names}
+                        for i in range(len(data["ts"]))]
+            seen = {tuple(r[n] for n in names) for r in existing}
+            rows = existing + [r for r in rows if tuple(r[n] for n in names) not in seen]
+        rows.sort(key=lambda r: r["ts"])
+
+        columns = {"ts": ("delta", [r["ts"] for r in rows])}
+        for name in spec["text"]:
+            columns[name] = ("text", [r[name] for r in rows])
+        for name in spec["numeric"]:
+            columns[name] = ("xor", [r[name] for r in rows])
+        meta = {"kind": kind, "device_id": device_id, "rows": len(rows),
+                "min_ts": rows[0]["ts"], "max_ts": rows[-1]["ts"]}
+        write_segment(path, meta, columns)
+        self.segments_written[kind] += 1
+
+    def tier(self, kind: str) -> int:
+        """Move whole days older than the cutoff into segments. Returns rows moved."""
+        cutoff = self.hot_cutoff(kind)
+        if not cutoff:
+            return 0
+        model = KINDS[kind]["model"]
+        day = (model.ts - model.ts % DAY_MS).label("day")
+        moved = 0
+        while not self._stop.is_set():
+            with SessionLocal() as session:
+                pairs = session.execute(
+                    select(model.device_id, day).where(model.ts < cutoff).distinct().limit(self.TIER_BATCH)
+                ).all()
+                if not pairs:
+                    break
+                for device_id, day_ts in pairs:
+                    day_ts = _int_ts(day_ts)
+                    rows = session.execute(
+                        select(model)
+                        .where(model.device_id == device_id, model.ts >= day_ts, model.ts < day_ts + DAY_MS)
+                        .order_by(model.ts, model.id)
+                    ).scalars().all()
+                    if not rows:
+                        continue
+                    # Segment first, then delete: a crash in between only leaves
+                    # duplicates that the next merge drops
+                    self._write(kind, device_id, day_ts, [self._row_values(kind, r) for r in rows])
+                    ids = [r.id for r in rows]
+                    for i in range(0, len(ids), 500):
+                        session.execute(delete(model).where(model.id.in_(ids[i:i + 500])))
+                    session.commit()
+                    moved += len(ids)
+            time.sleep(0.05)
+        self.rows_moved[kind] += moved
+        return moved
+
+    def prune(self) -> int:
+        """Delete segments past the retention. Returns the number of files removed."""
+        if not self.retention_days:
+            return 0
+        cutoff = time.strftime("%Y-%m-%d", time.gmtime(time.time() - self.retention_days * 86400))
+        removed = 0
+        for kind in KINDS:
+            kind_dir = os.path.join(self.root, kind)
+            if not os.path.isdir(kind_dir):
+                continue
+            for device_dir in os.scandir(kind_dir):
+                for entry in os.scandir(device_dir.path):
+                    if entry.name.endswith(".seg") and entry.name[:-4] < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+        self.segments_pruned += removed
+        return removed
+
+    def read(self, kind: str, device_id: str, from_ts: Optional[int] = None, to_ts: Optional[int] = None,
+             limit: Optional[int] = None, columns=None) -> list:
+        """Cold rows of a device, newest first, as dicts (ts plus the requested columns)."""
+        device_dir = self._device_dir(kind, device_id)
+        try:
+            files = sorted((f for f in os.listdir(device_dir) if f.endswith(".seg")), reverse=True)
+        except FileNotFoundError:
+            return []
+        int_columns = {c.name for c in KINDS[kind]["model"].__table__.columns if isinstance(c.type, Integer)}
+        result = []
+        for name in files:
+            day_ts = calendar.timegm(time.strptime(name[:-4], "%Y-%m-%d")) * 1000
+            if to_ts is not None and day_ts > to_ts:
+                continue
+            if from_ts is not None and day_ts + DAY_MS <= from_ts:
+                break
+            header, data = read_segment(os.path.join(device_dir, name), columns)
+            names = [n for n in data if n != "ts"]
+            for i in range(header["rows"] - 1, -1, -1):
+                ts = data["ts"][i]
+                if (from_ts is not None and ts < from_ts) or (to_ts is not None and ts > to_ts):
+                    continue
+                row = {"ts": ts}
+                for n in names:
+                    value = data[n][i]
+                    row[n] = int(value) if n in int_columns and value is not None else value
+                result.append(row)
+                if limit is not None and len(result) >= limit:
+                    return result
+        return result
+
+    def forget(self, device_id: str) -> None:
+        """Remove all segments of a deleted device."""
+        for kind in KINDS:
+            shutil.rmtree(self._device_dir(kind, device_id), ignore_errors=True)
+
+    def stats(self) -> dict:
+        return {
+            "dir": self.root,
+            "after_days": dict(self.after_days),
+            "retention_days": self.retention_days,
+            "rows_moved": dict(self.rows_moved),
+            "segments_written": dict(self.segments_written),
+            "segments_pruned": self.segments_pruned,
+            "last_pass_ms": round(self.last_pass_ms, 1),
+        }
+
+    def start(self) -> None:
+        """Start the tiering thread (no-op when cold storage is disabled)."""
+        if not any(self.after_days.values()) or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cold-storage", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(10)
+
+    def _run(self) -> None:
+        # First pass shortly after startup, then hourly
+        delay = 60
+        while not self._stop.wait(delay):
+            delay = self.TIER_INTERVAL
+            started = time.perf_counter()
+            for kind in KINDS:
+                try:
+                    moved = self.tier(kind)
+                    if moved:
+                        logger.info(f"[COLD] Moved {moved} {kind} rows to cold storage")
+                except Exception as e:
+                    logger.error(f"[COLD] Tiering {kind} failed: {e}")
+            try:
+                self.prune()
+            except Exception as e:
+                logger.error(f"[COLD] Retention failed: {e}")
+            self.last_pass_ms = (time.perf_counter() - started) * 1000
+
+
+cold_storage = ColdStorage(
+    COLD_STORAGE_DIR,
+    {"telemetry": TELEMETRY_COLD_AFTER_DAYS, "events": EVENTS_COLD_AFTER_DAYS},
+    COLD_RETENTION_DAYS,
+)
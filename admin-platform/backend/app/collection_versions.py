@@ -0,0 +1,120 @@
+"""Per-collection version counters for conditional GETs.
+
+List endpoints answer `If-None-Match` with 304 when the collection has not
+changed, without touching the DB or the serializer. Write paths mark the
+collections they touched on their session (change_log.record does this for
+every logged entity); the counters are bumped only after the commit, so a
+reader can never cache pre-commit data under the new version. The device
+list uses the registry's own version instead.
+
+In external-ingest or clustered mode other processes write too, so a
+thread polls the change log for new rows and bumps the matching counters.
+"""
+
+import logging
+import secrets
+import threading
+from typing import Optional
+
+from sqlalchemy import event, select, func
+
+from .db import SessionLocal
+from .models import ChangeLog
+
+logger = logging.getLogger(__name__)
+
+# change log entity -> list endpoints whose response it appears in
+ENTITY_COLLECTIONS = {
+    "customer": ("customers", "customer_codes"),  # codes carry the customer name
+    "location": ("locations",),
+    "assignment": ("assignments",),
+    "customer_code": ("customer_codes",),
+    "tunnel_config": ("tunnel_configs",),  # logged for ETags only, not served by /sync
+}
+
+
+class CollectionVersions:
+    """Process-local counters, one per list endpoint."""
+
+    def __init__(self) -> None:
+        # Restarts must not hand out ETags a client may already hold
+        self.epoch = secrets.token_hex(4)
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._last_change_id = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def bump(self, *collections: str) -> None:
+        with self._lock:
+            for name in collections:
+                self._versions[name] = self._versions.get(name, 0) + 1
+
+    def touch(self, session, *collections: str) -> None:
+        """Mark collections changed by this session's transaction (bumped on commit)."""
+        session.info.setdefault("changed_collections", set()).update(collections)
+
+    def version(self, collection: str) -> int:
+        with self._lock:
+            return self._versions.get(collection, 0)
+
+    def etag(self, collection: str, *parts) -> str:
+        """Strong ETag for the current version of a collection."""
+        version = self.version(collection)
+        return '"' + "-".join(str(p) for p in (collection, self.epoch, version, *parts)) + '"'
+
+    # ------------------------------------------------------------------
+    # Change log poll (external ingest / clustered mode)
+    # ------------------------------------------------------------------
+
+    def poll(self) -> None:
+        """Bump collections whose entities appear in change log rows written since the last poll."""
+        with SessionLocal() as session:
+            if self._last_change_id is None:
+                self._last_change_id = session.execute(select(func.max(ChangeLog.id))).scalar() or 0
+                return
+            rows = session.execute(
+                select(ChangeLog.entity, func.max(ChangeLog.id))
+                .where(ChangeLog.id > self._last_change_id)
+                .group_by(ChangeLog.entity)
+            ).all()
+        for entity, last_id in rows:
+            self.bump(*ENTITY_COLLECTIONS.get(entity, ()))
+            self._last_change_id = max(self._last_change_id, last_id)
+
+    def start(self, refresh_interval: float) -> None:
+        """Poll the change log every refresh_interval seconds (0 = never)."""
+        if not refresh_interval or (self._thread and self._thread.is_alive()):
+            return
+        self.poll()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(refresh_interval,),
+                                        name="collection-versions", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(10)
+
+    def _run(self, refresh_interval: float) -> None:
+        while not self._stop.wait(refresh_interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"[VERSIONS] Change log poll failed: {e}")
+
+
+collection_versions = CollectionVersions()
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _bump_on_commit(session) -> None:
+    changed = session.info.pop("changed_collections", None)
+    if changed:
+        collection_versions.bump(*changed)
+
+
+@event.listens_for(SessionLocal, "after_soft_rollback")
+def _discard_on_rollback(session, previous_transaction) -> None:
+    session.info.pop("changed_collections", None)
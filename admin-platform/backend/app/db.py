@@ -1,7 +1,55 @@
-from sqlalchemy import create_engine
+import logging
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 from .settings import DATABASE_URL
 
+logger = logging.getLogger(__name__)
+
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+
+
+if DATABASE_URL.startswith("sqlite"):
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        """WAL lets API reads run alongside ingest writers; wait instead of failing on lock.
+
+        auto_vacuum=INCREMENTAL only takes effect on a new database (or after a VACUUM);
+        it lets the retention service hand freed pages back in small steps.
+        """
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA busy_timeout=10000")
+        cursor.close()
+
+
+def after_commit(session, callback) -> None:
+    """
+    Run `callback` once the session's current transaction commits; it is
+    dropped on rollback. For in-memory side effects of a write (rollups,
+    caches) that must not apply twice when the ingest queue retries a batch.
+    """
+    transaction_state(session).setdefault("after_commit", []).append(callback)
+
+
+def transaction_state(session) -> dict:
+    """Scratch dict of the session's current transaction, discarded on commit or rollback."""
+    return session.info.setdefault("transaction", {})
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _run_after_commit(session) -> None:
+    state = session.info.pop("transaction", None) or {}
+    for callback in state.get("after_commit", ()):
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"[DB] After-commit callback failed: {e}", exc_info=True)
+
+
+@event.listens_for(SessionLocal, "after_soft_rollback")
+def _discard_on_rollback(session, previous_transaction) -> None:
+    session.info.pop("transaction", None)
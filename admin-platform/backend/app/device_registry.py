@@ -0,0 +1,364 @@
+"""In-memory device state registry.
+
+The registry is the authoritative view of live device state (status,
+last_seen, ip, ...). It is filled from the `devices` table at startup, updated
+by the MQTT bridge handlers and read by the device endpoints without a DB
+round trip. Changed devices are written back to the DB periodically, so the
+table acts as a persistence layer rather than the source of live state.
+Each sync also stamps the written devices into the change log (GET /sync).
+
+Heartbeats are coalesced: a message that only moves `last_seen` is held in
+memory and written at most once per `heartbeat_interval` per device, while a
+`status` change wakes the sync thread so it is persisted right away.
+
+The registry also feeds the offline deadline heap: every update that leaves a
+device online with a fresh last_seen pushes its deadline forward.
+
+In clustered mode each replica only sees part of the MQTT traffic, so the
+registry is also reloaded from the DB every `refresh_interval` seconds to pick
+up changes written by the other replicas.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import select, insert, update
+
+from .change_log import record_many
+from .collection_versions import collection_versions
+from .db import SessionLocal
+from .models import Device
+from .offline_tracker import OfflineTracker
+from .settings import OFFLINE_TIMEOUT, OFFLINE_TIMEOUT_IOCAST, OFFLINE_TIMEOUT_FULLY, OFFLINE_TIMEOUT_PI
+
+logger = logging.getLogger(__name__)
+
+# Columns owned by the registry and written back on sync.
+# fully_password is set through the API only and never written by the sync.
+PERSISTED_FIELDS = ("name", "status", "approved", "last_seen", "ip", "url", "mac")
+
+DEFAULTS = {
+    "name": "",
+    "status": "unknown",
+    "approved": False,
+    "last_seen": None,
+    "ip": "",
+    "url": "",
+    "mac": "",
+    "fully_password": "",
+}
+
+
+class DeviceRegistry:
+    """Process-wide registry of device state keyed by device id."""
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        # Held while writing to the DB so deletes cannot race a sync
+        self._sync_lock = threading.Lock()
+        self._devices = {}
+        # Devices with changed fields (written on the next sync)
+        self._dirty = set()
+        # Devices where only last_seen moved (written once per heartbeat_interval)
+        self._heartbeats = set()
+        # last_seen as currently stored in the DB
+        self._persisted_last_seen = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self.heartbeat_interval = 60.0
+        self.refresh_interval = 0.0
+        self.loaded = False
+        # Bumped on every visible change except heartbeat-only last_seen updates
+        # (GET /devices folds those into its ETag per heartbeat_interval instead)
+        self.version = 0
+        self.offline = OfflineTracker(OFFLINE_TIMEOUT, {
+            "iocast": OFFLINE_TIMEOUT_IOCAST,
+            "fully": OFFLINE_TIMEOUT_FULLY,
+            "pi": OFFLINE_TIMEOUT_PI,
+        })
+
+        self.syncs = 0
+        self.last_sync_rows = 0
+        self.last_sync_ms = 0.0
+        self.heartbeats_coalesced = 0
+
+    def load(self) -> None:
+        """Fill the registry from the devices table (also used to refresh it)."""
+        # Hold the sync lock so a concurrent sync cannot be overwritten by an older read
+        with self._sync_lock:
+            self._load()
+
+    def _load(self) -> None:
+        with SessionLocal() as session:
+            rows = session.execute(select(Device)).scalars().all()
+            devices = {d.id: self.row_to_state(d) for d in rows}
+        with self._lock:
+            self._persisted_last_seen = {device_id: d["last_seen"] for device_id, d in devices.items()}
+            # Keep local changes that have not been synced yet
+            for device_id in self._dirty | self._heartbeats:
+                if device_id in self._devices:
+                    devices[device_id] = self._devices[device_id]
+            self._devices = devices
+            self.version += 1
+            for device_id, d in devices.items():
+                self._track(d)
+            if not self.loaded:
+                logger.info(f"[REGISTRY] Loaded {len(devices)} devices")
+            self.loaded = True
+
+    @staticmethod
+    def row_to_state(d: Device) -> dict:
+        """Registry state of a devices table row."""
+        return {
+            "id": d.id,
+            "name": d.name or "",
+            "status": d.status or "unknown",
+            "approved": bool(d.approved),
+            "last_seen": d.last_seen,
+            "ip": d.ip or "",
+            "url": d.url or "",
+            "mac": d.mac or "",
+            "fully_password": d.fully_password or "",
+        }
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def get(self, device_id: str) -> Optional[dict]:
+        """Return a copy of the device state, or None if unknown."""
+        with self._lock:
+            state = self._devices.get(device_id)
+            return dict(state) if state else None
+
+    def all(self) -> list:
+        """Return copies of all device states."""
+        with self._lock:
+            return [dict(state) for state in self._devices.values()]
+
+    def ids(self) -> list:
+        with self._lock:
+            return list(self._devices.keys())
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def update(self, device_id: str, **changes) -> tuple:
+        """
+        Apply changes to a device, creating it if needed.
+
+        Returns (previous, current) copies; previous is None for new devices.
+        """
+        with self._lock:
+            state = self._devices.get(device_id)
+            previous = dict(state) if state else None
+            if state is None:
+                state = {"id": device_id, **DEFAULTS}
+                self._devices[device_id] = state
+                changed = set(PERSISTED_FIELDS)
+            else:
+                changed = {k for k, v in changes.items() if state.get(k) != v}
+            state.update(changes)
+
+            if changed - {"last_seen"}:
+                self.version += 1
+                self._dirty.add(device_id)
+                self._heartbeats.discard(device_id)
+            elif "last_seen" in changed:
+                if device_id in self._heartbeats or device_id in self._dirty:
+                    self.heartbeats_coalesced += 1
+                else:
+                    self._heartbeats.add(device_id)
+            if previous is None or "status" in changed:
+                # Persist status transitions (and new devices) right away
+                self._wake.set()
+            if "last_seen" in changes or "status" in changed:
+                self._track(state)
+            return previous, dict(state)
+
+    def _track(self, state: dict) -> None:
+        """Refresh the device's offline deadline from its state."""
+        if state["status"] == "online" and state["last_seen"] is not None:
+            seen_at = state["last_seen"].replace(tzinfo=timezone.utc).timestamp()
+            self.offline.touch(state["id"], seen_at)
+        else:
+            self.offline.forget(state["id"])
+
+    def expire(self, device_id: str) -> Optional[float]:
+        """
+        Mark a device offline if its last_seen is older than its timeout.
+
+        Returns the timeout that was exceeded, or None when the device was
+        seen again in the meantime (or is already offline).
+        """
+        timeout = self.offline.timeout_for(device_id)
+        cutoff = datetime.utcnow() - timedelta(seconds=timeout)
+        with self._lock:
+            state = self._devices.get(device_id)
+            if not state or state["status"] != "online":
+                return None
+            if state["last_seen"] is not None and state["last_seen"] >= cutoff:
+                self._track(state)
+                return None
+        self.update(device_id, status="offline")
+        return timeout
+
+    def set_fully_password(self, device_id: str, password: str) -> None:
+        """Mirror a password change made through the API (already persisted)."""
+        with self._lock:
+            state = self._devices.get(device_id)
+            if state is not None:
+                state["fully_password"] = password or ""
+                self.version += 1
+
+    def remove(self, device_id: str) -> None:
+        """Forget a device that is being deleted from the DB."""
+        with self._sync_lock, self._lock:
+            self._devices.pop(device_id, None)
+            self.version += 1
+            self._dirty.discard(device_id)
+            self._heartbeats.discard(device_id)
+            self._persisted_last_seen.pop(device_id, None)
+            self.offline.forget(device_id)
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def sync(self, force: bool = False) -> int:
+        """
+        Write changed devices to the DB. Returns the number of rows written.
+
+        Heartbeat-only devices are included once their stored last_seen is
+        older than heartbeat_interval, or always when force is set.
+        """
+        with self._sync_lock:
+            started = time.perf_counter()
+            with self._lock:
+                dirty = self._dirty
+                self._dirty = set()
+                cutoff = datetime.utcnow() - timedelta(seconds=self.heartbeat_interval)
+                due = set()
+                for device_id in self._heartbeats:
+                    persisted = self._persisted_last_seen.get(device_id)
+                    if force or persisted is None or persisted < cutoff:
+                        due.add(device_id)
+                self._heartbeats -= due
+
+                rows = [
+                    {"id": device_id, **{f: self._devices[device_id][f] for f in PERSISTED_FIELDS}}
+                    for device_id in dirty
+                    if device_id in self._devices
+                ]
+                heartbeat_rows = [
+                    {"id": device_id, "last_seen": self._devices[device_id]["last_seen"]}
+                    for device_id in due
+                    if device_id in self._devices
+                ]
+            if not rows and not heartbeat_rows:
+                return 0
+            try:
+                with SessionLocal() as session:
+                    new_rows = []
+                    changed_rows = rows
+                    if rows:
+                        ids = [r["id"] for r in rows]
+                        existing = set(session.execute(
+                            select(Device.id).where(Device.id.in_(ids))
+                        ).scalars().all())
+                        new_rows = [r for r in rows if r["id"] not in existing]
+                        changed_rows = [r for r in rows if r["id"] in existing]
+                    if new_rows:
+                        session.execute(insert(Device), new_rows)
+                        # GET /tunnel-configs lists every device row
+                        collection_versions.touch(session, "tunnel_configs")
+                    # ORM bulk UPDATE by primary key: one executemany per column set
+                    if changed_rows:
+                        session.execute(update(Device), changed_rows)
+                    if heartbeat_rows:
+                        session.execute(update(Device), heartbeat_rows)
+                    # Heartbeat-only last_seen writes are not logged: at fleet scale they
+                    # would flood the change log and turn every /sync into a near-full refresh
+                    record_many(session, "device", [r["id"] for r in rows])
+                    session.commit()
+            except Exception:
+                # Re-mark so the next sync retries
+                with self._lock:
+                    self._dirty.update(r["id"] for r in rows)
+                    self._heartbeats.update(r["id"] for r in heartbeat_rows)
+                raise
+
+            with self._lock:
+                for r in rows + heartbeat_rows:
+                    self._persisted_last_seen[r["id"]] = r["last_seen"]
+            count = len(rows) + len(heartbeat_rows)
+            self.syncs += 1
+            self.last_sync_rows = count
+            self.last_sync_ms = (time.perf_counter() - started) * 1000
+            return count
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "devices": len(self._devices),
+                "dirty": len(self._dirty),
+                "pending_heartbeats": len(self._heartbeats),
+                "heartbeat_interval": self.heartbeat_interval,
+                "heartbeats_coalesced": self.heartbeats_coalesced,
+                "syncs": self.syncs,
+                "last_sync_rows": self.last_sync_rows,
+                "last_sync_ms": round(self.last_sync_ms, 2),
+            }
+
+    def start(self, interval: float, heartbeat_interval: Optional[float] = None,
+              refresh_interval: float = 0) -> None:
+        """Start the periodic DB sync thread (and DB refresh when refresh_interval is set)."""
+        if heartbeat_interval is not None:
+            self.heartbeat_interval = heartbeat_interval
+        self.refresh_interval = refresh_interval
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sync_loop, args=(interval,),
+                                        name="device-registry-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the sync thread and write any remaining changes."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(10)
+        self.sync(force=True)
+
+    def _sync_loop(self, interval: float) -> None:
+        last_refresh = time.monotonic()
+        while not self._stop.is_set():
+            # Wakes early when a status change needs to be persisted
+            self._wake.wait(interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                count = self.sync()
+                if count:
+                    logger.debug(f"[REGISTRY] Synced {count} devices in {self.last_sync_ms:.1f} ms")
+            except Exception as e:
+                logger.error(f"[REGISTRY] Sync failed: {e}")
+            if self.refresh_interval and time.monotonic() - last_refresh >= self.refresh_interval:
+                last_refresh = time.monotonic()
+                try:
+                    self.load()
+                except Exception as e:
+                    logger.error(f"[REGISTRY] Refresh from DB failed: {e}")
+
+
+registry = DeviceRegistry()
@@ -0,0 +1,275 @@
+"""In-memory per-device summary read model for fleet views.
+
+Combines what dashboards used to stitch together from five endpoints: live
+device state (registry), newest telemetry metrics (ring buffer), the last
+few events, customer, screen assignment and location. The bridge handlers
+and the customer/assignment/location routers update it as they write, so
+GET /devices/summary is a single pass over memory.
+
+In external-ingest or clustered mode other processes write too; the refresh
+thread then re-reads assignments and locations and picks up new events and
+telemetry rows from the DB.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from sqlalchemy import select, func
+
+from .db import SessionLocal
+from .device_registry import registry
+from .models import Assignment, Customer, DeviceAssignment, Event, Location, Telemetry
+from .offline_tracker import device_type
+from .settings import DEVICE_SUMMARY_EVENTS
+from .telemetry_buffer import telemetry_buffer
+from .telemetry_metrics import TELEMETRY_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+LOCATION_FIELDS = ("label", "address", "zip_code", "lat", "lon")
+
+# Only look this far back for events/telemetry when loading from the DB
+LOAD_WINDOW_MS = 7 * 86_400_000
+
+
+class DeviceSummary:
+    """Per-device projection kept current by the write paths."""
+
+    def __init__(self, events_per_device: int) -> None:
+        self.events_per_device = events_per_device
+        self._lock = threading.Lock()
+        self._customers = {}  # customer_id -> name
+        self._assignments = {}  # device_id -> {"customer_id", "screen_uuid", "display_url"}
+        self._legacy = {}  # device_id -> customer_id (Assignment table)
+        self._locations = {}  # device_id -> {label, address, zip_code, lat, lon}
+        self._events = {}  # device_id -> deque of {"ts", "type"}, newest last
+        self._telemetry = {}  # device_id -> {"ts", "metrics"} read from the DB
+        self._last_event_id = 0
+        self._last_telemetry_ts = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.loaded = False
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def load(self) -> None:
+        """Build the projection from the DB (also used by the refresh thread)."""
+        started = time.perf_counter()
+        since = int(time.time() * 1000) - LOAD_WINDOW_MS
+        with SessionLocal() as session:
+            customers = dict(session.execute(select(Customer.id, Customer.name)).all())
+            assignments = {
+                a.device_id: {"customer_id": a.customer_id, "screen_uuid": a.screen_uuid, "display_url": a.display_url}
+                for a in session.execute(select(DeviceAssignment)).scalars()
+            }
+            legacy = dict(session.execute(
+                select(Assignment.device_id, Assignment.customer_id).where(Assignment.device_id.is_not(None))
+            ).all())
+            locations = {
+                row.device_id: {f: getattr(row, f) for f in LOCATION_FIELDS}
+                for row in session.execute(select(Location).where(Location.device_id.is_not(None))).scalars()
+            }
+            if not self.loaded:
+                # Last N events per device through a window function
+                ranked = (
+                    select(Event.id, Event.device_id, Event.ts, Event.type,
+                           func.row_number().over(partition_by=Event.device_id, order_by=Event.ts.desc()).label("rn"))
+                    .where(Event.ts >= since)
+                    .subquery()
+                )
+                event_rows = session.execute(
+                    select(ranked.c.id, ranked.c.device_id, ranked.c.ts, ranked.c.type)
+                    .where(ranked.c.rn <= self.events_per_device)
+                    .order_by(ranked.c.ts)
+                ).all()
+                last_event_id = session.execute(select(func.max(Event.id))).scalar() or 0
+            else:
+                event_rows = session.execute(
+                    select(Event.id, Event.device_id, Event.ts, Event.type)
+                    .where(Event.id > self._last_event_id)
+                    .order_by(Event.id)
+                ).all()
+                last_event_id = event_rows[-1][0] if event_rows else self._last_event_id
+            latest_ids = (
+                select(func.max(Telemetry.id))
+                .where(Telemetry.ts >= max(since, self._last_telemetry_ts))
+                .group_by(Telemetry.device_id)
+            )
+            telemetry_rows = session.execute(select(Telemetry).where(Telemetry.id.in_(latest_ids))).scalars().all()
+
+        with self._lock:
+            self._customers = customers
+            self._assignments = assignments
+            self._legacy = legacy
+            self._locations = locations
+            for _, device_id, ts, event_type in event_rows:
+                self._add_event(device_id, ts, event_type)
+            self._last_event_id = last_event_id
+            for row in telemetry_rows:
+                current = self._telemetry.get(row.device_id)
+                if current is None or row.ts >= current["ts"]:
+                    metrics = {c: getattr(row, c) for c in TELEMETRY_COLUMNS if getattr(row, c) is not None}
+                    self._telemetry[row.device_id] = {"ts": row.ts, "metrics": metrics}
+                self._last_telemetry_ts = max(self._last_telemetry_ts, row.ts)
+        if not self.loaded:
+            logger.info(f"[SUMMARY] Loaded {len(assignments) + len(legacy)} assignments, {len(locations)} locations, "
+                        f"{len(event_rows)} events in {(time.perf_counter() - started) * 1000:.0f} ms")
+        self.loaded = True
+
+    # ------------------------------------------------------------------
+    # Updates from the write paths
+    # ------------------------------------------------------------------
+
+    def _add_event(self, device_id: str, ts, event_type: str) -> None:
+        events = self._events.get(device_id)
+        if events is None:
+            events = self._events[device_id] = deque(maxlen=self.events_per_device)
+        event = {"ts": ts, "type": event_type}
+        # The refresh thread may read back an event this process already recorded
+        if event not in events:
+            events.append(event)
+
+    def add_event(self, device_id: str, ts, event_type: str) -> None:
+        with self._lock:
+            self._add_event(device_id, ts, event_type)
+
+    def set_assignment(self, device_id: str, customer_id: int, screen_uuid: Optional[str] = None,
+                       display_url: Optional[str] = None) -> None:
+        with self._lock:
+            self._assignments[device_id] = {
+                "customer_id": customer_id, "screen_uuid": screen_uuid, "display_url": display_url,
+            }
+
+    def remove_assignment(self, device_id: str) -> None:
+        with self._lock:
+            self._assignments.pop(device_id, None)
+
+    def set_legacy_assignment(self, device_id: str, customer_id: Optional[int]) -> None:
+        with self._lock:
+            if customer_id is None:
+                self._legacy.pop(device_id, None)
+            else:
+                self._legacy[device_id] = customer_id
+
+    def set_location(self, device_id: str, **fields) -> None:
+        with self._lock:
+            location = self._locations.setdefault(device_id, dict.fromkeys(LOCATION_FIELDS))
+            location.update({k: v for k, v in fields.items() if k in LOCATION_FIELDS})
+
+    def set_customer(self, customer_id: int, name: str) -> None:
+        with self._lock:
+            self._customers[customer_id] = name
+
+    def remove_customer(self, customer_id: int) -> None:
+        with self._lock:
+            self._customers.pop(customer_id, None)
+            for device_id in [d for d, a in self._assignments.items() if a["customer_id"] == customer_id]:
+                del self._assignments[device_id]
+
+    def forget(self, device_id: str) -> None:
+        """Drop what DELETE /devices/{id} removes (locations and legacy assignments stay)."""
+        with self._lock:
+            for store in (self._assignments, self._events, self._telemetry):
+                store.pop(device_id, None)
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def _summary(self, d: dict) -> dict:
+        device_id = d["id"]
+        assignment = self._assignments.get(device_id)
+        customer_id = assignment["customer_id"] if assignment else self._legacy.get(device_id)
+        recent = telemetry_buffer.recent(device_id, 1)
+        telemetry = recent[0] if recent else self._telemetry.get(device_id)
+        return {
+            "id": device_id,
+            "name": d["name"],
+            "status": d["status"],
+            "approved": d["approved"],
+            "last_seen": d["last_seen"],
+            "ip": d["ip"],
+            "url": d["url"],
+            "device_type": device_type(device_id),
+            "customer": {"id": customer_id, "name": self._customers.get(customer_id)} if customer_id is not None else None,
+            "assignment": {"screen_uuid": assignment["screen_uuid"], "display_url": assignment["display_url"]}
+            if assignment else None,
+            "location": dict(self._locations[device_id]) if device_id in self._locations else None,
+            "telemetry": telemetry,
+            "events": list(reversed(self._events.get(device_id, ()))),
+        }
+
+    def customer_of(self, device_id: str) -> Optional[int]:
+        with self._lock:
+            assignment = self._assignments.get(device_id)
+            return assignment["customer_id"] if assignment else self._legacy.get(device_id)
+
+    def get(self, device_id: str) -> Optional[dict]:
+        d = registry.get(device_id)
+        if not d:
+            return None
+        with self._lock:
+            return self._summary(d)
+
+    def all(self, customer_id: Optional[int] = None, status: Optional[str] = None,
+            approved: Optional[bool] = None) -> list:
+        """Summaries of all registry devices, optionally filtered."""
+        devices = registry.all()
+        with self._lock:
+            result = []
+            for d in devices:
+                if status is not None and d["status"] != status:
+                    continue
+                if approved is not None and d["approved"] != approved:
+                    continue
+                if customer_id is not None:
+                    assignment = self._assignments.get(d["id"])
+                    owner = assignment["customer_id"] if assignment else self._legacy.get(d["id"])
+                    if owner != customer_id:
+                        continue
+                result.append(self._summary(d))
+            return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "customers": len(self._customers),
+                "assignments": len(self._assignments),
+                "legacy_assignments": len(self._legacy),
+                "locations": len(self._locations),
+                "devices_with_events": len(self._events),
+                "last_event_id": self._last_event_id,
+            }
+
+    # ------------------------------------------------------------------
+    # Refresh thread (external ingest / clustered mode)
+    # ------------------------------------------------------------------
+
+    def start(self, refresh_interval: float) -> None:
+        """Start refreshing from the DB every refresh_interval seconds (0 = never)."""
+        if not refresh_interval or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(refresh_interval,),
+                                        name="device-summary-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(10)
+
+    def _run(self, refresh_interval: float) -> None:
+        while not self._stop.wait(refresh_interval):
+            try:
+                self.load()
+            except Exception as e:
+                logger.error(f"[SUMMARY] Refresh failed: {e}")
+
+
+device_summary = DeviceSummary(DEVICE_SUMMARY_EVENTS)
@@ -0,0 +1,62 @@
+"""Standalone MQTT ingest process.
+
+Runs the MQTT bridge, the offline checker and the ingest writers outside the
+API server, so the API can run with several uvicorn workers (INGEST_MODE=external)
+without each worker starting its own MQTT subscriber:
+
+    python -m app.ingest
+"""
+
+import logging
+import signal
+import threading
+
+from .cold_storage import cold_storage
+from .db import Base, engine
+from .device_registry import registry
+from .main import run_migrations
+from .mqtt_bridge import bridge
+from .retention import retention
+from .settings import (
+    REGISTRY_SYNC_INTERVAL,
+    HEARTBEAT_WRITE_INTERVAL,
+    REGISTRY_REFRESH_INTERVAL,
+    ROLLUP_FLUSH_INTERVAL,
+    RETENTION_INTERVAL,
+)
+from .telemetry_rollup import rollups
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Starting MQTT ingest process...")
+    Base.metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        run_migrations(conn, logger)
+
+    registry.load()
+    registry.start(REGISTRY_SYNC_INTERVAL, HEARTBEAT_WRITE_INTERVAL, REGISTRY_REFRESH_INTERVAL)
+    rollups.start(ROLLUP_FLUSH_INTERVAL)
+    cold_storage.start()
+    retention.start(RETENTION_INTERVAL)
+    bridge.start()
+    logger.info("MQTT ingest running")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    stop.wait()
+
+    logger.info("Stopping MQTT ingest process...")
+    bridge.stop()
+    rollups.stop()
+    cold_storage.stop()
+    retention.stop()
+    registry.stop()
+    logger.info("MQTT ingest stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""Write-behind ingest queue for the MQTT bridge.
+
+MQTT callbacks run on paho's network thread. Instead of opening a session and
+committing once per message there, the bridge submits a unit of work to this
+queue. A dedicated writer thread applies many units inside one transaction,
+flushing every `batch_size` items or every `flush_interval_ms`, whichever
+comes first.
+
+A unit of work is a callable taking the writer's session. It may return
+another callable, which is run after the batch has been committed (used for
+side effects such as MQTT responses that must not go out before the data is
+stored).
+
+Units of work are queued in priority lanes. The writer always takes from the
+highest-priority lane first, so provisioning and status transitions are not
+stuck behind a telemetry backlog. Once the queue is past `shed_threshold`,
+telemetry is sampled (one in `shed_sample` kept) and the rest is dropped.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from .db import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, highest first
+PRIORITY_CONTROL = 0  # provisioning, status transitions
+PRIORITY_EVENTS = 1
+PRIORITY_TELEMETRY = 2
+PRIORITY_NAMES = ("control", "events", "telemetry")
+
+
+class WriteBehindQueue:
+    """Bounded priority queue feeding a single batching DB writer thread."""
+
+    def __init__(self, name: str, max_size: int, batch_size: int, flush_interval_ms: int,
+                 put_timeout: float = 5.0, shed_threshold: float = 0.0, shed_sample: int = 0) -> None:
+        self.name = name
+        self.max_size = max_size
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(1, flush_interval_ms) / 1000.0
+        self.put_timeout = put_timeout
+        # Telemetry is shed once the depth reaches shed_threshold * max_size (0 = never)
+        self.shed_at = int(shed_threshold * max_size) if shed_threshold else 0
+        self.shed_sample = max(0, shed_sample)
+        self._lanes = [deque() for _ in PRIORITY_NAMES]
+        self._size = 0
+        self._mutex = threading.Lock()
+        self._not_empty = threading.Condition(self._mutex)
+        self._not_full = threading.Condition(self._mutex)
+        self._closing = False
+        self._thread: Optional[threading.Thread] = None
+
+        # Counters (only written by the writer thread, except drops)
+        self.batches = 0
+        self.items_written = 0
+        self.items_failed = 0
+        self.dropped = 0
+        self.dropped_by_class = dict.fromkeys(PRIORITY_NAMES, 0)
+        self.shed = 0
+        self._shed_seen = 0
+        self.last_batch_size = 0
+        self.last_batch_ms = 0.0
+        self.max_batch_size_seen = 0
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name=f"ingest-{self.name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, op: Callable, priority: int = PRIORITY_EVENTS, timeout: Optional[float] = None) -> bool:
+        """
+        Queue a unit of work. Blocks while the queue is full, up to `timeout`
+        (default `put_timeout`; 0 never blocks, for callers on an event loop).
+
+        Returns False when the work was dropped (queue full, or telemetry shed).
+        """
+        with self._not_full:
+            if priority == PRIORITY_TELEMETRY and self.shed_at and self._size >= self.shed_at:
+                self._shed_seen += 1
+                if not self.shed_sample or self._shed_seen % self.shed_sample:
+                    self.shed += 1
+                    self._drop(priority)
+                    return False
+            if self._size >= self.max_size:
+                wait = self.put_timeout if timeout is None else timeout
+                if wait > 0:
+                    self._not_full.wait_for(lambda: self._size < self.max_size, wait)
+                if self._size >= self.max_size:
+                    self._drop(priority)
+                    logger.warning(f"[INGEST] Queue '{self.name}' full ({self.max_size}), dropping message")
+                    return False
+            self._lanes[priority].append(op)
+            self._size += 1
+            self._not_empty.notify()
+            return True
+
+    def _drop(self, priority: int) -> None:
+        self.dropped += 1
+        self.dropped_by_class[PRIORITY_NAMES[priority]] += 1
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """Flush everything still queued and stop the writer thread."""
+        if not self._thread or not self._thread.is_alive():
+            return
+        with self._mutex:
+            self._closing = True
+            self._not_empty.notify()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error(f"[INGEST] Writer '{self.name}' did not finish within {timeout}s")
+
+    def depth(self) -> int:
+        return self._size
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "depth": self.depth(),
+            "depth_by_class": {n: len(lane) for n, lane in zip(PRIORITY_NAMES, self._lanes)},
+            "max_size": self.max_size,
+            "batch_size": self.batch_size,
+            "flush_interval_ms": int(self.flush_interval * 1000),
+            "last_batch_size": self.last_batch_size,
+            "last_batch_ms": round(self.last_batch_ms, 2),
+            "max_batch_size_seen": self.max_batch_size_seen,
+            "batches": self.batches,
+            "items_written": self.items_written,
+            "items_failed": self.items_failed,
+            "dropped": self.dropped,
+            "dropped_by_class": dict(self.dropped_by_class),
+            "shed": self.shed,
+            "shed_at": self.shed_at,
+        }
+
+    def _pop(self) -> Optional[tuple]:
+        """Take the oldest item of the highest-priority non-empty lane (mutex held)."""
+        for priority, lane in enumerate(self._lanes):
+            if lane:
+                self._size -= 1
+                return priority, lane.popleft()
+        return None
+
+    def _collect(self) -> list:
+        """Wait for work and gather one batch; empty once stopped and drained."""
+        batch = []
+        urgent = False
+        with self._not_empty:
+            while not self._size and not self._closing:
+                self._not_empty.wait()
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                item = self._pop()
+                if item is not None:
+                    urgent = urgent or item[0] == PRIORITY_CONTROL
+                    batch.append(item[1])
+                    continue
+                remaining = deadline - time.monotonic()
+                # Control messages are written without waiting for the batch to fill
+                if remaining <= 0 or urgent or self._closing:
+                    break
+                self._not_empty.wait(remaining)
+            self._not_full.notify_all()
+        return batch
+
+    def _run(self) -> None:
+        # After stop() the loop keeps going until every lane is drained
+        while True:
+            batch = self._collect()
+            if not batch:
+                break
+            self._write_batch(batch)
+
+    def _write_batch(self, batch: list) -> None:
+        started = time.perf_counter()
+        callbacks = []
+        try:
+            # Autoflush so lookups see rows added earlier in the batch; plain
+            # inserts are flushed together at commit
+            with SessionLocal(autoflush=True) as session:
+                for op in batch:
+                    callback = op(session)
+                    if callable(callback):
+                        callbacks.append(callback)
+                session.commit()
+            self.items_written += len(batch)
+        except Exception as e:
+            logger.error(f"[INGEST] Batch of {len(batch)} failed in '{self.name}', retrying one by one: {e}")
+            callbacks = self._write_one_by_one(batch)
+
+        self.batches += 1
+        self.last_batch_size = len(batch)
+        self.max_batch_size_seen = max(self.max_batch_size_seen, len(batch))
+        self.last_batch_ms = (time.perf_counter() - started) * 1000
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"[INGEST] After-commit callback failed: {e}", exc_info=True)
+
+    def _write_one_by_one(self, batch: list) -> list:
+        """Fallback so a single bad message does not discard the whole batch."""
+        callbacks = []
+        for op in batch:
+            try:
+                with SessionLocal() as session:
+                    callback = op(session)
+                    session.commit()
+                self.items_written += 1
+                if callable(callback):
+                    callbacks.append(callback)
+            except Exception as e:
+                self.items_failed += 1
+                logger.error(f"[INGEST] Dropping message after write failure: {e}", exc_info=True)
+        return callbacks
@@ -0,0 +1,116 @@
+"""Lease-based leader election through the shared database.
+
+Replicas running in clustered mode all try to hold the same named lease. The
+holder renews it every `ttl / 3` seconds; if it stops renewing, another
+replica takes over once the lease has expired. Work that must run exactly
+once across the cluster (the offline checker) checks `is_leader` first.
+"""
+
+import logging
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import update, or_
+from sqlalchemy.exc import IntegrityError
+
+from .db import SessionLocal
+from .models import Lease
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    """A single named lease held by `holder` for `ttl` seconds at a time."""
+
+    def __init__(self, name: str, holder: str, ttl: float = 30) -> None:
+        self.name = name
+        self.holder = holder
+        self.ttl = ttl
+        self._leader_until = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def is_leader(self) -> bool:
+        # Stop acting a little before the lease runs out in the DB
+        return time.time() < self._leader_until - self.ttl / 6
+
+    def try_acquire(self) -> bool:
+        """Acquire or renew the lease. Returns True if this holder owns it."""
+        now = time.time()
+        expires_at = now + self.ttl
+        with SessionLocal() as session:
+            result = session.execute(
+                update(Lease)
+                .where(Lease.name == self.name, or_(Lease.holder == self.holder, Lease.expires_at < now))
+                .values(holder=self.holder, expires_at=expires_at)
+            )
+            if result.rowcount:
+                session.commit()
+            else:
+                if session.get(Lease, self.name) is not None:
+                    self._set_leader(False, 0.0)
+                    return False
+                session.add(Lease(name=self.name, holder=self.holder, expires_at=expires_at))
+                try:
+                    session.commit()
+                except IntegrityError:
+                    # Another replica created it first
+                    session.rollback()
+                    self._set_leader(False, 0.0)
+                    return False
+        self._set_leader(True, expires_at)
+        return True
+
+    def release(self) -> None:
+        """Give up the lease so another replica can take over immediately."""
+        self._leader_until = 0.0
+        with SessionLocal() as session:
+            session.execute(
+                update(Lease)
+                .where(Lease.name == self.name, Lease.holder == self.holder)
+                .values(expires_at=0)
+            )
+            session.commit()
+
+    def _set_leader(self, leader: bool, until: float) -> None:
+        was_leader = self.is_leader
+        self._leader_until = until if leader else 0.0
+        if leader and not was_leader:
+            logger.info(f"[LEASE] {self.holder} is now leader for '{self.name}'")
+        elif was_leader and not leader:
+            logger.warning(f"[LEASE] {self.holder} lost leadership for '{self.name}'")
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(5)
+        try:
+            self.release()
+        except Exception as e:
+            logger.warning(f"[LEASE] Release failed: {e}")
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.try_acquire()
+            except Exception as e:
+                logger.error(f"[LEASE] Renew failed for '{self.name}': {e}")
+                self._set_leader(False, 0.0)
+            self._stop.wait(self.ttl / 3)
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "holder": self.holder,
+            "is_leader": self.is_leader,
+            "ttl": self.ttl,
+        }
@@ -3,9 +3,25 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from .cold_storage import cold_storage
+from .collection_versions import collection_versions
 from .db import Base, engine
+from .device_registry import registry
+from .device_summary import device_summary
 from .mqtt_bridge import bridge
-from .routers import devices, legacy, locations, customers, assignments, tunnels, logs, customer_codes
+from .retention import retention
+from .telemetry_metrics import TELEMETRY_COLUMNS
+from .telemetry_rollup import rollups
+from .settings import (
+    REGISTRY_SYNC_INTERVAL,
+    HEARTBEAT_WRITE_INTERVAL,
+    REGISTRY_REFRESH_INTERVAL,
+    INGEST_MODE,
+    MQTT_LOOP,
+    ROLLUP_FLUSH_INTERVAL,
+    RETENTION_INTERVAL,
+)
+from .routers import devices, legacy, locations, customers, assignments, tunnels, logs, customer_codes, system, telemetry, sync
 
 app = FastAPI(title="Admin Platform API")
 
@@ -14,7 +30,9 @@ app.add_middleware(
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    # Keyset pagination cursor (routers/paging.py)
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Include all routers
@@ -26,6 +44,9 @@ app.include_router(assignments.router)
 app.include_router(tunnels.router)
 app.include_router(logs.router)
 app.include_router(customer_codes.router)
+app.include_router(system.router)
+app.include_router(telemetry.router)
+app.include_router(sync.router)
 
 
 def run_migrations(conn, logger) -> None:
@@ -70,11 +91,34 @@ def run_migrations(conn, logger) -> None:
             except Exception as e:
                 logger.warning(f"Could not add column {col_name}: {e}")
 
+    # Typed telemetry metrics (extracted from the JSON payload at ingest)
+    cursor.execute("PRAGMA table_info(telemetry)")
+    existing_columns = {row[1] for row in cursor.fetchall()}
+    for col_name in TELEMETRY_COLUMNS:
+        if col_name not in existing_columns:
+            col_type = "INTEGER" if col_name.endswith(("_kb", "_bytes")) else "REAL"
+            logger.info(f"Adding column {col_name} to telemetry table")
+            try:
+                cursor.execute(f"ALTER TABLE telemetry ADD COLUMN {col_name} {col_type}")
+            except Exception as e:
+                logger.warning(f"Could not add column {col_name}: {e}")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_telemetry_device_ts ON telemetry (device_id, ts)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_telemetry_ts ON telemetry (ts)")
+    # The covering fleet index replaces the plain (resolution, field, bucket_ts) one
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS ix_telemetry_rollups_fleet_stats ON telemetry_rollups "
+        "(resolution, field, bucket_ts, device_id, min, max, sum, count)"
+    )
+    cursor.execute("DROP INDEX IF EXISTS ix_telemetry_rollups_fleet")
+    # Day-range reads of the cold storage tiering job
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_events_device_ts ON events (device_id, ts)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS ix_events_ts ON events (ts)")
+
     conn.connection.commit()
 
 
 @app.on_event("startup")
-def startup() -> None:
+async def startup() -> None:
     """Initialize database and start MQTT bridge."""
     import logging
     logging.basicConfig(level=logging.INFO)
@@ -86,6 +130,38 @@ def startup() -> None:
     with engine.connect() as conn:
         run_migrations(conn, logger)
 
+    # Live device state is served from memory; the DB is synced periodically
+    registry.load()
+    registry.start(REGISTRY_SYNC_INTERVAL, HEARTBEAT_WRITE_INTERVAL, REGISTRY_REFRESH_INTERVAL)
+    # Fleet summary read model; re-read from the DB when other processes also write
+    device_summary.load()
+    device_summary.start(REGISTRY_REFRESH_INTERVAL)
+    collection_versions.start(REGISTRY_REFRESH_INTERVAL)
+
+    if INGEST_MODE == "external":
+        # Ingest runs in `python -m app.ingest`; this process only publishes commands
+        logger.info("Database initialized, ingest is external - starting MQTT publisher...")
+        bridge.start_publisher()
+        return
+
     logger.info("Database initialized, starting MQTT bridge...")
-    bridge.start()
+    rollups.start(ROLLUP_FLUSH_INTERVAL)
+    cold_storage.start()
+    retention.start(RETENTION_INTERVAL)
+    if MQTT_LOOP == "asyncio":
+        await bridge.start_async()
+    else:
+        bridge.start()
     logger.info("MQTT bridge started")
+
+
+@app.on_event("shutdown")
+def shutdown() -> None:
+    """Stop the MQTT bridge and flush queued ingest writes and device state."""
+    bridge.stop()
+    rollups.stop()
+    cold_storage.stop()
+    retention.stop()
+    device_summary.stop()
+    collection_versions.stop()
+    registry.stop()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, Text, Float
+from sqlalchemy import Column, String, Integer, Boolean, DateTime, Text, Float, Index, UniqueConstraint
 from sqlalchemy.sql import func
 from .db import Base
 
@@ -19,16 +19,46 @@ class Device(Base):
 
 
 class Telemetry(Base):
+    """
+    One telemetry sample. Well-known numeric fields are extracted into typed
+    columns at ingest (see telemetry_metrics); payload keeps the raw JSON
+    unless TELEMETRY_STORE_RAW is off.
+    """
     __tablename__ = "telemetry"
+    __table_args__ = (
+        Index("ix_telemetry_device_ts", "device_id", "ts"),
+        Index("ix_telemetry_ts", "ts"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     device_id = Column(String, index=True)
     ts = Column(Integer)
-    payload = Column(Text)
+    payload = Column(Text, nullable=True)
+
+    # Typed metrics (NULL when the device does not report them)
+    temp_c = Column(Float, nullable=True)
+    load = Column(Float, nullable=True)  # 1 minute load average
+    mem_pct = Column(Float, nullable=True)
+    mem_total_kb = Column(Integer, nullable=True)
+    mem_available_kb = Column(Integer, nullable=True)
+    uptime_seconds = Column(Float, nullable=True)
+    disk_total_bytes = Column(Integer, nullable=True)
+    disk_used_bytes = Column(Integer, nullable=True)
+    disk_free_bytes = Column(Integer, nullable=True)
+    battery_level = Column(Float, nullable=True)
+    wifi_signal = Column(Float, nullable=True)
+    ram_free_mb = Column(Float, nullable=True)
+    ram_total_mb = Column(Float, nullable=True)
+    storage_free_mb = Column(Float, nullable=True)
+    storage_total_mb = Column(Float, nullable=True)
 
 
 class Event(Base):
     __tablename__ = "events"
+    __table_args__ = (
+        Index("ix_events_device_ts", "device_id", "ts"),
+        Index("ix_events_ts", "ts"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     device_id = Column(String, index=True)
@@ -37,6 +67,32 @@ class Event(Base):
     payload = Column(Text)
 
 
+class TelemetryRollup(Base):
+    """
+    Min/max/sum/count/last of one numeric telemetry field per device and time bucket.
+    Resolutions are "1m", "1h" and "1d"; bucket_ts is the bucket start in ms.
+    """
+    __tablename__ = "telemetry_rollups"
+    __table_args__ = (
+        UniqueConstraint("device_id", "resolution", "field", "bucket_ts", name="uq_telemetry_rollup_bucket"),
+        # Covers fleet-wide reads (analytics) without touching the table rows
+        Index("ix_telemetry_rollups_fleet_stats", "resolution", "field", "bucket_ts",
+              "device_id", "min", "max", "sum", "count"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    device_id = Column(String, nullable=False)
+    resolution = Column(String, nullable=False)
+    field = Column(String, nullable=False)  # e.g. "temp_c", "mem_pct"
+    bucket_ts = Column(Integer, nullable=False)
+    min = Column(Float)
+    max = Column(Float)
+    sum = Column(Float)
+    count = Column(Integer, default=0)
+    last = Column(Float)
+    last_ts = Column(Integer)
+
+
 class Location(Base):
     __tablename__ = "locations"
 
@@ -175,3 +231,31 @@ class DeviceAssignment(Base):
     assigned_at = Column(DateTime(timezone=True), server_default=func.now())
     assigned_by = Column(String, nullable=True)  # Admin username who made assignment
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class Lease(Base):
+    """
+    Named leases for leader election between backend replicas.
+    The holder renews expires_at; another replica may take over once it has passed.
+    """
+    __tablename__ = "leases"
+
+    name = Column(String, primary_key=True)  # e.g. "offline-checker"
+    holder = Column(String, default="")  # MQTT client id of the current leader
+    expires_at = Column(Float, default=0)  # Unix timestamp
+
+
+class ChangeLog(Base):
+    """
+    Global, monotonically versioned log of entity writes for delta sync (GET /sync).
+    The row id is the version; old rows are pruned by the retention service.
+    """
+    __tablename__ = "change_log"
+    # AUTOINCREMENT: ids must never be reused once retention has deleted the newest rows
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True)
+    entity = Column(String)  # device, customer, location, assignment, customer_code
+    entity_id = Column(String)
+    op = Column(String)  # upsert, delete
+    ts = Column(Integer, index=True)  # ms timestamp
@@ -0,0 +1,130 @@
+"""Drive a paho MQTT client from an asyncio event loop.
+
+Instead of paho's `loop_forever` thread, the client's socket is registered
+with the event loop (add_reader/add_writer) and keepalive handling runs as a
+task, so MQTT callbacks execute on the same loop as the async API routes.
+
+Socket callbacks may fire from other threads (a publish from a threadpool
+route registers the socket for writing), so loop registrations made off the
+loop thread go through `call_soon_threadsafe`. paho's own mutexes protect its
+packet queue.
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+import paho.mqtt.client as mqtt
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncioMQTTLoop:
+    """Network loop for a paho client running on an asyncio event loop."""
+
+    MISC_INTERVAL = 1.0  # keepalive / ping check
+    RECONNECT_MIN_DELAY = 1.0
+    RECONNECT_MAX_DELAY = 30.0
+
+    def __init__(self, client: mqtt.Client, loop: asyncio.AbstractEventLoop) -> None:
+        self.client = client
+        self.loop = loop
+        self._sock = None
+        self._misc_task: Optional[asyncio.Task] = None
+        self._stopping = False
+        # Reading is paused while the ingest queues are over their high-water mark
+        self.paused = False
+        self.pauses = 0
+
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    async def connect(self, host: str, port: int, keepalive: int = 60) -> None:
+        """Connect (blocking socket connect runs in the default executor) and start the loop."""
+        self._stopping = False
+        await self.loop.run_in_executor(None, self.client.connect, host, port, keepalive)
+        if self._misc_task is None:
+            self._misc_task = self.loop.create_task(self._misc_loop())
+
+    def disconnect(self) -> None:
+        self._stopping = True
+        self.client.disconnect()
+        if self._misc_task:
+            self._misc_task.cancel()
+            self._misc_task = None
+
+    # ------------------------------------------------------------------
+    # Backpressure
+    # ------------------------------------------------------------------
+
+    def pause_reading(self) -> None:
+        """Stop reading from the broker; TCP flow control then holds messages back."""
+        if self.paused:
+            return
+        self.paused = True
+        self.pauses += 1
+        if self._sock is not None:
+            self._call(self.loop.remove_reader, self._sock)
+
+    def resume_reading(self) -> None:
+        if not self.paused:
+            return
+        self.paused = False
+        if self._sock is not None:
+            self._call(self._add_reader, self._sock)
+
+    # ------------------------------------------------------------------
+    # paho socket callbacks
+    # ------------------------------------------------------------------
+
+    def _call(self, fn, *args) -> None:
+        """Run fn on the loop: now when already on the loop thread (e.g. before a socket closes)."""
+        try:
+            on_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            fn(*args)
+        else:
+            self.loop.call_soon_threadsafe(fn, *args)
+
+    def _add_reader(self, sock) -> None:
+        if sock is self._sock and not self.paused:
+            self.loop.add_reader(sock, self.client.loop_read)
+
+    def _on_socket_open(self, client, userdata, sock) -> None:
+        self._sock = sock
+        self._call(self._add_reader, sock)
+
+    def _on_socket_close(self, client, userdata, sock) -> None:
+        if sock is self._sock:
+            self._sock = None
+        self._call(self.loop.remove_reader, sock)
+        self._call(self.loop.remove_writer, sock)
+
+    def _on_socket_register_write(self, client, userdata, sock) -> None:
+        self._call(self.loop.add_writer, sock, self.client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock) -> None:
+        self._call(self.loop.remove_writer, sock)
+
+    async def _misc_loop(self) -> None:
+        """Keepalive pings, and reconnect with backoff when the connection drops."""
+        delay = self.RECONNECT_MIN_DELAY
+        while not self._stopping:
+            await asyncio.sleep(self.MISC_INTERVAL)
+            if self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+                delay = self.RECONNECT_MIN_DELAY
+                continue
+            if self._stopping:
+                break
+            try:
+                logger.info("[MQTT] Connection lost, reconnecting...")
+                await self.loop.run_in_executor(None, self.client.reconnect)
+                delay = self.RECONNECT_MIN_DELAY
+            except Exception as e:
+                logger.warning(f"[MQTT] Reconnect failed: {e}, retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.RECONNECT_MAX_DELAY)
@@ -1,8 +1,11 @@
+import asyncio
 import json
 import logging
 import threading
 import time
-from datetime import datetime, timedelta
+import zlib
+from datetime import datetime
+from functools import partial
 from typing import Optional
 
 import paho.mqtt.client as mqtt
@@ -10,14 +13,35 @@ import paho.mqtt.client as mqtt
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-from .db import SessionLocal
-from .models import Device, Telemetry, Event, Location, DeviceLog, CustomerCode, Customer, Assignment
+from .device_registry import registry
+from .change_log import record as record_change
+from .db import after_commit, transaction_state
+from .device_summary import device_summary
+from .ingest_queue import WriteBehindQueue, PRIORITY_CONTROL, PRIORITY_EVENTS, PRIORITY_TELEMETRY
+from .leader_lease import LeaderLease
+from .mqtt_asyncio import AsyncioMQTTLoop
+from .payload_codec import decode_payload, payload_text
+from .telemetry_buffer import telemetry_buffer
+from .telemetry_deadband import deadband
+from .telemetry_metrics import extract_metrics, ROLLUP_FIELDS
+from .telemetry_rollup import rollups
+from .models import Telemetry, Event, Location, DeviceLog, CustomerCode, Customer, Assignment
 from .settings import (
     MQTT_BROKER_HOST,
     MQTT_BROKER_PORT,
     MQTT_USERNAME,
     MQTT_PASSWORD,
     MQTT_CLIENT_ID,
+    INGEST_QUEUE_SIZE,
+    INGEST_BATCH_SIZE,
+    INGEST_FLUSH_MS,
+    INGEST_WORKERS,
+    MQTT_SHARED_GROUP,
+    LEADER_LEASE_SECONDS,
+    INGEST_HIGH_WATER,
+    INGEST_SHED_THRESHOLD,
+    INGEST_SHED_SAMPLE,
+    TELEMETRY_STORE_RAW,
 )
 
 
@@ -33,17 +57,52 @@ def _add_device_log(session, device_id: str, level: str, category: str, message:
     session.add(log)
 
 
+def _ms_ts(ts, now_ms: int) -> int:
+    """Device timestamp as stored: ms since the epoch, receive time when missing or not in ms."""
+    return int(ts) if isinstance(ts, (int, float)) and ts >= 10**12 else now_ms
+
+
+def _add_event(session, device_id: str, ts: int, event_type: str, payload: Optional[str]):
+    """Add an event within an existing session (and to the device summary once committed)"""
+    session.add(Event(device_id=device_id, ts=ts, type=event_type, payload=payload))
+    after_commit(session, partial(device_summary.add_event, device_id, ts, event_type))
+
+
 class MQTTBridge:
     # Cache for avoiding duplicate warning logs (device_id -> {warning_type: timestamp})
     _warning_cache = {}
     WARNING_COOLDOWN = 300  # 5 minutes between same warnings
     TELEMETRY_LOG_INTERVAL = 3600  # Log telemetry summary every hour
-    OFFLINE_TIMEOUT = 600  # 10 minutes without data = offline (increased for stability)
+    OFFLINE_CHECK_MAX_SLEEP = 1.0  # Offline transitions fire within a second of the deadline
+
+    # (topic, qos) pairs the bridge subscribes to
+    SUBSCRIPTIONS = [
+        # Standard device topics
+        ("devices/+/status", 0),
+        ("devices/pending/+/status", 0),
+        ("devices/pending/+/telemetry", 0),
+        ("devices/+/telemetry", 0),
+        ("devices/+/events", 0),
+        ("devices/+/wifi-scan", 0),
+        ("devices/+/screenshot", 0),
+        ("devices/+/geolocation", 0),
+        # Fully Kiosk Browser topics
+        ("fully/deviceInfo/+", 0),
+        ("fully/event/+/+", 0),
+        ("fully/cmd/+/+/ack", 0),  # Command acknowledgments from relay
+        ("fully/relay/status", 0),  # Relay service status
+        # IOCast provisioning topics - use QoS 1 for reliability
+        ("provision/+/request", 1),
+    ]
 
-    def __init__(self) -> None:
+    def __init__(self, shared_group: str = MQTT_SHARED_GROUP) -> None:
         # Use unique client ID with timestamp to avoid conflicts
         import uuid
         unique_client_id = f"{MQTT_CLIENT_ID}-{uuid.uuid4().hex[:8]}"
+        self.client_id = unique_client_id
+        # Clustered mode: replicas share subscriptions and elect an offline-checker leader
+        self.shared_group = shared_group
+        self._lease = LeaderLease("offline-checker", unique_client_id, LEADER_LEASE_SECONDS) if shared_group else None
         self._client = mqtt.Client(client_id=unique_client_id, clean_session=True)
         logger.info(f"[MQTT] Using client ID: {unique_client_id}")
         if MQTT_USERNAME:
@@ -51,7 +110,23 @@ class MQTTBridge:
         self._client.on_connect = self._on_connect
         self._client.on_subscribe = self._on_subscribe
         self._client.on_message = self._on_message
+        self._client.on_publish = self._on_publish
         self._lock = threading.Lock()
+        # Set when the client runs on an asyncio event loop (start_async)
+        self._aio: Optional[AsyncioMQTTLoop] = None
+        self._offline_task: Optional[asyncio.Task] = None
+        # QoS 1 publishes awaiting PUBACK (mid -> future), asyncio mode only
+        self._pending_publishes = {}
+        # False for publish-only clients (API processes when ingest runs separately)
+        self.ingest_enabled = True
+        # All DB writes from MQTT handlers go through write-behind queues.
+        # Messages are sharded by device id so each device stays in order
+        # (within a priority class; see _priority).
+        self._writers = [
+            WriteBehindQueue(f"mqtt-{i}", INGEST_QUEUE_SIZE, INGEST_BATCH_SIZE, INGEST_FLUSH_MS,
+                             shed_threshold=INGEST_SHED_THRESHOLD, shed_sample=INGEST_SHED_SAMPLE)
+            for i in range(max(1, INGEST_WORKERS))
+        ]
 
     def _should_log_warning(self, device_id: str, warning_type: str, cooldown: int = None) -> bool:
         """Check if we should log this warning (cooldown period)"""
@@ -66,6 +141,11 @@ class MQTTBridge:
 
     def start(self) -> None:
         logger.info(f"[MQTT] Starting bridge, connecting to {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}")
+        for writer in self._writers:
+            writer.start()
+        if self._lease:
+            logger.info(f"[MQTT] Clustered mode, shared subscription group '{self.shared_group}'")
+            self._lease.start()
         self._client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, keepalive=60)
         thread = threading.Thread(target=self._client.loop_forever, daemon=True)
         thread.start()
@@ -76,322 +156,524 @@ class MQTTBridge:
         offline_thread.start()
         logger.info("[MQTT] Offline checker thread started")
 
+    async def start_async(self) -> None:
+        """
+        Run the bridge on the current asyncio event loop instead of paho's thread.
+
+        MQTT callbacks and the offline checker run as loop callbacks/tasks;
+        DB writes still go through the write-behind writer threads.
+        """
+        loop = asyncio.get_running_loop()
+        logger.info(f"[MQTT] Starting bridge on asyncio loop, connecting to {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}")
+        for writer in self._writers:
+            writer.start()
+        if self._lease:
+            logger.info(f"[MQTT] Clustered mode, shared subscription group '{self.shared_group}'")
+            self._lease.start()
+        self._aio = AsyncioMQTTLoop(self._client, loop)
+        await self._aio.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, keepalive=60)
+        self._offline_task = loop.create_task(self._offline_checker_task())
+        logger.info("[MQTT] Bridge running on asyncio loop")
+
+    def start_publisher(self) -> None:
+        """Connect without subscribing, for processes that only publish commands."""
+        self.ingest_enabled = False
+        logger.info(f"[MQTT] Starting publish-only client, connecting to {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}")
+        self._client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, keepalive=60)
+        thread = threading.Thread(target=self._client.loop_forever, daemon=True)
+        thread.start()
+
+    def stop(self) -> None:
+        """Disconnect from the broker and flush all queued writes."""
+        logger.info("[MQTT] Stopping bridge")
+        if self._offline_task:
+            self._offline_task.cancel()
+            self._offline_task = None
+        try:
+            if self._aio:
+                self._aio.disconnect()
+            else:
+                self._client.disconnect()
+        except Exception as e:
+            logger.warning(f"[MQTT] Disconnect failed: {e}")
+        for writer in self._writers:
+            writer.stop()
+        if self._lease:
+            self._lease.stop()
+        logger.info("[MQTT] Bridge stopped, ingest queues flushed")
+
+    def stats(self) -> dict:
+        """Ingest statistics (queue depth, batch sizes) for monitoring."""
+        writers = [writer.stats() for writer in self._writers]
+        return {
+            "client_id": self.client_id,
+            "loop": "asyncio" if self._aio else "thread",
+            "reading_paused": self._aio.paused if self._aio else None,
+            "read_pauses": self._aio.pauses if self._aio else None,
+            "pending_publishes": len(self._pending_publishes),
+            "ingest_enabled": self.ingest_enabled,
+            "shared_group": self.shared_group or None,
+            "leader": self._lease.stats() if self._lease else None,
+            "workers": len(writers),
+            "depth": sum(w["depth"] for w in writers),
+            "writers": writers,
+        }
+
+    def _shard(self, key: str) -> int:
+        """Ingest shard index for a routing key (stable across restarts)."""
+        if len(self._writers) == 1:
+            return 0
+        return zlib.crc32(key.encode("utf-8")) % len(self._writers)
+
+    @staticmethod
+    def _routing_key(topic: str, payload: dict) -> str:
+        """Device id used to keep a device's messages on one shard."""
+        parts = topic.split("/")
+        if parts[0] == "fully":
+            # fully/deviceInfo/{id}, fully/event/{type}/{id}, fully/cmd/{id}/{cmd}/ack
+            if len(parts) >= 3 and parts[1] == "deviceInfo":
+                return f"fully-{parts[2]}"
+            if len(parts) >= 4 and parts[1] == "event":
+                return f"fully-{parts[3]}"
+            if len(parts) >= 5 and parts[1] == "cmd":
+                return f"fully-{parts[2]}"
+            return topic
+        if parts[0] == "provision":
+            return str(payload.get("deviceId") or topic)
+        return MQTTBridge._extract_device_id(topic) or topic
+
+    @staticmethod
+    def _priority(topic: str) -> int:
+        """Ingest priority: provisioning/status first, then events, then telemetry."""
+        if topic.startswith("provision/") or topic.endswith("/status"):
+            return PRIORITY_CONTROL
+        if topic.endswith("/telemetry") or topic.startswith("fully/deviceInfo/"):
+            return PRIORITY_TELEMETRY
+        return PRIORITY_EVENTS
+
     def _offline_checker_loop(self) -> None:
-        """Periodically check for devices that haven't reported in and mark them offline."""
+        """Sleep until the next offline deadline (at most a second) and expire devices."""
         while True:
-            time.sleep(60)  # Check every minute
+            next_deadline = registry.offline.next_deadline()
+            delay = self.OFFLINE_CHECK_MAX_SLEEP
+            if next_deadline is not None:
+                delay = min(delay, max(0.0, next_deadline - time.time()))
+            time.sleep(delay)
             try:
                 self._mark_stale_devices_offline()
             except Exception as e:
                 logger.error(f"[MQTT] Offline checker error: {e}")
 
+    async def _offline_checker_task(self) -> None:
+        """asyncio variant of _offline_checker_loop; also resumes paused reading."""
+        while True:
+            next_deadline = registry.offline.next_deadline()
+            delay = self.OFFLINE_CHECK_MAX_SLEEP
+            if next_deadline is not None:
+                delay = min(delay, max(0.0, next_deadline - time.time()))
+            await asyncio.sleep(delay)
+            self._check_backpressure()
+            try:
+                self._mark_stale_devices_offline()
+            except Exception as e:
+                logger.error(f"[MQTT] Offline checker error: {e}")
+
+    def _check_backpressure(self) -> None:
+        """Pause reading above the high-water mark, resume once every queue is below half of it."""
+        if not self._aio:
+            return
+        high = INGEST_HIGH_WATER * INGEST_QUEUE_SIZE
+        depth = max(writer.depth() for writer in self._writers)
+        if not self._aio.paused and depth >= high:
+            logger.warning(f"[MQTT] Ingest backlog {depth}, pausing reads from broker")
+            self._aio.pause_reading()
+        elif self._aio.paused and depth < high / 2:
+            logger.info(f"[MQTT] Ingest backlog {depth}, resuming reads from broker")
+            self._aio.resume_reading()
+
     def _mark_stale_devices_offline(self) -> None:
-        """Mark devices as offline if not seen within OFFLINE_TIMEOUT seconds."""
-        from sqlalchemy import select
-        cutoff = datetime.utcnow() - timedelta(seconds=self.OFFLINE_TIMEOUT)
-
-        with SessionLocal() as session:
-            # Find devices that are online but haven't reported recently
-            devices = session.execute(
-                select(Device).where(
-                    Device.status == "online",
-                    Device.last_seen < cutoff
-                )
-            ).scalars().all()
-
-            for device in devices:
-                device.status = "offline"
-                session.merge(device)
-                _add_device_log(session, device.id, "warning", "status",
-                    f"Enhed markeret offline (ingen data i {self.OFFLINE_TIMEOUT // 60} min)")
-
-            if devices:
-                session.commit()
-                logger.info(f"[MQTT] Marked {len(devices)} devices as offline")
+        """Mark devices offline whose deadline (last_seen + per-type timeout) has passed."""
+        if self._lease and not self._lease.is_leader:
+            # Another replica runs the offline checker; keep our deadlines for failover
+            return
+        expired = []
+        for device_id in registry.offline.pop_expired():
+            timeout = registry.expire(device_id)
+            if timeout is not None:
+                expired.append((device_id, timeout))
+        if not expired:
+            return
+
+        by_shard = {}
+        for device_id, timeout in expired:
+            by_shard.setdefault(self._shard(device_id), []).append((device_id, timeout))
+        for shard, items in by_shard.items():
+            self._writers[shard].submit(partial(self._log_marked_offline, items))
+        logger.info(f"[MQTT] Marked {len(expired)} devices as offline")
+
+    def _log_marked_offline(self, expired: list, session) -> None:
+        for device_id, timeout in expired:
+            _add_device_log(session, device_id, "warning", "status",
+                f"Enhed markeret offline (ingen data i {int(timeout) // 60} min)")
 
     def publish(self, topic: str, payload: dict) -> None:
+        if self._aio:
+            # Safe from any thread: paho queues the packet, the loop writes it
+            self._client.publish(topic, json.dumps(payload))
+            return
         with self._lock:
             self._client.publish(topic, json.dumps(payload))
 
+    async def publish_async(self, topic: str, payload: dict, qos: int = 1, retain: bool = False,
+                            timeout: float = 10.0) -> None:
+        """
+        Publish from the event loop and wait for the broker's PUBACK (QoS 1).
+
+        With MQTT_LOOP=thread this is a plain publish() (nothing to await).
+        """
+        if not self._aio:
+            self.publish(topic, payload)
+            return
+        info = self._client.publish(topic, json.dumps(payload), qos=qos, retain=retain)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            raise ConnectionError(f"MQTT publish to {topic} failed: {mqtt.error_string(info.rc)}")
+        if qos == 0:
+            return
+        # The packet is written by a later loop iteration, so the PUBACK cannot beat us here
+        future = asyncio.get_running_loop().create_future()
+        self._pending_publishes[info.mid] = future
+        try:
+            await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending_publishes.pop(info.mid, None)
+
+    def _on_publish(self, client, userdata, mid) -> None:
+        future = self._pending_publishes.get(mid)
+        if future is not None and not future.done():
+            future.set_result(None)
+
     def _on_connect(self, client, userdata, flags, rc) -> None:
         logger.info(f"[MQTT] Connected with rc={rc}")
-        if rc != 0:
+        if rc != 0 or not self.ingest_enabled:
             return
-        # Standard device topics
-        client.subscribe("devices/+/status")
-        client.subscribe("devices/pending/+/status")
-        client.subscribe("devices/pending/+/telemetry")
-        client.subscribe("devices/+/telemetry")
-        client.subscribe("devices/+/events")
-        client.subscribe("devices/+/wifi-scan")
-        client.subscribe("devices/+/screenshot")
-        client.subscribe("devices/+/geolocation")
-        # Fully Kiosk Browser topics
-        client.subscribe("fully/deviceInfo/+")
-        client.subscribe("fully/event/+/+")
-        client.subscribe("fully/cmd/+/+/ack")  # Command acknowledgments from relay
-        client.subscribe("fully/relay/status")  # Relay service status
-        # IOCast provisioning topics - use QoS 1 for reliability
-        result, mid = client.subscribe("provision/+/request", qos=1)
-        logger.info(f"[MQTT] Subscribing to provision/+/request: result={result}, mid={mid}")
+        for topic, qos in self.subscriptions():
+            result, mid = client.subscribe(topic, qos=qos)
+            logger.info(f"[MQTT] Subscribing to {topic}: result={result}, mid={mid}")
+
+    def subscriptions(self) -> list:
+        """Topic filters to subscribe to, as shared subscriptions in clustered mode."""
+        if not self.shared_group:
+            return list(self.SUBSCRIPTIONS)
+        return [(f"$share/{self.shared_group}/{topic}", qos) for topic, qos in self.SUBSCRIPTIONS]
 
     def _on_subscribe(self, client, userdata, mid, granted_qos) -> None:
         logger.info(f"[MQTT] Subscribe confirmed: mid={mid}, granted_qos={granted_qos}")
 
     def _on_message(self, client, userdata, msg) -> None:
         topic = msg.topic
-        logger.info(f"[MQTT] Received: {topic}")
-        payload_raw = msg.payload.decode("utf-8", errors="ignore")
-        try:
-            payload = json.loads(payload_raw) if payload_raw else {}
-        except json.JSONDecodeError:
-            payload = {"raw": payload_raw}
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"[MQTT] Received: {topic}")
+        # raw is the original JSON text, stored as-is instead of re-serializing
+        payload, raw = decode_payload(msg.payload)
+        # Every handler expects an object; arrays, numbers and strings would fail in the writer
+        if not isinstance(payload, dict):
+            if self._should_log_warning(topic, "non-object-payload"):
+                logger.warning(f"[MQTT] Ignoring non-object JSON payload on {topic}")
+            return
 
         now_ms = int(time.time() * 1000)
+        key = self._routing_key(topic, payload)
+        priority = self._priority(topic)
+        op = partial(self._dispatch, topic, payload, raw, now_ms, {})
+        # On the event loop a full queue drops at once instead of stalling the loop;
+        # reads are paused (_check_backpressure) well before the queue fills up
+        queued = self._writers[self._shard(key)].submit(op, priority, timeout=0 if self._aio else None)
+        if not queued and priority == PRIORITY_TELEMETRY and registry.get(key):
+            # Telemetry shed under backlog: keep the device alive without a DB write
+            registry.update(key, last_seen=datetime.utcnow())
+        if self._aio:
+            self._check_backpressure()
+
+    def _dispatch(self, topic: str, payload: dict, raw: Optional[str], now_ms: int, before: dict, session):
+        """
+        Route a parsed message to its handler. Runs on the ingest writer thread.
 
+        `before` is kept across attempts: when a failed batch is retried one
+        by one, handlers compare against the registry state seen on the first
+        attempt (see _state_before), not the state that attempt already applied.
+        """
         # Handle Fully Kiosk Browser topics
         if topic.startswith("fully/"):
-            self._handle_fully_message(topic, payload, now_ms)
-            return
+            return self._handle_fully_message(topic, payload, raw, now_ms, before, session)
 
         # Handle IOCast provisioning requests
         if topic.startswith("provision/") and topic.endswith("/request"):
             logger.info(f"[MQTT] Processing provision request: {topic}")
-            self._handle_provision_request(topic, payload, now_ms)
-            return
+            return self._handle_provision_request(topic, payload, now_ms, before, session)
 
         device_id = self._extract_device_id(topic)
         if not device_id:
             return
 
         is_pending = topic.startswith("devices/pending/")
+        self._handle_device_message(topic, device_id, is_pending, payload, raw, now_ms, before, session)
 
-        with SessionLocal() as session:
-            if topic.endswith("/status"):
-                device = session.get(Device, device_id) or Device(id=device_id)
-                if is_pending and device.approved:
-                    return
-
-                old_status = device.status
-                new_status = payload.get("status", device.status)
-                was_new = device.id is None or device.status == "unknown"
-
-                # IOCast Android app bug: it sends status="offline" even when online
-                # Fix: if we're receiving a message from the device, it's online
-                if device_id.startswith("iocast-") and new_status == "offline":
-                    new_status = "online"
-                    logger.info(f"[MQTT] IOCast device {device_id} sent 'offline' but is active - setting online")
-
-                device.status = new_status
-                if is_pending:
-                    device.approved = False
-                else:
-                    device.approved = bool(payload.get("approved", device.approved))
-                device.ip = payload.get("ip", device.ip)
-                device.url = payload.get("url", device.url)
-                device.mac = payload.get("mac", device.mac)
-                device.last_seen = datetime.utcnow()
-                session.merge(device)
-
-                # Log status changes
-                if is_pending:
-                    _add_device_log(session, device_id, "info", "status",
-                        f"Ny enhed afventer godkendelse",
-                        {"ip": device.ip, "mac": device.mac})
-                elif was_new:
-                    _add_device_log(session, device_id, "success", "status",
-                        f"Enhed forbundet: {new_status}",
-                        {"ip": device.ip, "mac": device.mac})
-                elif old_status != new_status:
-                    level = "success" if new_status == "online" else "warning"
-                    _add_device_log(session, device_id, level, "status",
-                        f"Status ændret: {old_status} → {new_status}",
-                        {"ip": device.ip})
-
-                session.commit()
+    @staticmethod
+    def _state_before(before: dict, device_id: str) -> Optional[dict]:
+        """Registry state of a device before this message was first applied."""
+        if device_id not in before:
+            before[device_id] = registry.get(device_id)
+        return before[device_id]
+
+    def _handle_device_message(self, topic: str, device_id: str, is_pending: bool, payload: dict,
+                               raw: Optional[str], now_ms: int, before: dict, session) -> None:
+        """Handle devices/... topics within the writer's session (committed by the writer)."""
+        if topic.endswith("/status"):
+            device = self._state_before(before, device_id)
+            if is_pending and device and device.get("approved"):
                 return
 
-            if topic.endswith("/telemetry"):
-                event = Telemetry(device_id=device_id, ts=payload.get("ts", now_ms), payload=json.dumps(payload))
-                session.add(event)
-
-                # Update device status to online when receiving telemetry
-                device = session.get(Device, device_id)
-                if not device:
-                    # Create device if it doesn't exist (for IOCast Android devices)
-                    device = Device(id=device_id)
-
-                device.status = "online"
-                device.last_seen = datetime.utcnow()
-
-                # Update IP if provided in telemetry
-                # IOCast Android uses "ipAddress", Raspberry Pi uses "ip"
-                ip = payload.get("ip") or payload.get("ipAddress")
-                if ip and ip not in ("unknown", "0.0.0.0"):
-                    device.ip = ip
-
-                # IOCast Android: Extract device name from manufacturer/model if not set
-                # This ensures devices show a meaningful name instead of just device_id
-                if device_id.startswith("iocast-"):
-                    manufacturer = payload.get("manufacturer", "")
-                    model = payload.get("model", "")
-
-                    # Set name if not already set (or if it's a generic auto-generated name)
-                    # Provisioning sets name to "IOCast {8-char-suffix}" which we want to replace
-                    if not device.name or device.name == device_id or device.name.startswith("IOCast "):
-                        if manufacturer and model:
-                            # e.g., "LENOVO Lenovo TB-X606F" -> "Lenovo TB-X606F"
-                            if model.lower().startswith(manufacturer.lower()):
-                                device.name = model
-                            else:
-                                device.name = f"{manufacturer} {model}"
-                        elif model:
-                            device.name = model
-                        elif manufacturer:
-                            device.name = manufacturer
-
-                    # Update URL from telemetry if available
-                    if payload.get("currentUrl"):
-                        device.url = payload.get("currentUrl")
-
-                session.merge(device)
-
-                # Log significant telemetry events (not every update)
-                temp = payload.get("temp_c") or payload.get("temp")
-                load = payload.get("load")
-
-                # Calculate memory percentage
-                mem_total = payload.get("mem_total_kb")
-                mem_avail = payload.get("mem_available_kb")
-                mem_pct = None
-                if mem_total and mem_avail:
-                    try:
-                        mem_pct = ((mem_total - mem_avail) / mem_total) * 100
-                    except (ValueError, TypeError, ZeroDivisionError):
-                        pass
-
-                # Temperature warnings (with cooldown to avoid spam)
-                if temp is not None:
-                    try:
-                        temp_val = float(temp)
-                        if temp_val >= 80 and self._should_log_warning(device_id, "temp_critical"):
-                            _add_device_log(session, device_id, "error", "status",
-                                f"Kritisk temperatur: {temp_val:.1f}°C",
-                                {"temp_c": temp_val})
-                        elif temp_val >= 70 and self._should_log_warning(device_id, "temp_high"):
-                            _add_device_log(session, device_id, "warning", "status",
-                                f"Høj temperatur: {temp_val:.1f}°C",
-                                {"temp_c": temp_val})
-                    except (ValueError, TypeError):
-                        pass
-
-                # Memory warnings (with cooldown to avoid spam)
-                if mem_pct is not None:
-                    try:
-                        mem_val = float(mem_pct)
-                        if mem_val >= 95 and self._should_log_warning(device_id, "mem_critical"):
-                            _add_device_log(session, device_id, "error", "status",
-                                f"Kritisk hukommelse: {mem_val:.0f}%",
-                                {"mem_pct": mem_val})
-                        elif mem_val >= 90 and self._should_log_warning(device_id, "mem_high"):
-                            _add_device_log(session, device_id, "warning", "status",
-                                f"Høj hukommelsesforbrug: {mem_val:.0f}%",
-                                {"mem_pct": mem_val})
-                    except (ValueError, TypeError):
-                        pass
-
-                # Periodic telemetry summary (hourly)
-                if self._should_log_warning(device_id, "telemetry_summary", self.TELEMETRY_LOG_INTERVAL):
-                    temp_str = f"{temp:.1f}°C" if temp else "-"
-                    mem_str = f"{mem_pct:.0f}%" if mem_pct else "-"
-                    uptime_h = payload.get("uptime_seconds", 0) / 3600
-                    _add_device_log(session, device_id, "info", "status",
-                        f"Telemetri: {temp_str}, mem {mem_str}, uptime {uptime_h:.1f}t",
-                        {"temp_c": temp, "mem_pct": mem_pct, "uptime_h": uptime_h})
-
-                session.commit()
-                return
+            old_status = device["status"] if device else "unknown"
+            new_status = payload.get("status", old_status)
+            was_new = device is None or old_status == "unknown"
+
+            # IOCast Android app bug: it sends status="offline" even when online
+            # Fix: if we're receiving a message from the device, it's online
+            if device_id.startswith("iocast-") and new_status == "offline":
+                new_status = "online"
+                logger.info(f"[MQTT] IOCast device {device_id} sent 'offline' but is active - setting online")
+
+            current = device or {}
+            if is_pending:
+                approved = False
+            else:
+                approved = bool(payload.get("approved", current.get("approved", False)))
+            _, device = registry.update(
+                device_id,
+                status=new_status,
+                approved=approved,
+                ip=payload.get("ip", current.get("ip", "")),
+                url=payload.get("url", current.get("url", "")),
+                mac=payload.get("mac", current.get("mac", "")),
+                last_seen=datetime.utcnow(),
+            )
 
-            if topic.endswith("/events"):
-                event = Event(device_id=device_id, ts=payload.get("ts", now_ms), type=payload.get("type", ""), payload=json.dumps(payload))
-                session.add(event)
-                session.commit()
-                return
+            # Log status changes
+            if is_pending:
+                _add_device_log(session, device_id, "info", "status",
+                    f"Ny enhed afventer godkendelse",
+                    {"ip": device["ip"], "mac": device["mac"]})
+            elif was_new:
+                _add_device_log(session, device_id, "success", "status",
+                    f"Enhed forbundet: {new_status}",
+                    {"ip": device["ip"], "mac": device["mac"]})
+            elif old_status != new_status:
+                level = "success" if new_status == "online" else "warning"
+                _add_device_log(session, device_id, level, "status",
+                    f"Status ændret: {old_status} → {new_status}",
+                    {"ip": device["ip"]})
 
-            if topic.endswith("/wifi-scan"):
-                event = Event(device_id=device_id, ts=payload.get("ts", now_ms), type="wifi-scan", payload=json.dumps(payload))
-                session.add(event)
-                networks = payload.get("networks", [])
-                _add_device_log(session, device_id, "info", "command",
-                    f"WiFi scan udført - {len(networks)} netværk fundet",
-                    {"network_count": len(networks)})
-                session.commit()
-                return
+            return
 
-            if topic.endswith("/screenshot"):
-                event = Event(device_id=device_id, ts=payload.get("ts", now_ms), type="screenshot", payload=json.dumps(payload))
-                session.add(event)
-                _add_device_log(session, device_id, "info", "command",
-                    "Screenshot taget")
-                session.commit()
-                return
+        if topic.endswith("/telemetry"):
+            self._add_telemetry(session, device_id, payload.get("ts", now_ms), now_ms, payload, raw)
+
+            # Update device status to online when receiving telemetry
+            # (the registry creates the device if it doesn't exist, e.g. IOCast Android)
+            device = registry.get(device_id) or {}
+            changes = {"status": "online", "last_seen": datetime.utcnow()}
+
+            # Update IP if provided in telemetry
+            # IOCast Android uses "ipAddress", Raspberry Pi uses "ip"
+            ip = payload.get("ip") or payload.get("ipAddress")
+            if ip and ip not in ("unknown", "0.0.0.0"):
+                changes["ip"] = ip
+
+            # IOCast Android: Extract device name from manufacturer/model if not set
+            # This ensures devices show a meaningful name instead of just device_id
+            if device_id.startswith("iocast-"):
+                manufacturer = payload.get("manufacturer", "")
+                model = payload.get("model", "")
+
+                # Set name if not already set (or if it's a generic auto-generated name)
+                # Provisioning sets name to "IOCast {8-char-suffix}" which we want to replace
+                name = device.get("name", "")
+                if not name or name == device_id or name.startswith("IOCast "):
+                    if manufacturer and model:
+                        # e.g., "LENOVO Lenovo TB-X606F" -> "Lenovo TB-X606F"
+                        if model.lower().startswith(manufacturer.lower()):
+                            changes["name"] = model
+                        else:
+                            changes["name"] = f"{manufacturer} {model}"
+                    elif model:
+                        changes["name"] = model
+                    elif manufacturer:
+                        changes["name"] = manufacturer
+
+                # Update URL from telemetry if available
+                if payload.get("currentUrl"):
+                    changes["url"] = payload.get("currentUrl")
+
+            registry.update(device_id, **changes)
+
+            # Log significant telemetry events (not every update)
+            temp = payload.get("temp_c") or payload.get("temp")
+            load = payload.get("load")
+
+            # Calculate memory percentage
+            mem_total = payload.get("mem_total_kb")
+            mem_avail = payload.get("mem_available_kb")
+            mem_pct = None
+            if mem_total and mem_avail:
+                try:
+                    mem_pct = ((mem_total - mem_avail) / mem_total) * 100
+                except (ValueError, TypeError, ZeroDivisionError):
+                    pass
+
+            # Temperature warnings (with cooldown to avoid spam)
+            if temp is not None:
+                try:
+                    temp_val = float(temp)
+                    if temp_val >= 80 and self._should_log_warning(device_id, "temp_critical"):
+                        _add_device_log(session, device_id, "error", "status",
+                            f"Kritisk temperatur: {temp_val:.1f}°C",
+                            {"temp_c": temp_val})
+                    elif temp_val >= 70 and self._should_log_warning(device_id, "temp_high"):
+                        _add_device_log(session, device_id, "warning", "status",
+                            f"Høj temperatur: {temp_val:.1f}°C",
+                            {"temp_c": temp_val})
+                except (ValueError, TypeError):
+                    pass
+
+            # Memory warnings (with cooldown to avoid spam)
+            if mem_pct is not None:
+                try:
+                    mem_val = float(mem_pct)
+                    if mem_val >= 95 and self._should_log_warning(device_id, "mem_critical"):
+                        _add_device_log(session, device_id, "error", "status",
+                            f"Kritisk hukommelse: {mem_val:.0f}%",
+                            {"mem_pct": mem_val})
+                    elif mem_val >= 90 and self._should_log_warning(device_id, "mem_high"):
+                        _add_device_log(session, device_id, "warning", "status",
+                            f"Høj hukommelsesforbrug: {mem_val:.0f}%",
+                            {"mem_pct": mem_val})
+                except (ValueError, TypeError):
+                    pass
+
+            # Periodic telemetry summary (hourly)
+            if self._should_log_warning(device_id, "telemetry_summary", self.TELEMETRY_LOG_INTERVAL):
+                temp_str = f"{temp:.1f}°C" if temp else "-"
+                mem_str = f"{mem_pct:.0f}%" if mem_pct else "-"
+                uptime_h = payload.get("uptime_seconds", 0) / 3600
+                _add_device_log(session, device_id, "info", "status",
+                    f"Telemetri: {temp_str}, mem {mem_str}, uptime {uptime_h:.1f}t",
+                    {"temp_c": temp, "mem_pct": mem_pct, "uptime_h": uptime_h})
+
+            return
 
-            if topic.endswith("/geolocation"):
-                # Store geolocation in Location table
-                lat = payload.get("lat")
-                lon = payload.get("lon")
-                if lat is not None and lon is not None:
-                    from sqlalchemy import select
-                    existing = session.execute(
-                        select(Location).where(Location.device_id == device_id)
-                    ).scalars().first()
-                    if not existing:
-                        existing = Location(device_id=device_id)
-                    existing.lat = float(lat)
-                    existing.lon = float(lon)
-                    # Auto-fill address from geolocation data
-                    city = payload.get("city", "")
-                    region = payload.get("region", "")
-                    country = payload.get("country", "")
-                    if city or region or country:
-                        addr_parts = [p for p in [city, region, country] if p]
-                        existing.address = ", ".join(addr_parts)
-                    session.add(existing)
-                    session.commit()
+        if topic.endswith("/events"):
+            _add_event(session, device_id, _ms_ts(payload.get("ts"), now_ms), payload.get("type", ""), payload_text(payload, raw))
+            return
+
+        if topic.endswith("/wifi-scan"):
+            _add_event(session, device_id, _ms_ts(payload.get("ts"), now_ms), "wifi-scan", payload_text(payload, raw))
+            networks = payload.get("networks", [])
+            _add_device_log(session, device_id, "info", "command",
+                f"WiFi scan udført - {len(networks)} netværk fundet",
+                {"network_count": len(networks)})
+            return
+
+        if topic.endswith("/screenshot"):
+            _add_event(session, device_id, _ms_ts(payload.get("ts"), now_ms), "screenshot", payload_text(payload, raw))
+            _add_device_log(session, device_id, "info", "command",
+                "Screenshot taget")
+            return
+
+        if topic.endswith("/geolocation"):
+            # Store geolocation in Location table
+            lat = payload.get("lat")
+            lon = payload.get("lon")
+            if lat is not None and lon is not None:
+                from sqlalchemy import select
+                existing = session.execute(
+                    select(Location).where(Location.device_id == device_id)
+                ).scalars().first()
+                if not existing:
+                    existing = Location(device_id=device_id)
+                existing.lat = float(lat)
+                existing.lon = float(lon)
+                # Auto-fill address from geolocation data
+                city = payload.get("city", "")
+                region = payload.get("region", "")
+                country = payload.get("country", "")
+                if city or region or country:
+                    addr_parts = [p for p in [city, region, country] if p]
+                    existing.address = ", ".join(addr_parts)
+                session.add(existing)
+                session.flush()
+                record_change(session, "location", existing.id)
+                after_commit(session, partial(device_summary.set_location, device_id,
+                                             lat=existing.lat, lon=existing.lon, address=existing.address))
                 # Log geolocation update
                 addr = existing.address or f"{lat}, {lon}"
                 _add_device_log(session, device_id, "info", "command",
                     f"Lokation opdateret: {addr}",
                     {"lat": lat, "lon": lon, "city": city, "country": country})
 
-                # Also store as event for history
-                event = Event(device_id=device_id, ts=payload.get("ts", now_ms), type="geolocation", payload=json.dumps(payload))
-                session.add(event)
-                session.commit()
-                return
+            # Also store as event for history
+            _add_event(session, device_id, _ms_ts(payload.get("ts"), now_ms), "geolocation", payload_text(payload, raw))
+            return
+
+    @staticmethod
+    def _add_telemetry(session, device_id: str, ts, now_ms: int, payload: dict, raw: Optional[str] = None) -> None:
+        """
+        Store a telemetry sample with its typed metric columns unless the
+        deadband suppresses it. The rollups, deadband and ring buffer are fed
+        once the write commits, so a retried batch does not count it twice.
+        """
+        metrics = extract_metrics(payload)
+        sample_ts = _ms_ts(ts, now_ms)
+        pending = transaction_state(session).setdefault("deadband", {})
+        stored = deadband.should_store(device_id, sample_ts, metrics, pending)
+        after_commit(session, partial(MQTTBridge._apply_telemetry, device_id, sample_ts, metrics, payload, stored))
+        if not stored:
+            return
+        session.add(Telemetry(
+            device_id=device_id,
+            ts=sample_ts,
+            payload=payload_text(payload, raw) if TELEMETRY_STORE_RAW else None,
+            **metrics,
+        ))
 
-    def _handle_fully_message(self, topic: str, payload: dict, now_ms: int) -> None:
+    @staticmethod
+    def _apply_telemetry(device_id: str, sample_ts: int, metrics: dict, payload: dict, stored: bool) -> None:
+        rollups.add(device_id, sample_ts, {k: v for k, v in metrics.items() if k in ROLLUP_FIELDS})
+        deadband.record(device_id, sample_ts, metrics, stored)
+        telemetry_buffer.add(device_id, sample_ts, metrics, payload, stored)
+
+    def _handle_fully_message(self, topic: str, payload: dict, raw: Optional[str], now_ms: int,
+                              before: dict, session) -> None:
         """Handle Fully Kiosk Browser MQTT messages"""
         parts = topic.split("/")
 
         # fully/deviceInfo/{deviceId}
         if len(parts) >= 3 and parts[1] == "deviceInfo":
             device_id = f"fully-{parts[2]}"
-            self._process_fully_device_info(device_id, payload, now_ms)
+            self._process_fully_device_info(device_id, payload, now_ms, before, session)
             return
 
         # fully/event/{eventType}/{deviceId}
         if len(parts) >= 4 and parts[1] == "event":
             event_type = parts[2]
             device_id = f"fully-{parts[3]}"
-            self._process_fully_event(device_id, event_type, payload, now_ms)
+            self._process_fully_event(device_id, event_type, payload, raw, now_ms, session)
             return
 
         # fully/cmd/{deviceId}/{command}/ack - Command acknowledgment from relay
         if len(parts) >= 5 and parts[1] == "cmd" and parts[4] == "ack":
             device_id = f"fully-{parts[2]}"
             command = parts[3]
-            self._process_fully_command_ack(device_id, command, payload, now_ms)
+            self._process_fully_command_ack(device_id, command, payload, raw, now_ms, session)
             return
 
         # fully/relay/status - Relay service status
@@ -399,123 +681,109 @@ class MQTTBridge:
             self._process_relay_status(payload, now_ms)
             return
 
-    def _process_fully_device_info(self, device_id: str, payload: dict, now_ms: int) -> None:
+    def _process_fully_device_info(self, device_id: str, payload: dict, now_ms: int, before: dict, session) -> None:
         """Process Fully deviceInfo message - combines status + telemetry"""
-        with SessionLocal() as session:
-            # Update/create device
-            device = session.get(Device, device_id) or Device(id=device_id)
-            was_new = device.status == "unknown" or device.status is None
-
-            device.name = payload.get("deviceName", device.name)
-            device.status = "online"
-            device.approved = True  # Auto-approve Fully devices
-            device.ip = payload.get("ip4", device.ip)
-            device.mac = payload.get("Mac", device.mac)
-            device.url = payload.get("currentPageUrl", payload.get("startUrl", device.url))
-            device.last_seen = datetime.utcnow()
-            session.merge(device)
-
-            # Log new device
-            if was_new:
-                _add_device_log(session, device_id, "success", "status",
-                    f"Fully Kiosk enhed forbundet: {device.name}",
-                    {"ip": device.ip, "mac": device.mac, "model": payload.get("model")})
-
-            # Store as telemetry (map Fully fields to our format)
-            telemetry_data = {
-                "device_type": "fully",
-                "fully_device_id": payload.get("deviceId"),
-                "battery_level": payload.get("batteryLevel"),
-                "battery_charging": payload.get("isPlugged"),
-                "screen_on": payload.get("screenOn"),
-                "screen_brightness": payload.get("screenBrightness"),
-                "wifi_ssid": payload.get("SSID", "").strip('"'),
-                "wifi_signal": payload.get("wifiSignalLevel"),
-                "ram_free_mb": payload.get("ramFreeMemory", 0) // (1024 * 1024) if payload.get("ramFreeMemory") else None,
-                "ram_total_mb": payload.get("ramTotalMemory", 0) // (1024 * 1024) if payload.get("ramTotalMemory") else None,
-                "storage_free_mb": payload.get("internalStorageFreeSpace", 0) // (1024 * 1024) if payload.get("internalStorageFreeSpace") else None,
-                "storage_total_mb": payload.get("internalStorageTotalSpace", 0) // (1024 * 1024) if payload.get("internalStorageTotalSpace") else None,
-                "android_version": payload.get("androidVersion"),
-                "app_version": payload.get("version"),
-                "kiosk_mode": payload.get("kioskMode"),
-                "maintenance_mode": payload.get("maintenanceMode"),
-                "mqtt_connected": payload.get("mqttConnected"),
-                "lat": payload.get("latitude"),
-                "lon": payload.get("longitude"),
-                "ts": now_ms,
-            }
-            telemetry = Telemetry(device_id=device_id, ts=now_ms, payload=json.dumps(telemetry_data))
-            session.add(telemetry)
-
-            # Update location if available
-            lat = payload.get("latitude")
-            lon = payload.get("longitude")
-            if lat is not None and lon is not None:
-                from sqlalchemy import select
-                existing = session.execute(
-                    select(Location).where(Location.device_id == device_id)
-                ).scalars().first()
-                if not existing:
-                    existing = Location(device_id=device_id)
+        # Update/create device
+        current = self._state_before(before, device_id) or {}
+        was_new = current.get("status", "unknown") == "unknown"
+
+        _, device = registry.update(
+            device_id,
+            name=payload.get("deviceName", current.get("name", "")),
+            status="online",
+            approved=True,  # Auto-approve Fully devices
+            ip=payload.get("ip4", current.get("ip", "")),
+            mac=payload.get("Mac", current.get("mac", "")),
+            url=payload.get("currentPageUrl", payload.get("startUrl", current.get("url", ""))),
+            last_seen=datetime.utcnow(),
+        )
+
+        # Log new device
+        if was_new:
+            _add_device_log(session, device_id, "success", "status",
+                f"Fully Kiosk enhed forbundet: {device['name']}",
+                {"ip": device["ip"], "mac": device["mac"], "model": payload.get("model")})
+
+        # Store as telemetry (map Fully fields to our format)
+        telemetry_data = {
+            "device_type": "fully",
+            "fully_device_id": payload.get("deviceId"),
+            "battery_level": payload.get("batteryLevel"),
+            "battery_charging": payload.get("isPlugged"),
+            "screen_on": payload.get("screenOn"),
+            "screen_brightness": payload.get("screenBrightness"),
+            "wifi_ssid": payload.get("SSID", "").strip('"'),
+            "wifi_signal": payload.get("wifiSignalLevel"),
+            "ram_free_mb": payload.get("ramFreeMemory", 0) // (1024 * 1024) if payload.get("ramFreeMemory") else None,
+            "ram_total_mb": payload.get("ramTotalMemory", 0) // (1024 * 1024) if payload.get("ramTotalMemory") else None,
+            "storage_free_mb": payload.get("internalStorageFreeSpace", 0) // (1024 * 1024) if payload.get("internalStorageFreeSpace") else None,
+            "storage_total_mb": payload.get("internalStorageTotalSpace", 0) // (1024 * 1024) if payload.get("internalStorageTotalSpace") else None,
+            "android_version": payload.get("androidVersion"),
+            "app_version": payload.get("version"),
+            "kiosk_mode": payload.get("kioskMode"),
+            "maintenance_mode": payload.get("maintenanceMode"),
+            "mqtt_connected": payload.get("mqttConnected"),
+            "lat": payload.get("latitude"),
+            "lon": payload.get("longitude"),
+            "ts": now_ms,
+        }
+        self._add_telemetry(session, device_id, now_ms, now_ms, telemetry_data)
+
+        # Update location if available
+        lat = payload.get("latitude")
+        lon = payload.get("longitude")
+        if lat is not None and lon is not None:
+            from sqlalchemy import select
+            existing = session.execute(
+                select(Location).where(Location.device_id == device_id)
+            ).scalars().first()
+            if not existing:
+                existing = Location(device_id=device_id)
+            # deviceInfo repeats the position; only a move is a change
+            if existing.id is None or (existing.lat, existing.lon) != (float(lat), float(lon)):
                 existing.lat = float(lat)
                 existing.lon = float(lon)
                 session.add(existing)
+                session.flush()
+                record_change(session, "location", existing.id)
+                after_commit(session, partial(device_summary.set_location, device_id, lat=existing.lat, lon=existing.lon))
 
-            session.commit()
-
-    def _process_fully_event(self, device_id: str, event_type: str, payload: dict, now_ms: int) -> None:
+    def _process_fully_event(self, device_id: str, event_type: str, payload: dict, raw: Optional[str],
+                             now_ms: int, session) -> None:
         """Process Fully event message"""
-        with SessionLocal() as session:
-            # Update device last_seen
-            device = session.get(Device, device_id)
-            if device:
-                device.last_seen = datetime.utcnow()
-                session.merge(device)
-
-            # Store event
-            event = Event(
-                device_id=device_id,
-                ts=now_ms,
-                type=f"fully-{event_type}",
-                payload=json.dumps(payload)
-            )
-            session.add(event)
-
-            # Log significant events
-            if event_type in ("screenOn", "screenOff", "onScreensaverStart", "onScreensaverStop"):
-                _add_device_log(session, device_id, "info", "status",
-                    f"Fully event: {event_type}")
-            elif event_type == "unplugged":
-                _add_device_log(session, device_id, "warning", "status",
-                    "Fully: Strøm afbrudt")
-            elif event_type == "pluggedAC":
-                _add_device_log(session, device_id, "info", "status",
-                    "Fully: Strøm tilsluttet")
-
-            session.commit()
-
-    def _process_fully_command_ack(self, device_id: str, command: str, payload: dict, now_ms: int) -> None:
+        # Update device last_seen
+        if registry.get(device_id):
+            registry.update(device_id, last_seen=datetime.utcnow())
+
+        # Store event
+        _add_event(session, device_id, now_ms, f"fully-{event_type}", payload_text(payload, raw))
+
+        # Log significant events
+        if event_type in ("screenOn", "screenOff", "onScreensaverStart", "onScreensaverStop"):
+            _add_device_log(session, device_id, "info", "status",
+                f"Fully event: {event_type}")
+        elif event_type == "unplugged":
+            _add_device_log(session, device_id, "warning", "status",
+                "Fully: Strøm afbrudt")
+        elif event_type == "pluggedAC":
+            _add_device_log(session, device_id, "info", "status",
+                "Fully: Strøm tilsluttet")
+
+    def _process_fully_command_ack(self, device_id: str, command: str, payload: dict, raw: Optional[str],
+                                   now_ms: int, session) -> None:
         """Process command acknowledgment from relay service"""
         result = payload.get("result", {})
         status = result.get("status", "Unknown")
         statustext = result.get("statustext", "")
 
-        with SessionLocal() as session:
-            # Log command result
-            level = "success" if status == "OK" else "error"
-            _add_device_log(session, device_id, level, "command",
-                f"Kommando resultat: {command} - {statustext}",
-                {"command": command, "status": status})
-
-            # Store as event
-            event = Event(
-                device_id=device_id,
-                ts=now_ms,
-                type=f"fully-cmd-{command}",
-                payload=json.dumps(payload)
-            )
-            session.add(event)
-            session.commit()
+        # Log command result
+        level = "success" if status == "OK" else "error"
+        _add_device_log(session, device_id, level, "command",
+            f"Kommando resultat: {command} - {statustext}",
+            {"command": command, "status": status})
+
+        # Store as event
+        _add_event(session, device_id, now_ms, f"fully-cmd-{command}", payload_text(payload, raw))
 
     def _process_relay_status(self, payload: dict, now_ms: int) -> None:
         """Process relay service status update"""
@@ -523,10 +791,13 @@ class MQTTBridge:
         # Could store relay status if needed for monitoring
         pass
 
-    def _handle_provision_request(self, topic: str, payload: dict, now_ms: int) -> None:
+    def _handle_provision_request(self, topic: str, payload: dict, now_ms: int, before: dict, session):
         """
         Handle IOCast Android/TV device provisioning requests.
         Topic: provision/{customer_code}/request
+
+        Returns a callback that publishes the response once the writer has
+        committed the device and assignment.
         """
         from sqlalchemy import select
 
@@ -544,114 +815,114 @@ class MQTTBridge:
             logger.warning("[MQTT] Provision request missing deviceId")
             return
 
-        try:
-            with SessionLocal() as session:
-                # Lookup customer code
-                code_record = session.execute(
-                    select(CustomerCode).where(CustomerCode.code == customer_code)
-                ).scalars().first()
+        # Lookup customer code
+        code_record = session.execute(
+            select(CustomerCode).where(CustomerCode.code == customer_code)
+        ).scalars().first()
 
-                if not code_record:
-                    # Unknown customer code - ignore silently
-                    # (don't respond to avoid information disclosure)
-                    logger.warning(f"[MQTT] Unknown customer code: {customer_code}")
-                    return
-
-                # Get customer info
-                customer = session.get(Customer, code_record.customer_id)
-                customer_name = customer.name if customer else "Ukendt"
-                logger.info(f"[MQTT] Found customer: {customer_name}")
-
-                # Create or update device
-                device = session.get(Device, device_id)
-                was_new = device is None
-
-                if not device:
-                    device = Device(id=device_id)
-
-                device.name = payload.get("deviceName", f"IOCast {device_id[-8:]}")
-                device.status = "online"
-                device.ip = payload.get("ip", device.ip)
-                device.mac = payload.get("mac", device.mac)
-                device.url = code_record.start_url
-                device.last_seen = datetime.utcnow()
-
-                # Set approved based on auto_approve setting
-                if code_record.auto_approve:
-                    device.approved = True
-                # If not auto_approve, keep existing approval status (or False for new)
-
-                session.merge(device)
-
-                # Create/update assignment to link device to customer
-                existing_assignment = session.execute(
-                    select(Assignment).where(Assignment.device_id == device_id)
-                ).scalars().first()
+        if not code_record:
+            # Unknown customer code - ignore silently
+            # (don't respond to avoid information disclosure)
+            logger.warning(f"[MQTT] Unknown customer code: {customer_code}")
+            return
 
-                if not existing_assignment:
-                    assignment = Assignment(
-                        customer_id=code_record.customer_id,
-                        device_id=device_id
-                    )
-                    session.add(assignment)
-                elif existing_assignment.customer_id != code_record.customer_id:
-                    # Update if customer changed
-                    existing_assignment.customer_id = code_record.customer_id
-
-                # Log the provisioning
-                log_msg = f"IOCast provisioning: {customer_name} (kode: {customer_code})"
-                if was_new:
-                    _add_device_log(session, device_id, "success", "status",
-                        f"Ny enhed registreret via {log_msg}",
-                        {"ip": device.ip, "mac": device.mac, "model": payload.get("deviceName")})
-                else:
-                    _add_device_log(session, device_id, "info", "status",
-                        f"Enhed gen-provisioneret via {log_msg}",
-                        {"ip": device.ip})
-
-                session.commit()
-                logger.info(f"[MQTT] Device {device_id} saved to database")
-
-                # Build response
-                response_topic = f"provision/{customer_code}/response/{device_id}"
-
-                if code_record.auto_approve or device.approved:
-                    # Build broker URL for the device to connect
-                    # Use external broker IP (188.228.60.134) for devices outside Docker network
-                    broker_host = MQTT_BROKER_HOST
-                    if broker_host == "host.docker.internal" or broker_host == "127.0.0.1":
-                        # When running in Docker, use external IP for devices
-                        broker_host = "188.228.60.134"
-                    broker_url = f"tcp://{broker_host}:{MQTT_BROKER_PORT}"
-
-                    # Send approved config with MQTT credentials
-                    response = {
-                        "approved": True,
-                        "startUrl": code_record.start_url,
-                        "brokerUrl": broker_url,
-                        "username": MQTT_USERNAME,
-                        "password": MQTT_PASSWORD,
-                        "kioskMode": code_record.kiosk_mode,
-                        "keepScreenOn": code_record.keep_screen_on,
-                        "customerId": str(code_record.customer_id),
-                        "customerName": customer_name
-                    }
-                else:
-                    # Waiting for manual approval
-                    response = {
-                        "approved": False,
-                        "message": "Venter på godkendelse...",
-                        "customerName": customer_name
-                    }
-
-                # Publish response (retained so device can reconnect and get it)
-                logger.info(f"[MQTT] Publishing provision response to: {response_topic}")
-                logger.info(f"[MQTT] Response: {response}")
-                self._client.publish(response_topic, json.dumps(response), retain=True)
-                logger.info(f"[MQTT] Provision response sent successfully")
+        # Get customer info
+        customer = session.get(Customer, code_record.customer_id)
+        customer_name = customer.name if customer else "Ukendt"
+        logger.info(f"[MQTT] Found customer: {customer_name}")
+
+        # Create or update device
+        current = self._state_before(before, device_id)
+        was_new = current is None
+        current = current or {}
+
+        changes = {
+            "name": payload.get("deviceName", f"IOCast {device_id[-8:]}"),
+            "status": "online",
+            "ip": payload.get("ip", current.get("ip", "")),
+            "mac": payload.get("mac", current.get("mac", "")),
+            "url": code_record.start_url,
+            "last_seen": datetime.utcnow(),
+        }
+
+        # Set approved based on auto_approve setting
+        if code_record.auto_approve:
+            changes["approved"] = True
+        # If not auto_approve, keep existing approval status (or False for new)
+
+        _, device = registry.update(device_id, **changes)
+
+        # Create/update assignment to link device to customer
+        existing_assignment = session.execute(
+            select(Assignment).where(Assignment.device_id == device_id)
+        ).scalars().first()
+
+        if not existing_assignment:
+            assignment = Assignment(
+                customer_id=code_record.customer_id,
+                device_id=device_id
+            )
+            session.add(assignment)
+            session.flush()
+            record_change(session, "assignment", assignment.id)
+        elif existing_assignment.customer_id != code_record.customer_id:
+            # Update if customer changed
+            existing_assignment.customer_id = code_record.customer_id
+            record_change(session, "assignment", existing_assignment.id)
+        after_commit(session, partial(device_summary.set_legacy_assignment, device_id, code_record.customer_id))
+
+        # Log the provisioning
+        log_msg = f"IOCast provisioning: {customer_name} (kode: {customer_code})"
+        if was_new:
+            _add_device_log(session, device_id, "success", "status",
+                f"Ny enhed registreret via {log_msg}",
+                {"ip": device["ip"], "mac": device["mac"], "model": payload.get("deviceName")})
+        else:
+            _add_device_log(session, device_id, "info", "status",
+                f"Enhed gen-provisioneret via {log_msg}",
+                {"ip": device["ip"]})
+
+        # Build response
+        response_topic = f"provision/{customer_code}/response/{device_id}"
+
+        if code_record.auto_approve or device["approved"]:
+            # Build broker URL for the device to connect
+            # Use external broker IP (188.228.60.134) for devices outside Docker network
+            broker_host = MQTT_BROKER_HOST
+            if broker_host == "host.docker.internal" or broker_host == "127.0.0.1":
+                # When running in Docker, use external IP for devices
+                broker_host = "188.228.60.134"
+            broker_url = f"tcp://{broker_host}:{MQTT_BROKER_PORT}"
+
+            # Send approved config with MQTT credentials
+            response = {
+                "approved": True,
+                "startUrl": code_record.start_url,
+                "brokerUrl": broker_url,
+                "username": MQTT_USERNAME,
+                "password": MQTT_PASSWORD,
+                "kioskMode": code_record.kiosk_mode,
+                "keepScreenOn": code_record.keep_screen_on,
+                "customerId": str(code_record.customer_id),
+                "customerName": customer_name
+            }
+        else:
+            # Waiting for manual approval
+            response = {
+                "approved": False,
+                "message": "Venter på godkendelse...",
+                "customerName": customer_name
+            }
 
-        except Exception as e:
-            logger.error(f"[MQTT] Provision request failed: {e}", exc_info=True)
+        def send_response() -> None:
+            logger.info(f"[MQTT] Device {device_id} provisioned")
+            # Publish response (retained so device can reconnect and get it)
+            logger.info(f"[MQTT] Publishing provision response to: {response_topic}")
+            logger.info(f"[MQTT] Response: {response}")
+            self._client.publish(response_topic, json.dumps(response), retain=True)
+            logger.info(f"[MQTT] Provision response sent successfully")
+
+        return send_response
 
     @staticmethod
     def _extract_device_id(topic: str) -> Optional[str]:
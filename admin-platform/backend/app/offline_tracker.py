@@ -0,0 +1,88 @@
+"""Per-device offline deadlines kept in a min-heap.
+
+Every message that shows a device is alive pushes its deadline forward. The
+offline checker only looks at the top of the heap, so it touches nothing but
+the devices whose deadline has actually passed, no matter how large the fleet
+is. Superseded heap entries are skipped lazily when popped.
+"""
+
+import heapq
+import threading
+import time
+from typing import Optional
+
+
+def device_type(device_id: str) -> str:
+    """Classify a device by its id prefix: iocast, fully or pi."""
+    if device_id.startswith("iocast-"):
+        return "iocast"
+    if device_id.startswith("fully-"):
+        return "fully"
+    return "pi"
+
+
+class OfflineTracker:
+    """Min-heap of (deadline, device_id) with per-device-type timeouts."""
+
+    def __init__(self, default_timeout: float = 600, timeouts: Optional[dict] = None) -> None:
+        self._lock = threading.Lock()
+        self._heap = []
+        self._deadlines = {}
+        self.configure(default_timeout, timeouts)
+
+    def configure(self, default_timeout: float, timeouts: Optional[dict] = None) -> None:
+        self.default_timeout = default_timeout
+        self.timeouts = {k: v for k, v in (timeouts or {}).items() if v}
+
+    def timeout_for(self, device_id: str) -> float:
+        return self.timeouts.get(device_type(device_id), self.default_timeout)
+
+    def touch(self, device_id: str, seen_at: Optional[float] = None) -> None:
+        """Push the device's deadline to seen_at + its timeout."""
+        deadline = (seen_at if seen_at is not None else time.time()) + self.timeout_for(device_id)
+        with self._lock:
+            self._deadlines[device_id] = deadline
+            heapq.heappush(self._heap, (deadline, device_id))
+            # Compact when superseded entries dominate the heap
+            if len(self._heap) > 4 * len(self._deadlines) + 1024:
+                self._heap = [(d, i) for i, d in self._deadlines.items()]
+                heapq.heapify(self._heap)
+
+    def forget(self, device_id: str) -> None:
+        """Stop tracking a device (offline, pending or deleted)."""
+        with self._lock:
+            self._deadlines.pop(device_id, None)
+
+    def next_deadline(self) -> Optional[float]:
+        with self._lock:
+            while self._heap:
+                deadline, device_id = self._heap[0]
+                if self._deadlines.get(device_id) == deadline:
+                    return deadline
+                heapq.heappop(self._heap)
+            return None
+
+    def pop_expired(self, now: Optional[float] = None) -> list:
+        """Remove and return ids whose deadline is at or before now."""
+        now = now if now is not None else time.time()
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, device_id = heapq.heappop(self._heap)
+                if self._deadlines.get(device_id) == deadline:
+                    del self._deadlines[device_id]
+                    expired.append(device_id)
+        return expired
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def stats(self) -> dict:
+        next_deadline = self.next_deadline()
+        return {
+            "tracked": len(self._deadlines),
+            "heap_size": len(self._heap),
+            "next_deadline_in": round(next_deadline - time.time(), 1) if next_deadline else None,
+            "default_timeout": self.default_timeout,
+            "timeouts": dict(self.timeouts),
+        }
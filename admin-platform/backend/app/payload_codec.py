@@ -0,0 +1,45 @@
+"""MQTT payload decoding.
+
+orjson (when installed) parses the payload bytes directly, without first
+decoding them to a str. The stdlib json module is used otherwise. Payloads
+that are valid JSON objects are also returned as their original text, so
+handlers can store them verbatim instead of re-serializing the parsed dict.
+"""
+
+import json
+from typing import Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+def decode_payload(data: bytes) -> tuple:
+    """
+    Parse an MQTT payload. Returns (payload, raw).
+
+    raw is the original JSON text when the payload is a JSON object, else None.
+    Payloads that are not valid JSON become {"raw": <text>}.
+    """
+    if not data:
+        return {}, None
+    if orjson is not None:
+        try:
+            payload = orjson.loads(data)
+            # orjson only accepts valid UTF-8, so this decode cannot fail
+            return payload, data.decode("utf-8") if isinstance(payload, dict) else None
+        except orjson.JSONDecodeError:
+            pass  # not JSON or not valid UTF-8: use the lenient path below
+
+    text = data.decode("utf-8", errors="ignore")
+    try:
+        payload = json.loads(text)
+    except json.JSONDecodeError:
+        return {"raw": text}, None
+    return payload, text if isinstance(payload, dict) else None
+
+
+def payload_text(payload: dict, raw: Optional[str]) -> str:
+    """Text to store for a message: the original JSON when available."""
+    return raw if raw is not None else json.dumps(payload)
@@ -0,0 +1,40 @@
+"""Shared read queries for customer-facing lists.
+
+Each helper loads what a list endpoint needs for *all* of its rows in one
+statement (a grouped aggregate, a join or an IN load), so the endpoints
+issue a fixed number of queries however many customers, codes or devices
+there are (enforced by tests/test_query_counts.py).
+"""
+
+from typing import Iterable, Optional
+
+from sqlalchemy import func, select
+
+from .models import Customer, Device, DeviceAssignment
+
+
+def device_counts(session, customer_ids: Optional[Iterable[int]] = None) -> dict:
+    """{customer_id: assigned device count} (customers without devices are absent)."""
+    query = select(DeviceAssignment.customer_id, func.count(DeviceAssignment.id)).group_by(DeviceAssignment.customer_id)
+    if customer_ids is not None:
+        query = query.where(DeviceAssignment.customer_id.in_(list(customer_ids)))
+    return dict(session.execute(query).all())
+
+
+def customer_names(session, customer_ids: Iterable[int]) -> dict:
+    """{customer_id: name} for the given customers."""
+    ids = set(customer_ids)
+    if not ids:
+        return {}
+    return dict(session.execute(select(Customer.id, Customer.name).where(Customer.id.in_(ids))).all())
+
+
+def customer_assignments(session, customer_id: int) -> list:
+    """(DeviceAssignment, Device or None) pairs of a customer, by assignment id."""
+    return session.execute(
+        select(DeviceAssignment, Device)
+        .outerjoin(Device, Device.id == DeviceAssignment.device_id)
+        .where(DeviceAssignment.customer_id == customer_id)
+        .order_by(DeviceAssignment.id)
+    ).all()
+
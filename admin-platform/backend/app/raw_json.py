@@ -0,0 +1,49 @@
+"""JSON responses built from pre-encoded fragments.
+
+Telemetry and event payloads are stored as JSON text. Parsing every row
+only for FastAPI to encode it again (through jsonable_encoder) dominates
+large history responses, so those endpoints splice the stored text into the
+body as is and serialize only the small per-row envelope - with orjson when
+installed, the stdlib json module otherwise.
+"""
+
+import json
+from datetime import datetime
+from typing import Iterable, Optional
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value) -> bytes:
+    """Compact UTF-8 JSON (datetimes as ISO 8601, like FastAPI's encoder)."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=_default).encode()
+
+
+def with_payload(envelope: dict, payload: Optional[str]) -> bytes:
+    """`envelope` (non-empty) with the stored JSON text spliced in as its "payload" key."""
+    raw = payload.encode() if payload else b"{}"
+    return dumps(envelope)[:-1] + b',"payload":' + raw + b"}"
+
+
+def array_response(fragments: Iterable[bytes], response: Optional[Response] = None) -> Response:
+    """
+    JSON array of encoded fragments. Headers already set on the endpoint's
+    injected `response` (X-Next-Cursor) are carried over, since FastAPI
+    ignores them once the endpoint returns a Response of its own.
+    """
+    body = b"[" + b",".join(fragments) + b"]"
+    headers = dict(response.headers) if response is not None else None
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,242 @@
+"""Scheduled retention for telemetry, rollups, events, device logs and the change log.
+
+Policies are per table, optionally narrowed to a category (events.type,
+device_logs.category, the rollup resolution): a category policy overrides
+the table default for its rows, 0 keeps rows forever. Rows are deleted in
+small chunks sized so each DELETE holds the SQLite write lock for about
+RETENTION_CHUNK_MS, with a pause in between so ingest writers get the lock.
+Freed pages are returned to the OS with `PRAGMA incremental_vacuum`, also
+in small steps.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import select, delete, or_
+
+from .db import SessionLocal, engine
+from .models import Telemetry, TelemetryRollup, Event, DeviceLog, ChangeLog
+from .settings import (
+    TELEMETRY_RAW_RETENTION_DAYS,
+    ROLLUP_1M_RETENTION_DAYS,
+    ROLLUP_1H_RETENTION_DAYS,
+    ROLLUP_1D_RETENTION_DAYS,
+    CHANGE_LOG_RETENTION_DAYS,
+    RETENTION_POLICIES,
+    RETENTION_CHUNK_MS,
+    RETENTION_PAUSE_MS,
+)
+
+logger = logging.getLogger(__name__)
+
+DAY_MS = 86_400_000
+
+# table -> (model, timestamp column, category column, timestamp unit)
+TABLES = {
+    "telemetry": (Telemetry, Telemetry.ts, None, "ms"),
+    "telemetry_rollups": (TelemetryRollup, TelemetryRollup.bucket_ts, TelemetryRollup.resolution, "ms"),
+    "events": (Event, Event.ts, Event.type, "ms"),
+    "device_logs": (DeviceLog, DeviceLog.timestamp, DeviceLog.category, "datetime"),
+    "change_log": (ChangeLog, ChangeLog.ts, ChangeLog.entity, "ms"),
+}
+
+
+def parse_policies(spec: str) -> dict:
+    """Parse "device_logs=90,events.screenshot=7" into {(table, category): days}."""
+    policies = {}
+    for part in spec.split(","):
+        if "=" not in part:
+            continue
+        key, value = part.split("=", 1)
+        table, _, category = key.strip().partition(".")
+        if table not in TABLES:
+            logger.warning(f"[RETENTION] Unknown table '{table}' in RETENTION_POLICIES")
+            continue
+        try:
+            policies[(table, category or None)] = float(value)
+        except ValueError:
+            continue
+    return policies
+
+
+class RetentionService:
+    """Background thread applying retention policies in lock-friendly chunks."""
+
+    MIN_CHUNK = 100
+    MAX_CHUNK = 20_000
+    VACUUM_PAGES = 256  # pages freed per incremental_vacuum step
+
+    def __init__(self, policies: dict, chunk_ms: float, pause_ms: float) -> None:
+        self.policies = policies
+        self.chunk_ms = chunk_ms
+        self.pause = pause_ms / 1000
+        self._chunk = 1000
+        self._lock = threading.Lock()  # one purge at a time (thread and DELETE /logs)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        self.runs = 0
+        self.removed_total = {}
+        self.last_run = None
+
+    def days(self, table: str, category: Optional[str] = None) -> float:
+        """Retention in days for a table/category (0 = forever)."""
+        days = self.policies.get((table, category))
+        if days is None and category is not None:
+            days = self.policies.get((table, None))
+        return days or 0
+
+    def _cutoff(self, table: str, days: float):
+        if TABLES[table][3] == "datetime":
+            return datetime.utcnow() - timedelta(days=days)
+        return int(time.time() * 1000 - days * DAY_MS)
+
+    def purge(self, table: str, condition) -> tuple:
+        """Delete rows matching `condition` chunk by chunk. Returns (rows, longest chunk in ms)."""
+        model = TABLES[table][0]
+        pk = model.__table__.primary_key.columns.values()[0]
+        total, longest = 0, 0.0
+        with self._lock:
+            while not self._stop.is_set():
+                chunk = self._chunk
+                started = time.perf_counter()
+                with SessionLocal() as session:
+                    count = session.execute(
+                        delete(model).where(pk.in_(select(pk).where(condition).limit(chunk)))
+                    ).rowcount
+                    session.commit()
+                elapsed = (time.perf_counter() - started) * 1000
+                longest = max(longest, elapsed)
+                total += count
+                # Size the next chunk so the write lock is held for about chunk_ms
+                if elapsed > self.chunk_ms:
+                    self._chunk = max(self.MIN_CHUNK, chunk // 2)
+                elif elapsed < self.chunk_ms / 2 and count == chunk:
+                    self._chunk = min(self.MAX_CHUNK, chunk * 2)
+                if count < chunk:
+                    break
+                time.sleep(self.pause)
+        return total, longest
+
+    def purge_older_than(self, table: str, days: float, category: Optional[str] = None) -> int:
+        """Delete rows of a table (or one category) older than `days`. Returns the number removed."""
+        _, ts, category_column, _ = TABLES[table]
+        condition = ts < self._cutoff(table, days)
+        if category is not None:
+            condition = condition & (category_column == category)
+        return self.purge(table, condition)[0]
+
+    def run(self) -> dict:
+        """Apply all policies once, then vacuum. Returns the run report."""
+        started = time.perf_counter()
+        removed, longest = {}, 0.0
+        for table, (_, ts, category_column, _) in TABLES.items():
+            overrides = {c: d for (t, c), d in self.policies.items() if t == table and c is not None}
+            for category, days in overrides.items():
+                if days:
+                    count, ms = self.purge(table, (category_column == category) & (ts < self._cutoff(table, days)))
+                    removed[f"{table}.{category}"] = count
+                    longest = max(longest, ms)
+            days = self.policies.get((table, None))
+            if days:
+                condition = ts < self._cutoff(table, days)
+                if overrides:
+                    condition = condition & or_(category_column.is_(None), category_column.notin_(list(overrides)))
+                count, ms = self.purge(table, condition)
+                removed[table] = count
+                longest = max(longest, ms)
+        vacuumed = self.vacuum() if any(removed.values()) else 0
+
+        for key, count in removed.items():
+            self.removed_total[key] = self.removed_total.get(key, 0) + count
+        self.runs += 1
+        self.last_run = {
+            "finished_at": datetime.utcnow().isoformat() + "Z",
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            "removed": removed,
+            "longest_chunk_ms": round(longest, 2),
+            "vacuumed_pages": vacuumed,
+        }
+        if any(removed.values()):
+            logger.info(f"[RETENTION] Removed {removed} in {self.last_run['duration_ms']} ms, "
+                        f"vacuumed {vacuumed} pages")
+        return self.last_run
+
+    def vacuum(self) -> int:
+        """Release free pages in small incremental_vacuum steps (auto_vacuum=INCREMENTAL only)."""
+        if engine.dialect.name != "sqlite":
+            return 0
+        freed = 0
+        with engine.connect() as conn:
+            cursor = conn.connection.cursor()
+            if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return 0
+            free = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+            while free and not self._stop.is_set():
+                # incremental_vacuum frees one page per step; a plain execute() only
+                # steps once, executescript() runs it to completion
+                cursor.executescript(f"PRAGMA incremental_vacuum({self.VACUUM_PAGES})")
+                remaining = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+                if remaining >= free:
+                    break
+                freed += free - remaining
+                free = remaining
+                time.sleep(self.pause)
+            cursor.close()
+        return freed
+
+    def stats(self) -> dict:
+        return {
+            "policies": {f"{t}.{c}" if c else t: d for (t, c), d in self.policies.items()},
+            "chunk_ms": self.chunk_ms,
+            "chunk_rows": self._chunk,
+            "runs": self.runs,
+            "removed_total": dict(self.removed_total),
+            "last_run": self.last_run,
+        }
+
+    def start(self, interval: float) -> None:
+        """Start the retention thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        if engine.dialect.name == "sqlite":
+            with engine.connect() as conn:
+                if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != 2:
+                    # Databases created before auto_vacuum=INCREMENTAL need one full VACUUM
+                    logger.info("[RETENTION] auto_vacuum is not INCREMENTAL; run VACUUM once "
+                                "so retention can release disk space")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(10)
+
+    def _run(self, interval: float) -> None:
+        # First run shortly after startup, then every interval
+        delay = 60
+        while not self._stop.wait(delay):
+            delay = interval
+            try:
+                self.run()
+            except Exception as e:
+                logger.error(f"[RETENTION] Run failed: {e}")
+
+
+retention = RetentionService(
+    {
+        ("telemetry", None): TELEMETRY_RAW_RETENTION_DAYS,
+        ("telemetry_rollups", "1m"): ROLLUP_1M_RETENTION_DAYS,
+        ("telemetry_rollups", "1h"): ROLLUP_1H_RETENTION_DAYS,
+        ("telemetry_rollups", "1d"): ROLLUP_1D_RETENTION_DAYS,
+        ("change_log", None): CHANGE_LOG_RETENTION_DAYS,
+        **parse_policies(RETENTION_POLICIES),
+    },
+    RETENTION_CHUNK_MS,
+    RETENTION_PAUSE_MS,
+)
@@ -1,32 +1,60 @@
 """Assignment endpoints - device-to-customer mappings."""
 
-from fastapi import APIRouter, HTTPException, Request
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from sqlalchemy import select
 
+from .. import change_log
+from ..collection_versions import collection_versions
 from ..db import SessionLocal
+from ..device_summary import device_summary
 from ..models import Assignment, Customer
-from .deps import require_token
+from .deps import require_token, not_modified
+from .paging import keyset, finish_page, prefix_filter
 from .schemas import AssignmentRequest
 
 router = APIRouter(prefix="/assignments", tags=["assignments"])
 
 
+def _assignment_to_dict(r: Assignment) -> dict:
+    return {
+        "id": r.id,
+        "customer_id": r.customer_id,
+        "device_id": r.device_id,
+        "legacy_id": r.legacy_id,
+        "updated_at": r.updated_at,
+    }
+
+
 @router.get("")
-def list_assignments(request: Request):
-    """List all device-to-customer assignments."""
+def list_assignments(
+    request: Request,
+    response: Response,
+    customer_id: Optional[int] = None,
+    prefix: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+):
+    """List device-to-customer assignments by id.
+
+    Optional filters: customer_id and a device id prefix; paged with `limit`/`cursor`.
+    """
     require_token(request)
+    cached = not_modified(request, response, collection_versions.etag("assignments"))
+    if cached:
+        return cached
+    query = select(Assignment)
+    if customer_id is not None:
+        query = query.where(Assignment.customer_id == customer_id)
+    if prefix:
+        query = query.where(prefix_filter(Assignment.device_id, prefix))
+    query = keyset(query, [Assignment.id], cursor)
+    if limit:
+        query = query.limit(limit + 1)
     with SessionLocal() as session:
-        rows = session.execute(select(Assignment)).scalars().all()
-        return [
-            {
-                "id": r.id,
-                "customer_id": r.customer_id,
-                "device_id": r.device_id,
-                "legacy_id": r.legacy_id,
-                "updated_at": r.updated_at,
-            }
-            for r in rows
-        ]
+        rows = finish_page(response, session.execute(query).scalars().all(), limit, lambda r: [r.id])
+        return [_assignment_to_dict(r) for r in rows]
 
 
 @router.post("")
@@ -51,7 +79,10 @@ def upsert_assignment(body: AssignmentRequest, request: Request):
         if body.customer_id is None:
             if existing:
                 session.delete(existing)
+                change_log.record(session, "assignment", existing.id, change_log.DELETE)
                 session.commit()
+                if existing.device_id:
+                    device_summary.set_legacy_assignment(existing.device_id, None)
             return {"ok": True}
 
         customer = session.get(Customer, body.customer_id)
@@ -68,12 +99,10 @@ def upsert_assignment(body: AssignmentRequest, request: Request):
             existing.customer_id = body.customer_id
 
         session.add(existing)
+        session.flush()
+        change_log.record(session, "assignment", existing.id)
         session.commit()
         session.refresh(existing)
-        return {
-            "id": existing.id,
-            "customer_id": existing.customer_id,
-            "device_id": existing.device_id,
-            "legacy_id": existing.legacy_id,
-            "updated_at": existing.updated_at,
-        }
+        if existing.device_id:
+            device_summary.set_legacy_assignment(existing.device_id, existing.customer_id)
+        return _assignment_to_dict(existing)
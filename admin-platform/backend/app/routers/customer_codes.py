@@ -4,7 +4,7 @@ Manages 4-digit provisioning codes that IOCast Android/TV devices use
 to receive their configuration (URL, MQTT credentials, etc.)
 """
 
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, Response
 from sqlalchemy import select
 from typing import Optional
 from pydantic import BaseModel
@@ -12,9 +12,11 @@ import logging
 import random
 import string
 
+from .. import change_log, queries
+from ..collection_versions import collection_versions
 from ..db import SessionLocal
 from ..models import CustomerCode, Customer
-from .deps import require_token
+from .deps import require_token, not_modified
 
 logger = logging.getLogger(__name__)
 
@@ -74,7 +76,7 @@ def _code_to_dict(code: CustomerCode, customer_name: Optional[str] = None) -> di
 
 
 @router.get("")
-def list_customer_codes(request: Request, customer_id: Optional[int] = None):
+def list_customer_codes(request: Request, response: Response, customer_id: Optional[int] = None):
     """
     List all customer codes, optionally filtered by customer_id.
 
@@ -82,21 +84,17 @@ def list_customer_codes(request: Request, customer_id: Optional[int] = None):
         customer_id: Optional filter by customer
     """
     require_token(request)
+    cached = not_modified(request, response, collection_versions.etag("customer_codes"))
+    if cached:
+        return cached
     with SessionLocal() as session:
         query = select(CustomerCode)
         if customer_id is not None:
             query = query.where(CustomerCode.customer_id == customer_id)
 
         codes = session.execute(query).scalars().all()
-
-        result = []
-        for code in codes:
-            # Get customer name
-            customer = session.get(Customer, code.customer_id)
-            customer_name = customer.name if customer else None
-            result.append(_code_to_dict(code, customer_name))
-
-        return result
+        names = queries.customer_names(session, (code.customer_id for code in codes))
+        return [_code_to_dict(code, names.get(code.customer_id)) for code in codes]
 
 
 @router.get("/{code_id}")
@@ -185,6 +183,8 @@ def create_customer_code(body: CustomerCodeRequest, request: Request):
             keep_screen_on=body.keep_screen_on,
         )
         session.add(code_record)
+        session.flush()
+        change_log.record(session, "customer_code", code_record.id)
         session.commit()
         session.refresh(code_record)
 
@@ -220,6 +220,7 @@ def update_customer_code(code_id: int, body: CustomerCodeRequest, request: Reque
         code_record.auto_approve = body.auto_approve
         code_record.kiosk_mode = body.kiosk_mode
         code_record.keep_screen_on = body.keep_screen_on
+        change_log.record(session, "customer_code", code_id)
 
         session.commit()
         session.refresh(code_record)
@@ -244,6 +245,7 @@ def delete_customer_code(code_id: int, request: Request):
 
         code_value = code_record.code
         session.delete(code_record)
+        change_log.record(session, "customer_code", code_id, change_log.DELETE)
         session.commit()
 
         logger.info(f"Deleted customer code {code_value}")
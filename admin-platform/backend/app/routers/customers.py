@@ -1,16 +1,21 @@
 """Customer endpoints with device assignment and CMS management."""
 
-from fastapi import APIRouter, HTTPException, Request, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Query, Request, Response, BackgroundTasks
 from sqlalchemy import select, func
 from typing import Optional
 from pydantic import BaseModel
 import logging
 
+from .. import change_log, queries
+from ..collection_versions import collection_versions
 from ..db import SessionLocal
+from ..device_registry import registry
+from ..device_summary import device_summary
 from ..models import Customer, Device, DeviceAssignment, PortalUser
 from ..mqtt_bridge import bridge as mqtt_bridge
 from ..services.cms_provisioner import get_provisioner
-from .deps import require_token
+from .deps import require_token, not_modified
+from .paging import keyset, finish_page, prefix_filter
 from .schemas import CustomerRequest, DeviceAssignmentRequest, PortalUserRequest
 
 logger = logging.getLogger(__name__)
@@ -58,20 +63,35 @@ def _customer_to_dict(r: Customer, device_count: int = 0) -> dict:
 
 
 @router.get("")
-def list_customers(request: Request):
-    """List all customers with device counts."""
+def list_customers(
+    request: Request,
+    response: Response,
+    cms_status: Optional[str] = None,
+    prefix: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+):
+    """List customers with device counts, by id.
+
+    Optional filters: cms_status and a name prefix; paged with `limit`/`cursor`.
+    """
     require_token(request)
+    cached = not_modified(request, response, collection_versions.etag("customers"))
+    if cached:
+        return cached
+    query = select(Customer)
+    if cms_status is not None:
+        query = query.where(Customer.cms_status == cms_status)
+    if prefix:
+        query = query.where(prefix_filter(Customer.name, prefix))
+    query = keyset(query, [Customer.id], cursor)
+    if limit:
+        query = query.limit(limit + 1)
     with SessionLocal() as session:
-        # Get customers with device counts
-        rows = session.execute(select(Customer)).scalars().all()
-        result = []
-        for r in rows:
-            # Count assigned devices
-            device_count = session.execute(
-                select(func.count(DeviceAssignment.id)).where(DeviceAssignment.customer_id == r.id)
-            ).scalar() or 0
-            result.append(_customer_to_dict(r, device_count))
-        return result
+        rows = finish_page(response, session.execute(query).scalars().all(), limit, lambda r: [r.id])
+        # Device counts for the whole page in one grouped query
+        counts = queries.device_counts(session, [r.id for r in rows] if limit else None)
+        return [_customer_to_dict(r, counts.get(r.id, 0)) for r in rows]
 
 
 # Note: Static routes must come BEFORE parameterized routes like /{customer_id}
@@ -99,29 +119,23 @@ def list_unassigned_devices_static(request: Request):
     require_token(request)
     with SessionLocal() as session:
         # Get all assigned device IDs
-        assigned_ids = session.execute(
+        assigned_ids = set(session.execute(
             select(DeviceAssignment.device_id)
-        ).scalars().all()
-
-        # Get devices not in assigned list
-        if assigned_ids:
-            devices = session.execute(
-                select(Device).where(~Device.id.in_(assigned_ids))
-            ).scalars().all()
-        else:
-            devices = session.execute(select(Device)).scalars().all()
-
-        return [
-            {
-                "id": d.id,
-                "name": d.name,
-                "status": d.status,
-                "ip": d.ip,
-                "last_seen": d.last_seen,
-                "approved": d.approved,
-            }
-            for d in devices
-        ]
+        ).scalars().all())
+
+    # Device state comes from the in-memory registry
+    return [
+        {
+            "id": d["id"],
+            "name": d["name"],
+            "status": d["status"],
+            "ip": d["ip"],
+            "last_seen": d["last_seen"],
+            "approved": d["approved"],
+        }
+        for d in registry.all()
+        if d["id"] not in assigned_ids
+    ]
 
 
 @router.post("")
@@ -162,8 +176,11 @@ def create_customer(body: CustomerRequest, request: Request):
             cms_status="pending" if body.cms_subdomain else "none",
         )
         session.add(row)
+        session.flush()
+        change_log.record(session, "customer", row.id)
         session.commit()
         session.refresh(row)
+        device_summary.set_customer(row.id, row.name)
 
         # TODO: If auto_provision is True and cms_subdomain is set,
         # trigger CMS provisioning via cms_provisioner service
@@ -209,8 +226,10 @@ def update_customer(customer_id: int, body: CustomerRequest, request: Request):
                 setattr(row, key, value)
 
         session.add(row)
+        change_log.record(session, "customer", row.id)
         session.commit()
         session.refresh(row)
+        device_summary.set_customer(row.id, row.name)
 
         device_count = session.execute(
             select(func.count(DeviceAssignment.id)).where(DeviceAssignment.customer_id == customer_id)
@@ -244,7 +263,9 @@ def delete_customer(customer_id: int, request: Request):
             session.delete(user)
 
         session.delete(row)
+        change_log.record(session, "customer", customer_id, change_log.DELETE)
         session.commit()
+        device_summary.remove_customer(customer_id)
 
         return {"status": "deleted", "id": customer_id}
 
@@ -263,18 +284,9 @@ def list_customer_devices(customer_id: int, request: Request):
         if not customer:
             raise HTTPException(status_code=404, detail="Customer not found")
 
-        # Get assignments with device info
-        assignments = session.execute(
-            select(DeviceAssignment).where(DeviceAssignment.customer_id == customer_id)
-        ).scalars().all()
-
+        # Assignments joined with their device rows
         result = []
-        for a in assignments:
-            # Get device info
-            device = session.execute(
-                select(Device).where(Device.id == a.device_id)
-            ).scalar()
-
+        for a, device in queries.customer_assignments(session, customer_id):
             result.append({
                 "assignment_id": a.id,
                 "device_id": a.device_id,
@@ -337,8 +349,10 @@ def assign_device_to_customer(
             assigned_by="admin",  # TODO: Get from auth
         )
         session.add(assignment)
+        change_log.record(session, "customer", customer_id)
         session.commit()
         session.refresh(assignment)
+        device_summary.set_assignment(body.device_id, customer_id, assignment.screen_uuid, assignment.display_url)
 
         logger.info(f"Device {body.device_id} assigned to customer {customer_id}")
 
@@ -425,6 +439,7 @@ def update_device_assignment(
 
         session.commit()
         session.refresh(assignment)
+        device_summary.set_assignment(device_id, customer_id, assignment.screen_uuid, assignment.display_url)
 
         logger.info(f"Device {device_id} screen updated: {old_screen_uuid} -> {body.screen_uuid}")
 
@@ -486,7 +501,9 @@ def remove_device_from_customer(customer_id: int, device_id: str, request: Reque
         customer = session.get(Customer, customer_id)
 
         session.delete(assignment)
+        change_log.record(session, "customer", customer_id)
         session.commit()
+        device_summary.remove_assignment(device_id)
 
         logger.info(f"Device {device_id} removed from customer {customer_id}")
 
@@ -1,6 +1,8 @@
 """Shared dependencies for routers."""
 
-from fastapi import HTTPException, Request
+from typing import Optional
+
+from fastapi import HTTPException, Request, Response
 
 from ..settings import API_TOKEN
 
@@ -12,3 +14,17 @@ def require_token(request: Request) -> None:
     auth = request.headers.get("Authorization", "")
     if auth != f"Bearer {API_TOKEN}":
         raise HTTPException(status_code=401, detail="Unauthorized")
+
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    304 response when If-None-Match matches `etag`; otherwise set the ETag
+    header and return None. `no-cache` makes browsers revalidate every time,
+    so fetch() sends If-None-Match without any frontend changes.
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("If-None-Match", "")
+    if if_none_match.strip() == "*" or etag in (t.strip() for t in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
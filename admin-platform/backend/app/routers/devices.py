@@ -1,14 +1,29 @@
 """Device endpoints - MQTT devices, commands, telemetry, events."""
 
 import json
+import sys
+import time
+from typing import Optional
 
-from fastapi import APIRouter, HTTPException, Request
+from anyio import from_thread
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from sqlalchemy import select, desc
 
+from .. import change_log, raw_json
+from ..cold_storage import cold_storage
+from ..collection_versions import collection_versions
 from ..db import SessionLocal
-from ..models import Device, Telemetry, Event
+from ..device_registry import registry
+from ..device_summary import device_summary
+from ..models import Device, Telemetry, Event, TelemetryRollup
 from ..mqtt_bridge import bridge
-from .deps import require_token
+from ..telemetry_buffer import telemetry_buffer
+from ..telemetry_deadband import deadband
+from ..telemetry_metrics import ROLLUP_FIELDS, TELEMETRY_COLUMNS
+from ..telemetry_rollup import RESOLUTIONS, rollups, merge_stats
+from ..telemetry_series import parse_bucket, choose_bucket, build_series, format_series
+from .deps import require_token, not_modified
+from .paging import keyset, finish_page, decode_cursor, encode_cursor, NEXT_CURSOR_HEADER
 from .schemas import CommandRequest, ApproveRequest, FullyPasswordRequest
 from .logs import add_log
 
@@ -95,47 +110,172 @@ COMMAND_NAMES = {
 router = APIRouter(prefix="/devices", tags=["devices"])
 
 
+def _publish_command(topic: str, payload: dict) -> None:
+    """
+    Publish a device command from a (threadpool) endpoint through the bridge's
+    publish_async, so with MQTT_LOOP=asyncio the call returns once the broker
+    has acknowledged it and fails (ConnectionError/TimeoutError) otherwise.
+    """
+    from_thread.run(bridge.publish_async, topic, payload)
+
+
+def serialize_device(d: dict) -> dict:
+    """Convert registry device state to API response."""
+    return {
+        "id": d["id"],
+        "name": d["name"],
+        "status": d["status"],
+        "approved": d["approved"],
+        "last_seen": d["last_seen"],
+        "ip": d["ip"],
+        "url": d["url"],
+        "mac": d["mac"],
+        "has_fully_password": bool(d["fully_password"]),  # Don't expose actual password
+    }
+
+
 @router.get("")
-def list_devices(request: Request):
-    """List all MQTT devices."""
+def list_devices(
+    request: Request,
+    response: Response,
+    status: Optional[str] = None,
+    approved: Optional[bool] = None,
+    customer_id: Optional[int] = None,
+    prefix: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+):
+    """List MQTT devices (served from the in-memory registry), ordered by id.
+
+    Optional filters: status, approved, customer_id and an id prefix. With
+    `limit` the list is paged (see routers/paging.py).
+    """
     require_token(request)
+    # Heartbeats do not move the registry version, or the ETag would change on
+    # every message; last_seen in a 304 is at most one heartbeat_interval stale
+    parts = [registry.version, int(time.time() // max(registry.heartbeat_interval, 1.0))]
+    if customer_id is not None:
+        # Assignments do not move the registry version: customer device links
+        # are logged as customer changes, legacy code assignments as assignments
+        parts += [collection_versions.version("customers"), collection_versions.version("assignments")]
+    cached = not_modified(request, response, collection_versions.etag("devices", *parts))
+    if cached:
+        return cached
+    after = decode_cursor(cursor)[0] if cursor else None
+    devices = sorted(
+        (
+            d for d in registry.all()
+            if (status is None or d["status"] == status)
+            and (approved is None or d["approved"] == approved)
+            and (prefix is None or d["id"].startswith(prefix))
+            and (after is None or d["id"] > after)
+            and (customer_id is None or device_summary.customer_of(d["id"]) == customer_id)
+        ),
+        key=lambda d: d["id"],
+    )
+    devices = finish_page(response, devices, limit, lambda d: [d["id"]])
+    return [serialize_device(d) for d in devices]
+
+
+@router.get("/summary")
+def list_device_summaries(
+    request: Request,
+    customer_id: Optional[int] = None,
+    status: Optional[str] = None,
+    approved: Optional[bool] = None,
+):
+    """Fleet view: device state, latest telemetry, recent events, customer,
+    screen assignment and location per device, from the summary read model."""
+    require_token(request)
+    return device_summary.all(customer_id=customer_id, status=status, approved=approved)
+
+
+@router.get("/overview")
+def get_devices_overview(
+    request: Request,
+    status: Optional[str] = None,
+    customer_id: Optional[int] = None,
+    approved: Optional[bool] = None,
+    events: int = Query(8, ge=0, le=50),
+):
+    """All devices with their latest telemetry and last `events` events.
+
+    Replaces GET /devices followed by per-device /telemetry?limit=1 and
+    /events calls: the newest payloads come from the ring buffer, the rest
+    from two top-N-per-device queries over the (device_id, id) indexes.
+    """
+    require_token(request)
+    devices = [
+        d for d in registry.all()
+        if (status is None or d["status"] == status)
+        and (approved is None or d["approved"] == approved)
+        and (customer_id is None or device_summary.customer_of(d["id"]) == customer_id)
+    ]
+    ids = [d["id"] for d in devices]
+
+    telemetry = {}
+    for device_id in ids:
+        latest = telemetry_buffer.latest(device_id)
+        if latest:
+            telemetry[device_id] = {"id": None, "ts": latest["ts"], "payload": latest["payload"]}
+    missing = [device_id for device_id in ids if device_id not in telemetry]
+
+    recent_events = {device_id: [] for device_id in ids}
     with SessionLocal() as session:
-        rows = session.execute(select(Device)).scalars().all()
-        return [
-            {
-                "id": d.id,
-                "name": d.name,
-                "status": d.status,
-                "approved": d.approved,
-                "last_seen": d.last_seen,
-                "ip": d.ip,
-                "url": d.url,
-                "mac": d.mac,
-                "has_fully_password": bool(d.fully_password),  # Don't expose actual password
-            }
-            for d in rows
-        ]
+        if missing:
+            newest = (
+                select(Telemetry.id)
+                .where(Telemetry.device_id == Device.id)
+                .order_by(desc(Telemetry.id))
+                .limit(1)
+                .correlate(Device)
+                .scalar_subquery()
+            )
+            rows = session.execute(
+                select(Telemetry).where(Telemetry.id.in_(select(newest).where(Device.id.in_(missing))))
+            ).scalars()
+            for r in rows:
+                telemetry[r.device_id] = {
+                    "id": r.id,
+                    "ts": r.ts,
+                    "payload": json.loads(r.payload) if r.payload else _typed_payload(r),
+                }
+        if events and ids:
+            newest = (
+                select(Event.id)
+                .where(Event.device_id == Device.id)
+                .order_by(desc(Event.id))
+                .limit(events)
+                .correlate(Device)
+            )
+            rows = session.execute(
+                select(Event.id, Event.device_id, Event.ts, Event.type, Event.payload)
+                .join(Device, Event.id.in_(newest))
+                .where(Device.id.in_(ids))
+                .order_by(desc(Event.id))
+            )
+            for r in rows:
+                recent_events[r.device_id].append({
+                    "id": r.id,
+                    "ts": r.ts,
+                    "type": r.type,
+                    "payload": json.loads(r.payload) if r.payload else {},
+                })
+
+    return [
+        {**serialize_device(d), "telemetry": telemetry.get(d["id"]), "events": recent_events[d["id"]]}
+        for d in devices
+    ]
 
 
 @router.get("/{device_id}")
 def get_device(device_id: str, request: Request):
     """Get a single device by ID."""
     require_token(request)
-    with SessionLocal() as session:
-        d = session.get(Device, device_id)
-        if not d:
-            raise HTTPException(status_code=404, detail="Device not found")
-        return {
-            "id": d.id,
-            "name": d.name,
-            "status": d.status,
-            "approved": d.approved,
-            "last_seen": d.last_seen,
-            "ip": d.ip,
-            "url": d.url,
-            "mac": d.mac,
-            "has_fully_password": bool(d.fully_password),
-        }
+    d = registry.get(device_id)
+    if not d:
+        raise HTTPException(status_code=404, detail="Device not found")
+    return serialize_device(d)
 
 
 @router.delete("/{device_id}")
@@ -148,9 +288,15 @@ def delete_device(device_id: str, request: Request):
     require_token(request)
     with SessionLocal() as session:
         device = session.get(Device, device_id)
-        if not device:
+        # A device seen only moments ago may not have been synced to the DB yet
+        if not device and not registry.get(device_id):
             raise HTTPException(status_code=404, detail="Device not found")
 
+        # Drop live state first so a pending registry sync cannot re-create the row
+        registry.remove(device_id)
+        deadband.forget(device_id)
+        telemetry_buffer.forget(device_id)
+
         # Delete associated data
         from ..models import Telemetry, Event, DeviceLog, DeviceAssignment, TunnelConfig
 
@@ -159,6 +305,11 @@ def delete_device(device_id: str, request: Request):
         event_count = session.query(Event).filter(Event.device_id == device_id).count()
         log_count = session.query(DeviceLog).filter(DeviceLog.device_id == device_id).count()
 
+        # Customers whose device count drops
+        customer_ids = session.execute(
+            select(DeviceAssignment.customer_id).where(DeviceAssignment.device_id == device_id)
+        ).scalars().all()
+
         # Delete in order (foreign key safe)
         session.query(DeviceAssignment).filter(DeviceAssignment.device_id == device_id).delete()
         session.query(TunnelConfig).filter(TunnelConfig.device_id == device_id).delete()
@@ -167,8 +318,15 @@ def delete_device(device_id: str, request: Request):
         session.query(DeviceLog).filter(DeviceLog.device_id == device_id).delete()
 
         # Delete the device itself
-        session.delete(device)
+        if device:
+            session.delete(device)
+        change_log.record(session, "device", device_id, change_log.DELETE)
+        change_log.record(session, "tunnel_config", device_id, change_log.DELETE)
+        for customer_id in customer_ids:
+            change_log.record(session, "customer", customer_id)
         session.commit()
+        cold_storage.forget(device_id)
+        device_summary.forget(device_id)
 
         return {
             "ok": True,
@@ -181,6 +339,16 @@ def delete_device(device_id: str, request: Request):
         }
 
 
+@router.get("/{device_id}/summary")
+def get_device_summary(device_id: str, request: Request):
+    """Summary of a single device (same shape as GET /devices/summary)."""
+    require_token(request)
+    summary = device_summary.get(device_id)
+    if not summary:
+        raise HTTPException(status_code=404, detail="Device not found")
+    return summary
+
+
 @router.post("/{device_id}/command")
 def send_command(device_id: str, body: CommandRequest, request: Request):
     """Send a command to a device via MQTT.
@@ -199,15 +367,17 @@ def send_command(device_id: str, body: CommandRequest, request: Request):
         topic = f"fully/cmd/{fully_device_id}/{body.action}"
 
         # Include Fully password in payload for relay service
-        with SessionLocal() as session:
-            device = session.get(Device, device_id)
-            if device and device.fully_password:
-                payload["_password"] = device.fully_password
+        device = registry.get(device_id)
+        if device and device["fully_password"]:
+            payload["_password"] = device["fully_password"]
     else:
         # Standard Raspberry Pi devices
         topic = f"devices/{device_id}/cmd/{body.action}"
 
-    bridge.publish(topic, payload)
+    try:
+        _publish_command(topic, payload)
+    except (ConnectionError, TimeoutError) as e:
+        raise HTTPException(status_code=502, detail=f"MQTT publish failed: {str(e) or 'no PUBACK from broker'}")
 
     # Log the command
     cmd_name = COMMAND_NAMES.get(body.action, body.action)
@@ -234,7 +404,10 @@ def approve_device(device_id: str, body: ApproveRequest, request: Request):
     if not body.approved:
         return {"ok": True}
     topic = f"devices/pending/{device_id}/cmd/approve"
-    bridge.publish(topic, {})
+    try:
+        _publish_command(topic, {})
+    except (ConnectionError, TimeoutError) as e:
+        raise HTTPException(status_code=502, detail=f"MQTT publish failed: {str(e) or 'no PUBACK from broker'}")
 
     # Log approval
     add_log(
@@ -248,46 +421,245 @@ def approve_device(device_id: str, body: ApproveRequest, request: Request):
 
 
 @router.get("/{device_id}/telemetry")
-def get_telemetry(device_id: str, request: Request, limit: int = 50):
-    """Get telemetry history for a device."""
+def get_telemetry(
+    device_id: str,
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=0),
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    from_ts: Optional[int] = Query(None, alias="from"),
+    to_ts: Optional[int] = Query(None, alias="to"),
+):
+    """Get telemetry history for a device, newest first.
+
+    Served from the in-memory ring buffer when possible: limit=1 returns the
+    newest full payload; with `fields` (comma separated metric names) up to
+    the buffer size returns those metrics only. Deeper history comes from the DB,
+    then from cold storage segments, and can be paged with `cursor` and
+    limited to a from/to time range (ms).
+    """
     require_token(request)
-    with SessionLocal() as session:
-        rows = session.execute(
-            select(Telemetry)
-            .where(Telemetry.device_id == device_id)
-            .order_by(desc(Telemetry.id))
-            .limit(limit)
-        ).scalars().all()
+    latest = telemetry_buffer.latest(device_id)
+    paged = cursor is not None or from_ts is not None or to_ts is not None
+    if limit == 1 and latest and not fields and not paged:
+        return [{"id": None, "ts": latest["ts"], "payload": latest["payload"]}]
+    if fields and 0 < limit <= telemetry_buffer.size(device_id) and not paged:
         return [
-            {
-                "id": r.id,
-                "ts": r.ts,
-                "payload": json.loads(r.payload) if r.payload else {},
-            }
-            for r in rows
+            {"id": None, "ts": sample["ts"], "payload": sample["metrics"]}
+            for sample in telemetry_buffer.recent(device_id, limit, fields.split(","))
         ]
 
-
-@router.get("/{device_id}/events")
-def get_events(device_id: str, request: Request, limit: int = 100):
-    """Get events/logs for a device."""
+    items = _history_page(
+        Telemetry, "telemetry", device_id, limit, cursor, from_ts, to_ts, _telemetry_item,
+        lambda r: raw_json.with_payload({"id": None, "ts": r["ts"]}, r["payload"]) if r["payload"]
+        else raw_json.dumps({"id": None, "ts": r["ts"], "payload": _cold_payload(r)}),
+        columns=[Telemetry.id, Telemetry.ts, Telemetry.payload, *(getattr(Telemetry, c) for c in TELEMETRY_COLUMNS)],
+    )
+    # A sample suppressed by the deadband is newer than anything in the DB
+    if latest and not latest["stored"] and cursor is None and (to_ts is None or latest["ts"] <= to_ts) \
+            and (from_ts is None or latest["ts"] >= from_ts):
+        # Its cursor starts the next page at the newest DB row
+        sample = raw_json.dumps({"id": None, "ts": latest["ts"], "payload": latest["payload"]})
+        items.insert(0, (sample, [sys.maxsize]))
+    return _finish_history(response, items, limit)
+
+
+def _history_page(model, kind: str, device_id: str, limit: int, cursor: Optional[str],
+                  from_ts: Optional[int], to_ts: Optional[int], hot_item, cold_item,
+                  columns: list, where=(), cold_match=None) -> list:
+    """
+    Up to limit + 1 rows of a device, newest first: DB rows (only `columns`) by
+    id, then cold storage segments by ts. Returns (item, cursor values) pairs;
+    DB cursors are [id], cold ones ["cold", ts, rows at that ts already returned].
+    `columns` start with the id.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    cold_only = position is not None and position[0] == "cold"
+    items = []
+    if not cold_only:
+        query = select(*columns).where(model.device_id == device_id, *where)
+        if from_ts is not None:
+            query = query.where(model.ts >= from_ts)
+        if to_ts is not None:
+            query = query.where(model.ts <= to_ts)
+        with SessionLocal() as session:
+            # Core execution: plain row tuples, skipping the ORM result machinery
+            rows = session.connection().execute(keyset(query, [model.id], cursor, descending=True).limit(limit + 1))
+            items = [(hot_item(r), [r[0]]) for r in rows]
+    if len(items) > limit:
+        return items
+
+    cold_to, prev_ts, run = to_ts, None, 0
+    if cold_only:
+        try:
+            _, cold_to, run = position
+            prev_ts = cold_to = int(cold_to)
+            run = int(run)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    need = limit + 1 - len(items) + run
+    # A filter on cold rows cannot be pushed into the segment read, so read the whole range
+    rows = cold_storage.read(kind, device_id, from_ts, cold_to, limit=None if cold_match else need)
+    if cold_match:
+        rows = [r for r in rows if cold_match(r)][:need]
+    # Rows at the cursor's ts come first; skip those the previous page returned
+    for r in rows[run:]:
+        run = run + 1 if r["ts"] == prev_ts else 1
+        prev_ts = r["ts"]
+        items.append((cold_item(r), ["cold", r["ts"], run]))
+    return items
+
+
+def _finish_history(response: Response, items: list, limit: int) -> Response:
+    if len(items) > limit:
+        items = items[:limit]
+        if items:
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*items[-1][1])
+    return raw_json.array_response((item for item, _ in items), response)
+
+
+def _telemetry_item(row) -> bytes:
+    """Encoded telemetry row; the stored payload text goes into the response as is."""
+    # Positional access: named attribute access on result rows is ~20x slower
+    row_id, ts, payload = row[0], row[1], row[2]
+    if payload:
+        return raw_json.with_payload({"id": row_id, "ts": ts}, payload)
+    return raw_json.dumps({"id": row_id, "ts": ts, "payload": _typed_payload(row)})
+
+
+def _typed_payload(row) -> dict:
+    """Payload rebuilt from the typed columns (rows stored with TELEMETRY_STORE_RAW off)."""
+    return {c: getattr(row, c) for c in TELEMETRY_COLUMNS if getattr(row, c) is not None}
+
+
+def _cold_payload(row: dict) -> dict:
+    return {c: row[c] for c in TELEMETRY_COLUMNS if row.get(c) is not None}
+
+
+# Default history window per rollup resolution (ms)
+HISTORY_DEFAULT_RANGE = {"1m": 6 * 3_600_000, "1h": 7 * 86_400_000, "1d": 90 * 86_400_000}
+
+
+@router.get("/{device_id}/telemetry/history")
+def get_telemetry_history(
+    device_id: str,
+    request: Request,
+    resolution: str = "1h",
+    fields: str = "",
+    from_ts: Optional[int] = Query(None, alias="from"),
+    to_ts: Optional[int] = Query(None, alias="to"),
+):
+    """Get rolled-up telemetry (min/max/avg/last per minute, hour or day) for a device.
+
+    from/to are epoch milliseconds; fields is a comma separated subset of the rollup fields.
+    """
     require_token(request)
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of {', '.join(RESOLUTIONS)}")
+    field_list = [f for f in fields.split(",") if f] or list(ROLLUP_FIELDS)
+    to_ts = to_ts if to_ts is not None else int(time.time() * 1000)
+    from_ts = from_ts if from_ts is not None else to_ts - HISTORY_DEFAULT_RANGE[resolution]
+
     with SessionLocal() as session:
         rows = session.execute(
-            select(Event)
-            .where(Event.device_id == device_id)
-            .order_by(desc(Event.id))
-            .limit(limit)
-        ).scalars().all()
-        return [
-            {
-                "id": r.id,
-                "ts": r.ts,
-                "type": r.type,
-                "payload": json.loads(r.payload) if r.payload else {},
-            }
-            for r in rows
-        ]
+            select(
+                TelemetryRollup.field, TelemetryRollup.bucket_ts, TelemetryRollup.min, TelemetryRollup.max,
+                TelemetryRollup.sum, TelemetryRollup.count, TelemetryRollup.last, TelemetryRollup.last_ts,
+            )
+            .where(
+                TelemetryRollup.device_id == device_id,
+                TelemetryRollup.resolution == resolution,
+                TelemetryRollup.field.in_(field_list),
+                TelemetryRollup.bucket_ts >= from_ts,
+                TelemetryRollup.bucket_ts <= to_ts,
+            )
+        ).all()
+    stats = {(r[0], r[1]): list(r[2:]) for r in rows}
+    # Include buckets still waiting for the next rollup flush
+    for key, pending in rollups.pending(device_id, resolution, field_list, from_ts, to_ts).items():
+        stats[key] = merge_stats(stats[key], pending) if key in stats else pending
+
+    buckets = {}
+    for (field, bucket_ts), (mn, mx, total, count, last, _) in stats.items():
+        buckets.setdefault(bucket_ts, {"ts": bucket_ts})[field] = {
+            "min": mn, "max": mx, "avg": total / count if count else None, "last": last,
+        }
+    return {
+        "device_id": device_id,
+        "resolution": resolution,
+        "from": from_ts,
+        "to": to_ts,
+        "buckets": [buckets[ts] for ts in sorted(buckets)],
+    }
+
+
+@router.get("/{device_id}/telemetry/series")
+def get_telemetry_series(
+    device_id: str,
+    request: Request,
+    fields: str = "temp_c,mem_pct",
+    bucket: str = "",
+    from_ts: Optional[int] = Query(None, alias="from"),
+    to_ts: Optional[int] = Query(None, alias="to"),
+):
+    """Get chart-ready telemetry: min/avg/max per time bucket as aligned arrays.
+
+    bucket is e.g. 30s, 5m, 1h or 1d (default: about 300 points over the range) and is
+    coarsened when it would yield more than 1000 points; from/to are epoch milliseconds.
+    """
+    require_token(request)
+    field_list = [f for f in fields.split(",") if f]
+    unknown = [f for f in field_list if f not in TELEMETRY_COLUMNS]
+    if not field_list or unknown:
+        raise HTTPException(status_code=400, detail=f"fields must be a subset of {', '.join(TELEMETRY_COLUMNS)}")
+    to_ts = to_ts if to_ts is not None else int(time.time() * 1000)
+    from_ts = from_ts if from_ts is not None else to_ts - 86_400_000
+    if from_ts >= to_ts:
+        raise HTTPException(status_code=400, detail="from must be before to")
+    try:
+        bucket = choose_bucket(from_ts, to_ts, bucket)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    bucket_ms = parse_bucket(bucket)
+
+    with SessionLocal() as session:
+        series = build_series(session, device_id, field_list, from_ts, to_ts, bucket_ms)
+    return {
+        "device_id": device_id,
+        "bucket": bucket,
+        "bucket_ms": bucket_ms,
+        "from": from_ts,
+        "to": to_ts,
+        **format_series(series, field_list),
+    }
+
+
+@router.get("/{device_id}/events")
+def get_events(
+    device_id: str,
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=0),
+    event_type: Optional[str] = Query(None, alias="type"),
+    cursor: Optional[str] = None,
+    from_ts: Optional[int] = Query(None, alias="from"),
+    to_ts: Optional[int] = Query(None, alias="to"),
+):
+    """Get events/logs for a device, newest first (older events come from cold storage).
+
+    Optional `type` filter and from/to time range (ms); page further back with `cursor`.
+    """
+    require_token(request)
+    items = _history_page(
+        Event, "events", device_id, limit, cursor, from_ts, to_ts,
+        lambda r: raw_json.with_payload({"id": r[0], "ts": r[1], "type": r[2]}, r[3]),
+        lambda r: raw_json.with_payload({"id": None, "ts": r["ts"], "type": r["type"]}, r["payload"]),
+        columns=[Event.id, Event.ts, Event.type, Event.payload],
+        where=(Event.type == event_type,) if event_type is not None else (),
+        cold_match=(lambda r: r["type"] == event_type) if event_type is not None else None,
+    )
+    return _finish_history(response, items, limit)
 
 
 @router.post("/{device_id}/fully-password")
@@ -308,7 +680,9 @@ def set_fully_password(device_id: str, body: FullyPasswordRequest, request: Requ
             raise HTTPException(status_code=404, detail="Device not found")
 
         device.fully_password = body.password
+        change_log.record(session, "device", device_id)
         session.commit()
+        registry.set_fully_password(device_id, body.password)
 
         add_log(
             device_id=device_id,
@@ -413,6 +787,8 @@ def set_device_screen(device_id: str, body: ScreenAssignmentRequest, request: Re
 
         session.commit()
         session.refresh(assignment)
+        device_summary.set_assignment(device_id, assignment.customer_id, assignment.screen_uuid,
+                                      assignment.display_url)
 
         # Send MQTT command to update device URL
         mqtt_sent = False
@@ -430,7 +806,7 @@ def set_device_screen(device_id: str, body: ScreenAssignmentRequest, request: Re
                     topic = f"devices/{device_id}/cmd/loadUrl"
                     payload = {"url": assignment.display_url}
 
-                bridge.publish(topic, payload)
+                _publish_command(topic, payload)
                 mqtt_sent = True
 
                 add_log(
@@ -1,37 +1,59 @@
 """Location endpoints."""
 
-from fastapi import APIRouter, HTTPException, Request
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from sqlalchemy import select
 
+from .. import change_log
+from ..collection_versions import collection_versions
 from ..db import SessionLocal
+from ..device_summary import device_summary
 from ..models import Location
-from .deps import require_token
+from .deps import require_token, not_modified
+from .paging import keyset, finish_page, prefix_filter
 from .schemas import LocationRequest
 
 router = APIRouter(prefix="/locations", tags=["locations"])
 
 
+def _location_to_dict(r: Location) -> dict:
+    return {
+        "id": r.id,
+        "device_id": r.device_id,
+        "legacy_id": r.legacy_id,
+        "label": r.label,
+        "address": r.address,
+        "zip_code": r.zip_code,
+        "lat": r.lat,
+        "lon": r.lon,
+        "notes": r.notes,
+        "updated_at": r.updated_at,
+    }
+
+
 @router.get("")
-def list_locations(request: Request):
-    """List all locations."""
+def list_locations(
+    request: Request,
+    response: Response,
+    prefix: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+):
+    """List locations by id, optionally by device id prefix and paged with `limit`/`cursor`."""
     require_token(request)
+    cached = not_modified(request, response, collection_versions.etag("locations"))
+    if cached:
+        return cached
+    query = select(Location)
+    if prefix:
+        query = query.where(prefix_filter(Location.device_id, prefix))
+    query = keyset(query, [Location.id], cursor)
+    if limit:
+        query = query.limit(limit + 1)
     with SessionLocal() as session:
-        rows = session.execute(select(Location)).scalars().all()
-        return [
-            {
-                "id": r.id,
-                "device_id": r.device_id,
-                "legacy_id": r.legacy_id,
-                "label": r.label,
-                "address": r.address,
-                "zip_code": r.zip_code,
-                "lat": r.lat,
-                "lon": r.lon,
-                "notes": r.notes,
-                "updated_at": r.updated_at,
-            }
-            for r in rows
-        ]
+        rows = finish_page(response, session.execute(query).scalars().all(), limit, lambda r: [r.id])
+        return [_location_to_dict(r) for r in rows]
 
 
 @router.post("")
@@ -65,18 +87,12 @@ def upsert_location(body: LocationRequest, request: Request):
             setattr(row, key, value)
 
         session.add(row)
+        session.flush()
+        change_log.record(session, "location", row.id)
         session.commit()
         session.refresh(row)
+        if row.device_id:
+            device_summary.set_location(row.device_id, label=row.label, address=row.address,
+                                        zip_code=row.zip_code, lat=row.lat, lon=row.lon)
 
-        return {
-            "id": row.id,
-            "device_id": row.device_id,
-            "legacy_id": row.legacy_id,
-            "label": row.label,
-            "address": row.address,
-            "zip_code": row.zip_code,
-            "lat": row.lat,
-            "lon": row.lon,
-            "notes": row.notes,
-            "updated_at": row.updated_at,
-        }
+        return _location_to_dict(row)
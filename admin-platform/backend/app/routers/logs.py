@@ -3,12 +3,15 @@ import json
 from datetime import datetime, timedelta
 from typing import Optional
 
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Query, Response
 from pydantic import BaseModel
 from sqlalchemy import select, desc, or_
 
+from .. import raw_json
 from ..db import SessionLocal
 from ..models import DeviceLog
+from ..retention import retention
+from .paging import keyset, finish_page
 
 router = APIRouter(prefix="/logs", tags=["logs"])
 
@@ -36,6 +39,16 @@ class LogResponse(BaseModel):
         from_attributes = True
 
 
+# Only the response's columns are loaded, as plain row tuples
+LOG_FIELDS = tuple(LogResponse.model_fields)
+LOG_COLUMNS = [getattr(DeviceLog, name) for name in LOG_FIELDS]
+
+
+def _logs_response(rows, response: Optional[Response] = None) -> Response:
+    """Serialize LogResponse-shaped rows straight to JSON (no ORM objects or model validation)."""
+    return raw_json.array_response((raw_json.dumps(dict(zip(LOG_FIELDS, row))) for row in rows), response)
+
+
 def add_log(
     device_id: str = None,
     legacy_id: int = None,
@@ -60,16 +73,18 @@ def add_log(
 
 @router.get("")
 def get_logs(
+    response: Response,
     device_id: Optional[str] = None,
     legacy_id: Optional[int] = None,
     level: Optional[str] = None,
     category: Optional[str] = None,
     hours: int = Query(default=24, description="Get logs from last N hours"),
-    limit: int = Query(default=100, le=500)
+    limit: int = Query(default=100, le=500),
+    cursor: Optional[str] = None,
 ):
-    """Get device logs with optional filters"""
+    """Get device logs with optional filters, newest first (older pages via `cursor`)"""
     with SessionLocal() as session:
-        query = select(DeviceLog)
+        query = select(*LOG_COLUMNS)
 
         # Filter by device
         if device_id:
@@ -87,11 +102,12 @@ def get_logs(
         cutoff = datetime.utcnow() - timedelta(hours=hours)
         query = query.where(DeviceLog.timestamp >= cutoff)
 
-        # Order and limit
-        query = query.order_by(desc(DeviceLog.timestamp)).limit(limit)
+        # Order and limit. timestamp is set on insert, so id order is time order
+        # (and keyset on the integer id avoids comparing SQLite datetime strings)
+        query = keyset(query, [DeviceLog.id], cursor, descending=True).limit(limit + 1)
 
-        logs = session.execute(query).scalars().all()
-        return [LogResponse.model_validate(log) for log in logs]
+        logs = finish_page(response, session.connection().execute(query).all(), limit, lambda log: [log[0]])
+        return _logs_response(logs, response)
 
 
 @router.get("/device/{device_id}")
@@ -102,13 +118,12 @@ def get_device_logs(
     """Get logs for a specific MQTT device"""
     with SessionLocal() as session:
         query = (
-            select(DeviceLog)
+            select(*LOG_COLUMNS)
             .where(DeviceLog.device_id == device_id)
             .order_by(desc(DeviceLog.timestamp))
             .limit(limit)
         )
-        logs = session.execute(query).scalars().all()
-        return [LogResponse.model_validate(log) for log in logs]
+        return _logs_response(session.connection().execute(query))
 
 
 @router.get("/legacy/{legacy_id}")
@@ -119,13 +134,12 @@ def get_legacy_logs(
     """Get logs for a specific legacy device"""
     with SessionLocal() as session:
         query = (
-            select(DeviceLog)
+            select(*LOG_COLUMNS)
             .where(DeviceLog.legacy_id == legacy_id)
             .order_by(desc(DeviceLog.timestamp))
             .limit(limit)
         )
-        logs = session.execute(query).scalars().all()
-        return [LogResponse.model_validate(log) for log in logs]
+        return _logs_response(session.connection().execute(query))
 
 
 @router.post("")
@@ -144,11 +158,5 @@ def create_log(log_data: LogCreate):
 
 @router.delete("")
 def clear_old_logs(days: int = Query(default=30, description="Delete logs older than N days")):
-    """Delete logs older than specified days"""
-    with SessionLocal() as session:
-        cutoff = datetime.utcnow() - timedelta(days=days)
-        result = session.execute(
-            DeviceLog.__table__.delete().where(DeviceLog.timestamp < cutoff)
-        )
-        session.commit()
-        return {"deleted": result.rowcount}
+    """Delete logs older than specified days (in small chunks, so ingest is not blocked)"""
+    return {"deleted": retention.purge_older_than("device_logs", days)}
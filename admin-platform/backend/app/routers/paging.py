@@ -0,0 +1,68 @@
+"""Keyset pagination shared by the list and history endpoints.
+
+Pages are ordered by (sort key..., id) and continue after the last row of
+the previous page, so page N costs the same index seek as page 1. The
+cursor is opaque to clients: pass `?limit=` for the first page and the
+X-Next-Cursor response header as `?cursor=` for the next one. The header is
+absent on the last page. Without `limit`, list endpoints still return every
+row, as before.
+"""
+
+import base64
+import json
+from typing import Callable, Optional
+
+from fastapi import HTTPException, Response
+from sqlalchemy import and_, desc, or_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Upper bound of any string starting with a prefix (for index-friendly prefix filters)
+_PREFIX_END = "\U0010ffff"
+
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps(values, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or not values:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def _after(columns: list, values: list, descending: bool):
+    column, value = columns[0], values[0]
+    beyond = column < value if descending else column > value
+    if len(columns) == 1:
+        return beyond
+    return or_(beyond, and_(column == value, _after(columns[1:], values[1:], descending)))
+
+
+def keyset(query, columns: list, cursor: Optional[str], descending: bool = False):
+    """Order `query` by `columns` (unique id column last) and start after `cursor`."""
+    query = query.order_by(*(desc(c) if descending else c for c in columns))
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(columns):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.where(_after(columns, values, descending))
+    return query
+
+
+def prefix_filter(column, prefix: str):
+    """`column LIKE 'prefix%'` as a range, so SQLite can use the column's index."""
+    return and_(column >= prefix, column < prefix + _PREFIX_END)
+
+
+def finish_page(response: Response, items: list, limit: Optional[int], key: Callable) -> list:
+    """Trim a `limit + 1` fetch to `limit` and set X-Next-Cursor when more rows remain."""
+    if limit is not None and len(items) > limit:
+        items = items[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(*key(items[-1]))
+    return items
@@ -0,0 +1,92 @@
+"""Delta sync endpoint - entities changed since a change log version."""
+
+from fastapi import APIRouter, Query, Request
+from sqlalchemy import select
+
+from .. import change_log, queries
+from ..db import SessionLocal
+from ..device_registry import registry
+from ..models import Assignment, Customer, CustomerCode, Device, Location
+from ..settings import SYNC_MAX_CHANGES
+from .assignments import _assignment_to_dict
+from .customer_codes import _code_to_dict
+from .customers import _customer_to_dict
+from .devices import serialize_device
+from .deps import require_token
+from .locations import _location_to_dict
+
+router = APIRouter(prefix="/sync", tags=["sync"])
+
+# change log entity -> response key (same names as the list endpoints)
+COLLECTIONS = {
+    "device": "devices",
+    "customer": "customers",
+    "location": "locations",
+    "assignment": "assignments",
+    "customer_code": "customer_codes",
+}
+
+
+def _load(session, entity: str, ids) -> list:
+    """Current state of the given entities (all of them when ids is None)."""
+    model = {"device": Device, "customer": Customer, "location": Location, "assignment": Assignment,
+             "customer_code": CustomerCode}[entity]
+    query = select(model)
+    if ids is not None:
+        query = query.where(model.id.in_(list(ids) if entity == "device" else [int(i) for i in ids]))
+    rows = session.execute(query).scalars().all()
+
+    # Devices come from the DB like everything else: the change log version is
+    # committed with the rows, while this process's registry may lag behind it
+    if entity == "device":
+        return [serialize_device(registry.row_to_state(r)) for r in rows]
+
+    if entity == "customer":
+        counts = queries.device_counts(session, [r.id for r in rows] if ids is not None else None)
+        return [_customer_to_dict(r, counts.get(r.id, 0)) for r in rows]
+    if entity == "customer_code":
+        names = queries.customer_names(session, (r.customer_id for r in rows))
+        return [_code_to_dict(r, names.get(r.customer_id)) for r in rows]
+    if entity == "location":
+        return [_location_to_dict(r) for r in rows]
+    return [_assignment_to_dict(r) for r in rows]
+
+
+@router.get("")
+def sync(request: Request, since: int = Query(0, ge=0), limit: int = Query(SYNC_MAX_CHANGES, ge=1)):
+    """
+    Entities created, updated or deleted since change log version `since`.
+
+    Returns {"version", "full", "more", <collection>: {"upserted": [...], "deleted": [ids]}}.
+    Pass `version` as the next `since`; keep calling while `more` is set.
+    With since=0, or a version older than the retained change log, `full` is
+    set and every collection is returned in full: replace the local replica.
+    Heartbeats alone do not mark a device changed, so a device's `last_seen`
+    is only as fresh as its last other change; poll /devices for liveness.
+    """
+    require_token(request)
+    limit = min(limit, SYNC_MAX_CHANGES)
+    with SessionLocal() as session:
+        oldest, newest = change_log.version_range(session)
+        # Unknown versions (pruned from the log, or from another database) also get a snapshot
+        if since == 0 or since < oldest - 1 or since > newest:
+            # Read the version first: writes racing the snapshot are sent again next time
+            version = newest
+            result = {"version": version, "full": True, "more": False}
+            for entity, key in COLLECTIONS.items():
+                result[key] = {"upserted": _load(session, entity, None), "deleted": []}
+            return result
+
+        version, changes, more = change_log.changes_since(session, since, limit)
+        result = {"version": version, "full": False, "more": more}
+        for entity, key in COLLECTIONS.items():
+            ops = changes[entity]
+            upserted = [i for i, op in ops.items() if op == change_log.UPSERT]
+            deleted = [i for i, op in ops.items() if op == change_log.DELETE]
+            if entity != "device":
+                deleted = [int(i) for i in deleted]
+            result[key] = {
+                "upserted": _load(session, entity, upserted) if upserted else [],
+                "deleted": deleted,
+            }
+        return result
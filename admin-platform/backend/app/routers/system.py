@@ -0,0 +1,32 @@
+"""System endpoints - ingest and background service health."""
+
+from fastapi import APIRouter, Request
+
+from ..cold_storage import cold_storage
+from ..device_registry import registry
+from ..device_summary import device_summary
+from ..mqtt_bridge import bridge
+from ..retention import retention
+from ..telemetry_buffer import telemetry_buffer
+from ..telemetry_deadband import deadband
+from ..telemetry_rollup import rollups
+from .deps import require_token
+
+router = APIRouter(prefix="/system", tags=["system"])
+
+
+@router.get("/ingest")
+def get_ingest_stats(request: Request):
+    """MQTT ingest statistics: queue depth, batch sizes and write counters."""
+    require_token(request)
+    return {**bridge.stats(), "registry": registry.stats(), "offline": registry.offline.stats(),
+            "rollups": rollups.stats(), "deadband": deadband.stats(),
+            "telemetry_buffer": telemetry_buffer.stats(), "cold_storage": cold_storage.stats(),
+            "device_summary": device_summary.stats()}
+
+
+@router.get("/retention")
+def get_retention_stats(request: Request):
+    """Retention policies and what the last runs removed (rows, time, vacuumed pages)."""
+    require_token(request)
+    return retention.stats()
@@ -0,0 +1,121 @@
+"""Fleet-wide telemetry endpoints - threshold and range queries, distributions per group."""
+
+import time
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from sqlalchemy import select
+
+from ..db import SessionLocal
+from ..models import Telemetry
+from ..telemetry_analytics import GROUP_BY, STATS, fleet_distribution
+from ..telemetry_metrics import TELEMETRY_COLUMNS, ROLLUP_FIELDS
+from .deps import require_token
+
+router = APIRouter(prefix="/telemetry", tags=["telemetry"])
+
+
+def metric_column(field: str):
+    """Typed telemetry column for a field name (400 for unknown fields)."""
+    if field not in TELEMETRY_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Unknown field '{field}', expected one of {', '.join(TELEMETRY_COLUMNS)}")
+    return getattr(Telemetry, field)
+
+
+@router.get("/query")
+def query_telemetry(
+    request: Request,
+    field: str,
+    min_value: Optional[float] = Query(None, alias="min"),
+    max_value: Optional[float] = Query(None, alias="max"),
+    from_ts: Optional[int] = Query(None, alias="from"),
+    to_ts: Optional[int] = Query(None, alias="to"),
+    device_id: Optional[str] = None,
+):
+    """
+    Devices with samples of `field` within [min, max] between from and to.
+
+    E.g. /telemetry/query?field=temp_c&min=70 lists devices above 70 °C in the
+    last hour. Timestamps are epoch milliseconds.
+    """
+    require_token(request)
+    column = metric_column(field)
+    to_ts = to_ts if to_ts is not None else int(time.time() * 1000)
+    from_ts = from_ts if from_ts is not None else to_ts - 3_600_000
+
+    conditions = [Telemetry.ts >= from_ts, Telemetry.ts <= to_ts, column.is_not(None)]
+    if min_value is not None:
+        conditions.append(column >= min_value)
+    if max_value is not None:
+        conditions.append(column <= max_value)
+    if device_id:
+        conditions.append(Telemetry.device_id == device_id)
+
+    # Plain range scan on the ts index; grouping in SQL would make SQLite walk
+    # the (device_id, ts) index over the whole table instead
+    with SessionLocal() as session:
+        rows = session.execute(
+            select(Telemetry.device_id, column, Telemetry.ts).where(*conditions)
+        ).all()
+
+    devices = {}
+    for d, value, ts in rows:
+        agg = devices.get(d)
+        if agg is None:
+            devices[d] = {"device_id": d, "samples": 1, "min": value, "max": value, "sum": value, "last_ts": ts}
+            continue
+        agg["samples"] += 1
+        agg["min"] = min(agg["min"], value)
+        agg["max"] = max(agg["max"], value)
+        agg["sum"] += value
+        agg["last_ts"] = max(agg["last_ts"], ts)
+    for agg in devices.values():
+        agg["avg"] = agg.pop("sum") / agg["samples"]
+    return {
+        "field": field,
+        "from": from_ts,
+        "to": to_ts,
+        "devices": sorted(devices.values(), key=lambda a: a["max"], reverse=True),
+    }
+
+
+@router.get("/analytics")
+def telemetry_analytics(
+    request: Request,
+    field: str = "temp_c",
+    stat: str = "avg",
+    group_by: str = "customer",
+    group: Optional[str] = None,
+    from_ts: Optional[int] = Query(None, alias="from"),
+    to_ts: Optional[int] = Query(None, alias="to"),
+    percentiles: str = "50,90,95,99",
+    bins: int = Query(20, ge=1, le=200),
+    top: int = Query(10, ge=0, le=100),
+):
+    """
+    Fleet distribution of a rollup field per customer, device type or location.
+
+    Each device-hour (device-day for windows over 7 days) contributes its
+    `stat` (avg, max or min) as one value. E.g.
+    /telemetry/analytics?field=temp_c&stat=max&group_by=customer&group=12
+    gives the percentiles of customer 12's screen temperatures over the last week.
+    """
+    require_token(request)
+    if field not in ROLLUP_FIELDS:
+        raise HTTPException(status_code=400, detail=f"field must be one of {', '.join(ROLLUP_FIELDS)}")
+    if stat not in STATS:
+        raise HTTPException(status_code=400, detail=f"stat must be one of {', '.join(STATS)}")
+    if group_by not in GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(GROUP_BY)}")
+    try:
+        quantiles = [float(q) for q in percentiles.split(",") if q.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="percentiles must be comma separated numbers")
+    if any(not 0 <= q <= 100 for q in quantiles):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100")
+    to_ts = to_ts if to_ts is not None else int(time.time() * 1000)
+    from_ts = from_ts if from_ts is not None else to_ts - 7 * 86_400_000
+
+    with SessionLocal() as session:
+        result = fleet_distribution(session, field, stat, group_by, from_ts, to_ts, quantiles, bins, top, group)
+    return {"field": field, "stat": stat, "group_by": group_by, "from": from_ts, "to": to_ts, **result}
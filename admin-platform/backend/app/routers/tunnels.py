@@ -1,9 +1,14 @@
 """Tunnel configuration endpoints."""
 
-from fastapi import APIRouter, HTTPException, Request
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from sqlalchemy import select
 
+from .. import change_log
+from ..collection_versions import collection_versions
 from ..db import SessionLocal
+from ..device_registry import registry
 from ..models import Device, TunnelConfig
 from ..settings import (
     TUNNEL_PORT_MIN,
@@ -13,7 +18,8 @@ from ..settings import (
     TUNNEL_DEFAULT_USER,
     TUNNEL_DEFAULT_KEY_PATH,
 )
-from .deps import require_token
+from .deps import require_token, not_modified
+from .paging import keyset, finish_page, prefix_filter
 from .schemas import TunnelConfigRequest, TunnelPortRequest
 
 router = APIRouter(tags=["tunnels"])
@@ -53,26 +59,45 @@ def apply_tunnel_defaults(cfg: TunnelConfig) -> bool:
 
 
 @router.get("/tunnel-configs")
-def list_tunnel_configs(request: Request):
-    """List all tunnel configurations."""
+def list_tunnel_configs(
+    request: Request,
+    response: Response,
+    prefix: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+):
+    """List tunnel configurations by device id (optional id prefix, paged with `limit`/`cursor`)."""
     require_token(request)
+    # One config per device row: a new or deleted device changes the list too
+    cached = not_modified(request, response, collection_versions.etag("tunnel_configs", len(registry)))
+    if cached:
+        return cached
     with SessionLocal() as session:
         device_ids = session.execute(select(Device.id)).scalars().all()
         existing = {cfg.device_id: cfg for cfg in session.execute(select(TunnelConfig)).scalars().all()}
-        changed = False
+        changed = set()
         for device_id in device_ids:
             cfg = existing.get(device_id)
             if not cfg:
                 cfg = TunnelConfig(device_id=device_id)
                 session.add(cfg)
                 existing[device_id] = cfg
-                changed = True
+                changed.add(device_id)
             if apply_tunnel_defaults(cfg):
                 session.add(cfg)
-                changed = True
+                changed.add(device_id)
         if changed:
+            change_log.record_many(session, "tunnel_config", changed)
             session.commit()
-        rows = session.execute(select(TunnelConfig)).scalars().all()
+            # The fill bumped the version: hand out the ETag of what is returned
+            response.headers["ETag"] = collection_versions.etag("tunnel_configs", len(registry))
+        query = select(TunnelConfig)
+        if prefix:
+            query = query.where(prefix_filter(TunnelConfig.device_id, prefix))
+        query = keyset(query, [TunnelConfig.device_id], cursor)
+        if limit:
+            query = query.limit(limit + 1)
+        rows = finish_page(response, session.execute(query).scalars().all(), limit, lambda r: [r.device_id])
         return [serialize_tunnel_config(r) for r in rows]
 
 
@@ -87,6 +112,7 @@ def get_tunnel_config(device_id: str, request: Request):
             session.add(row)
         if apply_tunnel_defaults(row):
             session.add(row)
+            change_log.record(session, "tunnel_config", device_id)
             session.commit()
             session.refresh(row)
         return serialize_tunnel_config(row)
@@ -106,6 +132,7 @@ def save_tunnel_config(device_id: str, body: TunnelConfigRequest, request: Reque
         if apply_tunnel_defaults(row):
             session.add(row)
         session.add(row)
+        change_log.record(session, "tunnel_config", device_id)
         session.commit()
         session.refresh(row)
         return serialize_tunnel_config(row)
@@ -161,6 +188,7 @@ def allocate_tunnel_ports(device_id: str, body: TunnelPortRequest, request: Requ
         apply_tunnel_defaults(row)
 
         session.add(row)
+        change_log.record(session, "tunnel_config", device_id)
         session.commit()
         session.refresh(row)
         return serialize_tunnel_config(row)
@@ -21,6 +21,7 @@ from typing import Optional, Dict, Any
 from datetime import datetime
 from sqlalchemy import select, func
 
+from .. import change_log
 from ..db import SessionLocal
 from ..models import Customer
 
@@ -178,6 +179,7 @@ class CMSProvisioner:
             customer.cms_subdomain = subdomain
             customer.cms_docker_port = web_port
             customer.cms_deploy_port = deploy_port
+            change_log.record(session, "customer", customer_id)
             session.commit()
 
         try:
@@ -208,6 +210,7 @@ class CMSProvisioner:
                     customer.cms_api_key = api_key
                     customer.cms_admin_password = admin_password
                     customer.cms_provisioned_at = datetime.utcnow()
+                    change_log.record(session, "customer", customer_id)
                     session.commit()
 
                 result["api_key"] = api_key
@@ -219,6 +222,7 @@ class CMSProvisioner:
                 with SessionLocal() as session:
                     customer = session.get(Customer, customer_id)
                     customer.cms_status = "error"
+                    change_log.record(session, "customer", customer_id)
                     session.commit()
 
             return result
@@ -230,6 +234,7 @@ class CMSProvisioner:
             with SessionLocal() as session:
                 customer = session.get(Customer, customer_id)
                 customer.cms_status = "error"
+                change_log.record(session, "customer", customer_id)
                 session.commit()
 
             return {
@@ -384,6 +389,7 @@ class CMSProvisioner:
         with SessionLocal() as session:
             customer = session.get(Customer, customer_id)
             customer.cms_status = "stopped"
+            change_log.record(session, "customer", customer_id)
             session.commit()
 
         return {"success": True}
@@ -418,6 +424,7 @@ class CMSProvisioner:
         with SessionLocal() as session:
             customer = session.get(Customer, customer_id)
             customer.cms_status = "active"
+            change_log.record(session, "customer", customer_id)
             session.commit()
 
         return {"success": True}
@@ -22,3 +22,98 @@ TUNNEL_DEFAULT_PORT = int(os.getenv("TUNNEL_DEFAULT_PORT", "2222"))
 TUNNEL_DEFAULT_HOST = os.getenv("TUNNEL_DEFAULT_HOST", "")
 TUNNEL_DEFAULT_USER = os.getenv("TUNNEL_DEFAULT_USER", "")
 TUNNEL_DEFAULT_KEY_PATH = os.getenv("TUNNEL_DEFAULT_KEY_PATH", "")
+
+# MQTT ingest write-behind queue
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "200"))
+INGEST_FLUSH_MS = int(os.getenv("INGEST_FLUSH_MS", "250"))
+# asyncio mode: stop reading from the broker once a queue is this full (fraction)
+INGEST_HIGH_WATER = float(os.getenv("INGEST_HIGH_WATER", "0.8"))
+# Load shedding: once a queue is this full (fraction, 0 = off), only every
+# INGEST_SHED_SAMPLE-th telemetry message is kept (0 = drop all telemetry)
+INGEST_SHED_THRESHOLD = float(os.getenv("INGEST_SHED_THRESHOLD", "0.5"))
+INGEST_SHED_SAMPLE = int(os.getenv("INGEST_SHED_SAMPLE", "10"))
+# Number of ingest worker threads; messages are sharded by device id
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+
+# In-memory device registry: seconds between write-backs to the devices table
+REGISTRY_SYNC_INTERVAL = float(os.getenv("REGISTRY_SYNC_INTERVAL", "5"))
+# Heartbeat-only last_seen updates are written at most once per interval per device
+HEARTBEAT_WRITE_INTERVAL = float(os.getenv("HEARTBEAT_WRITE_INTERVAL", "60"))
+
+# Offline detection: seconds without data before a device is marked offline.
+# Per-type overrides fall back to OFFLINE_TIMEOUT when unset.
+OFFLINE_TIMEOUT = float(os.getenv("OFFLINE_TIMEOUT", "600"))
+OFFLINE_TIMEOUT_IOCAST = float(os.getenv("OFFLINE_TIMEOUT_IOCAST", "0") or 0)
+OFFLINE_TIMEOUT_FULLY = float(os.getenv("OFFLINE_TIMEOUT_FULLY", "0") or 0)
+OFFLINE_TIMEOUT_PI = float(os.getenv("OFFLINE_TIMEOUT_PI", "0") or 0)
+
+# Clustered mode: set MQTT_SHARED_GROUP to subscribe via $share/<group>/... so the
+# broker load-balances messages across replicas. One replica (lease holder) runs
+# the offline checker; registries refresh from the DB to see the others' updates.
+MQTT_SHARED_GROUP = os.getenv("MQTT_SHARED_GROUP", "")
+LEADER_LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", "30"))
+
+# INGEST_MODE=embedded: the API process runs the MQTT bridge (single process setup).
+# INGEST_MODE=external: ingest runs in `python -m app.ingest`; API processes only
+# publish commands and read device state refreshed from the DB.
+INGEST_MODE = os.getenv("INGEST_MODE", "embedded")
+# Empty (as in .env.example) means the default for the mode
+REGISTRY_REFRESH_INTERVAL = float(
+    os.getenv("REGISTRY_REFRESH_INTERVAL")
+    or ("15" if MQTT_SHARED_GROUP else ("5" if INGEST_MODE == "external" else "0"))
+)
+
+# MQTT_LOOP=thread: paho's loop_forever thread. MQTT_LOOP=asyncio: the bridge runs
+# on the API's event loop (awaitable QoS 1 publishes, explicit read backpressure).
+MQTT_LOOP = os.getenv("MQTT_LOOP", "thread")
+
+# Telemetry rollups (per minute/hour/day) are flushed to the DB every interval.
+# Retention tiers in days (0 = keep forever, applied by the retention service).
+# Raw telemetry is kept unless TELEMETRY_RAW_RETENTION_DAYS is set (deleting it is
+# opt-in); the finer rollup tiers are derived data, covered by the coarser ones.
+ROLLUP_FLUSH_INTERVAL = float(os.getenv("ROLLUP_FLUSH_INTERVAL", "10"))
+TELEMETRY_RAW_RETENTION_DAYS = float(os.getenv("TELEMETRY_RAW_RETENTION_DAYS", "0"))
+ROLLUP_1M_RETENTION_DAYS = float(os.getenv("ROLLUP_1M_RETENTION_DAYS", "2"))
+ROLLUP_1H_RETENTION_DAYS = float(os.getenv("ROLLUP_1H_RETENTION_DAYS", "90"))
+ROLLUP_1D_RETENTION_DAYS = float(os.getenv("ROLLUP_1D_RETENTION_DAYS", "0"))
+
+# Keep the raw JSON payload of telemetry rows next to the typed metric columns
+TELEMETRY_STORE_RAW = os.getenv("TELEMETRY_STORE_RAW", "true").lower() in ("1", "true", "yes")
+
+# Telemetry deadband: a sample is only stored when a field moves more than its
+# threshold, or TELEMETRY_MAX_INTERVAL seconds after the last stored sample
+# (0 = store every sample). Rollups and live views still see every sample.
+TELEMETRY_DEADBAND = os.getenv("TELEMETRY_DEADBAND", "temp_c=1,mem_pct=2,load=0.5,battery_level=2,wifi_signal=5")
+TELEMETRY_MAX_INTERVAL = float(os.getenv("TELEMETRY_MAX_INTERVAL", "900"))
+
+# Recent telemetry samples kept in memory per device (ring buffer)
+TELEMETRY_BUFFER_SIZE = int(os.getenv("TELEMETRY_BUFFER_SIZE", "120"))
+
+# Latest events kept per device in the device summary read model (GET /devices/summary)
+DEVICE_SUMMARY_EVENTS = int(os.getenv("DEVICE_SUMMARY_EVENTS", "5"))
+
+# Cold storage: telemetry/events rows older than *_COLD_AFTER_DAYS are moved out of
+# the DB into compressed per-device, per-day segment files (0 = keep them in the DB).
+# Like the DB retention, deleting segments is opt-in: COLD_RETENTION_DAYS (0 = never).
+# When setting TELEMETRY_RAW_RETENTION_DAYS, keep it above TELEMETRY_COLD_AFTER_DAYS,
+# or rows are deleted from the DB before they are moved to cold storage.
+COLD_STORAGE_DIR = os.getenv("COLD_STORAGE_DIR", "/data/cold")
+TELEMETRY_COLD_AFTER_DAYS = float(os.getenv("TELEMETRY_COLD_AFTER_DAYS", "2"))
+EVENTS_COLD_AFTER_DAYS = float(os.getenv("EVENTS_COLD_AFTER_DAYS", "30"))
+COLD_RETENTION_DAYS = float(os.getenv("COLD_RETENTION_DAYS", "0"))
+
+# Retention service: "table=days" or "table.category=days" policies (0 = keep forever)
+# for events (category = type) and device_logs (category = category), on top of the
+# telemetry/rollup tiers above. Empty by default: nothing is deleted until a policy
+# is configured (e.g. "device_logs=90,device_logs.mqtt=14,events.screenshot=7"). Deletes run in chunks that hold the write lock for
+# about RETENTION_CHUNK_MS, with RETENTION_PAUSE_MS between them.
+RETENTION_POLICIES = os.getenv("RETENTION_POLICIES", "")
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "3600"))
+RETENTION_CHUNK_MS = float(os.getenv("RETENTION_CHUNK_MS", "5"))
+RETENTION_PAUSE_MS = float(os.getenv("RETENTION_PAUSE_MS", "50"))
+
+# Delta sync (GET /sync): change log rows are kept this many days; clients that
+# were away longer get a full snapshot (only sync bookkeeping is deleted). MAX_CHANGES caps the rows read per call.
+CHANGE_LOG_RETENTION_DAYS = float(os.getenv("CHANGE_LOG_RETENTION_DAYS", "7"))
+SYNC_MAX_CHANGES = int(os.getenv("SYNC_MAX_CHANGES", "5000"))
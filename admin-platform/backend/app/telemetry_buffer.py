@@ -0,0 +1,109 @@
+"""Per-device in-memory ring buffer of recent telemetry samples.
+
+The ingest path appends every sample (stored or suppressed by the deadband).
+Numeric metrics are kept in flat typed arrays, one float32 slot per
+TELEMETRY_COLUMNS field plus an int64 timestamp, so 5,000 devices x 120
+samples take about 40 MB. Only the newest full payload is kept per device;
+it serves the `limit=1` telemetry polls of the UI without a DB query.
+"""
+
+import math
+import threading
+from array import array
+from typing import Optional
+
+from .settings import TELEMETRY_BUFFER_SIZE
+from .telemetry_metrics import TELEMETRY_COLUMNS
+
+NAN = float("nan")
+
+
+class _Ring:
+    __slots__ = ("ts", "values", "head", "size")
+
+    def __init__(self, capacity: int, width: int) -> None:
+        self.ts = array("q", [0]) * capacity
+        self.values = array("f", [NAN]) * (capacity * width)
+        self.head = 0  # next slot to write
+        self.size = 0
+
+
+class TelemetryRingBuffer:
+    """Last `capacity` metric samples per device plus the newest full payload."""
+
+    def __init__(self, capacity: int, fields: tuple = TELEMETRY_COLUMNS) -> None:
+        self.capacity = max(1, capacity)
+        self.fields = fields
+        self._slot = {field: i for i, field in enumerate(fields)}
+        self._lock = threading.Lock()
+        self._rings = {}
+        # device_id -> {"ts", "payload", "stored"} of the newest sample
+        self._latest = {}
+
+    def add(self, device_id: str, ts: int, metrics: dict, payload: dict, stored: bool) -> None:
+        """Append a sample; `stored` tells whether it was also written to the DB."""
+        width = len(self.fields)
+        with self._lock:
+            ring = self._rings.get(device_id)
+            if ring is None:
+                ring = self._rings[device_id] = _Ring(self.capacity, width)
+            pos = ring.head
+            ring.ts[pos] = ts
+            base = pos * width
+            values = ring.values
+            for i, field in enumerate(self.fields):
+                values[base + i] = metrics.get(field, NAN)
+            ring.head = (pos + 1) % self.capacity
+            ring.size = min(ring.size + 1, self.capacity)
+            self._latest[device_id] = {"ts": ts, "payload": payload, "stored": stored}
+
+    def latest(self, device_id: str) -> Optional[dict]:
+        """Newest sample of a device ({"ts", "payload", "stored"}), or None."""
+        with self._lock:
+            return self._latest.get(device_id)
+
+    def size(self, device_id: str) -> int:
+        with self._lock:
+            ring = self._rings.get(device_id)
+            return ring.size if ring else 0
+
+    def recent(self, device_id: str, limit: int, fields=None) -> list:
+        """Up to `limit` samples, newest first, as {"ts", "metrics"} dicts."""
+        slots = [(f, self._slot[f]) for f in (fields or self.fields) if f in self._slot]
+        width = len(self.fields)
+        result = []
+        with self._lock:
+            ring = self._rings.get(device_id)
+            if ring is None:
+                return result
+            for n in range(min(limit, ring.size)):
+                pos = (ring.head - 1 - n) % self.capacity
+                base = pos * width
+                metrics = {}
+                for field, i in slots:
+                    value = ring.values[base + i]
+                    if not math.isnan(value):
+                        # Drop float32 noise (51.2 is stored as 51.200000762...)
+                        metrics[field] = round(value, 3)
+                result.append({"ts": ring.ts[pos], "metrics": metrics})
+        return result
+
+    def forget(self, device_id: str) -> None:
+        with self._lock:
+            self._rings.pop(device_id, None)
+            self._latest.pop(device_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            devices = len(self._rings)
+            samples = sum(ring.size for ring in self._rings.values())
+        per_device = self.capacity * (8 + 4 * len(self.fields))
+        return {
+            "devices": devices,
+            "samples": samples,
+            "capacity": self.capacity,
+            "array_bytes": devices * per_device,
+        }
+
+
+telemetry_buffer = TelemetryRingBuffer(TELEMETRY_BUFFER_SIZE)
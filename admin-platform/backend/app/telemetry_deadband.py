@@ -0,0 +1,98 @@
+"""Deadband (report-by-exception) filter for telemetry rows.
+
+An idle screen reports nearly the same numbers every time. A sample is only
+written to the telemetry table when one of the watched fields has moved
+beyond its threshold since the last stored sample, or when `max_interval`
+has passed (so there is always a recent row). Suppressed samples still go
+to the rollups and the in-memory ring buffer, so live views and history
+stay accurate.
+"""
+
+import threading
+
+from .settings import TELEMETRY_DEADBAND, TELEMETRY_MAX_INTERVAL
+
+
+def parse_thresholds(spec: str) -> dict:
+    """Parse "temp_c=1,mem_pct=2" into {"temp_c": 1.0, "mem_pct": 2.0}."""
+    thresholds = {}
+    for part in spec.split(","):
+        if "=" not in part:
+            continue
+        field, value = part.split("=", 1)
+        try:
+            thresholds[field.strip()] = float(value)
+        except ValueError:
+            continue
+    return thresholds
+
+
+class TelemetryDeadband:
+    """Per-device metrics of the last stored sample."""
+
+    def __init__(self, thresholds: dict, max_interval: float) -> None:
+        self.thresholds = thresholds
+        # Seconds; 0 disables the deadband (every sample is stored)
+        self.max_interval = max_interval
+        self._lock = threading.Lock()
+        # device_id -> (ts_ms, metrics) of the last stored sample
+        self._stored = {}
+
+        self.samples_stored = 0
+        self.samples_suppressed = 0
+
+    def should_store(self, device_id: str, ts: int, metrics: dict, pending: dict) -> bool:
+        """
+        True when a sample has to be written to the DB.
+
+        Nothing is recorded here: `pending` holds the samples stored earlier in
+        the same transaction, and record() applies a decision once it commits,
+        so a batch that is rolled back and retried decides again from scratch.
+        """
+        with self._lock:
+            previous = pending.get(device_id) or self._stored.get(device_id)
+        store = (
+            not self.max_interval
+            or previous is None
+            or ts - previous[0] >= self.max_interval * 1000
+            or self._moved(previous[1], metrics)
+        )
+        if store:
+            pending[device_id] = (ts, metrics)
+        return store
+
+    def record(self, device_id: str, ts: int, metrics: dict, stored: bool) -> None:
+        """Apply a committed should_store() decision."""
+        with self._lock:
+            if stored:
+                self._stored[device_id] = (ts, metrics)
+                self.samples_stored += 1
+            else:
+                self.samples_suppressed += 1
+
+    def _moved(self, previous: dict, metrics: dict) -> bool:
+        for field, threshold in self.thresholds.items():
+            old, new = previous.get(field), metrics.get(field)
+            if (old is None) != (new is None):
+                return True
+            if old is not None and abs(new - old) > threshold:
+                return True
+        return False
+
+    def forget(self, device_id: str) -> None:
+        with self._lock:
+            self._stored.pop(device_id, None)
+
+    def stats(self) -> dict:
+        total = self.samples_stored + self.samples_suppressed
+        return {
+            "enabled": bool(self.max_interval),
+            "thresholds": dict(self.thresholds),
+            "max_interval": self.max_interval,
+            "stored": self.samples_stored,
+            "suppressed": self.samples_suppressed,
+            "suppressed_pct": round(self.samples_suppressed / total * 100, 1) if total else 0.0,
+        }
+
+
+deadband = TelemetryDeadband(parse_thresholds(TELEMETRY_DEADBAND), TELEMETRY_MAX_INTERVAL)
@@ -0,0 +1,90 @@
+"""Numeric metrics extracted from telemetry payloads.
+
+Raspberry Pi, Fully (as mapped by the bridge) and IOCast Android devices
+report the same quantities under different keys and units. extract_metrics
+normalises them so all devices can be aggregated alike; the result is stored
+in the typed columns of `telemetry` and feeds the rollups.
+"""
+
+import math
+from typing import Optional
+
+# Typed numeric columns of the telemetry table
+TELEMETRY_COLUMNS = (
+    "temp_c", "load", "mem_pct", "mem_total_kb", "mem_available_kb", "uptime_seconds",
+    "disk_total_bytes", "disk_used_bytes", "disk_free_bytes",
+    "battery_level", "wifi_signal", "ram_free_mb", "ram_total_mb", "storage_free_mb", "storage_total_mb",
+)
+
+# Fields kept as per-minute/hour/day rollups
+ROLLUP_FIELDS = ("temp_c", "mem_pct", "load", "battery_level", "wifi_signal")
+
+# Column -> payload keys in order of preference (Pi / Fully as mapped by the bridge, then IOCast)
+FIELD_KEYS = {
+    "temp_c": ("temp_c", "temp"),
+    "mem_total_kb": ("mem_total_kb",),
+    "mem_available_kb": ("mem_available_kb",),
+    "uptime_seconds": ("uptime_seconds",),
+    "disk_total_bytes": ("disk_total_bytes",),
+    "disk_used_bytes": ("disk_used_bytes",),
+    "disk_free_bytes": ("disk_free_bytes",),
+    "battery_level": ("battery_level", "batteryLevel"),
+    "wifi_signal": ("wifi_signal", "wifiSignal"),
+    "ram_free_mb": ("ram_free_mb", "memoryFree"),
+    "ram_total_mb": ("ram_total_mb", "memoryTotal"),
+    "storage_free_mb": ("storage_free_mb", "storageFree"),
+    "storage_total_mb": ("storage_total_mb", "storageTotal"),
+}
+
+# (total, free) key pairs: Pi, Fully (mapped by the bridge), IOCast
+MEMORY_KEYS = (
+    ("mem_total_kb", "mem_available_kb"),
+    ("ram_total_mb", "ram_free_mb"),
+    ("memoryTotal", "memoryFree"),
+)
+
+
+def _num(value) -> Optional[float]:
+    """Float value of a payload field, or None for missing/non-numeric values."""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        result = float(value)
+    except (TypeError, ValueError):
+        return None
+    return result if math.isfinite(result) else None
+
+
+def _pct_used(total, free) -> Optional[float]:
+    total, free = _num(total), _num(free)
+    if not total or free is None:
+        return None
+    return (total - free) / total * 100
+
+
+def extract_metrics(payload: dict) -> dict:
+    """Return {column: float} for the known numeric fields present in a payload."""
+    metrics = {}
+
+    # Pi sends /proc/loadavg as ["0.31", "0.28", "0.25"]; use the 1 minute value
+    load = payload.get("load")
+    if isinstance(load, (list, tuple)):
+        load = load[0] if load else None
+    load = _num(load)
+    if load is not None:
+        metrics["load"] = load
+
+    for total_key, free_key in MEMORY_KEYS:
+        mem_pct = _pct_used(payload.get(total_key), payload.get(free_key))
+        if mem_pct is not None:
+            metrics["mem_pct"] = mem_pct
+            break
+
+    for column, keys in FIELD_KEYS.items():
+        for key in keys:
+            value = _num(payload.get(key))
+            if value is not None:
+                metrics[column] = value
+                break
+
+    return metrics
@@ -0,0 +1,180 @@
+"""Continuous telemetry rollups.
+
+Every telemetry sample seen by the bridge is folded into in-memory
+per-minute, per-hour and per-day buckets (min/max/sum/count/last for each
+numeric field, see telemetry_metrics). A background thread upserts the
+changed buckets into `telemetry_rollups` every `flush_interval` seconds, so
+history views read a few thousand rollup rows instead of millions of raw
+payloads.
+
+Retention of raw telemetry and of each rollup tier is handled by the
+retention service (app.retention).
+"""
+
+import logging
+import threading
+import time
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert
+
+from .db import SessionLocal
+from .models import TelemetryRollup
+
+logger = logging.getLogger(__name__)
+
+# Resolution -> bucket width in ms
+RESOLUTIONS = {"1m": 60_000, "1h": 3_600_000, "1d": 86_400_000}
+
+DAY_MS = 86_400_000
+
+# Stat slots of a bucket
+MIN, MAX, SUM, COUNT, LAST, LAST_TS = range(6)
+
+
+def merge_stats(a: list, b: list) -> list:
+    """Combine two [min, max, sum, count, last, last_ts] buckets."""
+    newer = b if b[LAST_TS] >= a[LAST_TS] else a
+    return [min(a[MIN], b[MIN]), max(a[MAX], b[MAX]), a[SUM] + b[SUM], a[COUNT] + b[COUNT],
+            newer[LAST], newer[LAST_TS]]
+
+
+class TelemetryRollups:
+    """In-memory rollup accumulator with periodic DB flush."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # (device_id, resolution, field, bucket_ts) -> [min, max, sum, count, last, last_ts]
+        self._pending = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        self.samples = 0
+        self.flushes = 0
+        self.last_flush_rows = 0
+        self.last_flush_ms = 0.0
+
+    def add(self, device_id: str, ts: int, metrics: dict) -> None:
+        """Fold one sample (ts in ms) into its minute, hour and day buckets."""
+        if not metrics:
+            return
+        with self._lock:
+            self.samples += 1
+            for resolution, width in RESOLUTIONS.items():
+                bucket_ts = ts - ts % width
+                for field, value in metrics.items():
+                    key = (device_id, resolution, field, bucket_ts)
+                    stats = self._pending.get(key)
+                    if stats is None:
+                        self._pending[key] = [value, value, value, 1, value, ts]
+                        continue
+                    if value < stats[MIN]:
+                        stats[MIN] = value
+                    if value > stats[MAX]:
+                        stats[MAX] = value
+                    stats[SUM] += value
+                    stats[COUNT] += 1
+                    if ts >= stats[LAST_TS]:
+                        stats[LAST] = value
+                        stats[LAST_TS] = ts
+
+    def pending(self, device_id: str, resolution: str, fields, from_ts: int, to_ts: int) -> dict:
+        """Buckets not flushed yet: {(field, bucket_ts): stats}."""
+        with self._lock:
+            return {
+                (field, bucket_ts): list(stats)
+                for (d, r, field, bucket_ts), stats in self._pending.items()
+                if d == device_id and r == resolution and field in fields and from_ts <= bucket_ts <= to_ts
+            }
+
+    def pending_fleet(self, resolution: str, field: str, from_ts: int, to_ts: int) -> dict:
+        """Buckets of one field not flushed yet, for every device: {(device_id, bucket_ts): stats}."""
+        with self._lock:
+            return {
+                (d, bucket_ts): list(stats)
+                for (d, r, f, bucket_ts), stats in self._pending.items()
+                if r == resolution and f == field and from_ts <= bucket_ts <= to_ts
+            }
+
+    def flush(self) -> int:
+        """Upsert pending buckets into telemetry_rollups. Returns the number of rows written."""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+        if not pending:
+            return 0
+        started = time.perf_counter()
+        rows = [
+            {"device_id": device_id, "resolution": resolution, "field": field, "bucket_ts": bucket_ts,
+             "min": s[MIN], "max": s[MAX], "sum": s[SUM], "count": s[COUNT], "last": s[LAST], "last_ts": s[LAST_TS]}
+            for (device_id, resolution, field, bucket_ts), s in pending.items()
+        ]
+        stmt = insert(TelemetryRollup)
+        excluded = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["device_id", "resolution", "field", "bucket_ts"],
+            set_={
+                "min": text("min(telemetry_rollups.min, excluded.min)"),
+                "max": text("max(telemetry_rollups.max, excluded.max)"),
+                "sum": TelemetryRollup.sum + excluded.sum,
+                "count": TelemetryRollup.count + excluded.count,
+                "last": text("CASE WHEN excluded.last_ts >= telemetry_rollups.last_ts "
+                             "THEN excluded.last ELSE telemetry_rollups.last END"),
+                "last_ts": text("max(telemetry_rollups.last_ts, excluded.last_ts)"),
+            },
+        )
+        try:
+            with SessionLocal() as session:
+                session.execute(stmt, rows)
+                session.commit()
+        except Exception:
+            # Put the buckets back so the next flush retries them
+            with self._lock:
+                for key, stats in pending.items():
+                    current = self._pending.get(key)
+                    self._pending[key] = merge_stats(stats, current) if current else stats
+            raise
+        self.flushes += 1
+        self.last_flush_rows = len(rows)
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        return len(rows)
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "samples": self.samples,
+            "pending_buckets": pending,
+            "flushes": self.flushes,
+            "last_flush_rows": self.last_flush_rows,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+        }
+
+    def start(self, flush_interval: float) -> None:
+        """Start the flush thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(flush_interval,),
+                                        name="telemetry-rollup", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the thread and flush what is still in memory."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(10)
+        self.flush()
+
+    def _run(self, flush_interval: float) -> None:
+        while not self._stop.wait(flush_interval):
+            try:
+                count = self.flush()
+                if count:
+                    logger.debug(f"[ROLLUP] Flushed {count} buckets in {self.last_flush_ms:.1f} ms")
+            except Exception as e:
+                logger.error(f"[ROLLUP] Flush failed: {e}")
+
+
+rollups = TelemetryRollups()
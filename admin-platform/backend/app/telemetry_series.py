@@ -0,0 +1,137 @@
+"""Time-bucketed telemetry series for charts.
+
+Rollup fields are answered from `telemetry_rollups`: the coarsest rollup
+resolution that divides the requested bucket (and is still retained for the
+requested range) is regrouped into the bucket, so a 30-day chart reads at
+most a few thousand rows. Other typed fields, and buckets below a minute,
+are aggregated in SQL over the typed telemetry columns, plus the cold
+storage segments for days that have been moved out of the DB.
+"""
+
+import re
+import time
+
+from sqlalchemy import select, func
+
+from .cold_storage import cold_storage
+from .models import Telemetry, TelemetryRollup
+from .retention import retention
+from .telemetry_metrics import ROLLUP_FIELDS
+from .telemetry_rollup import RESOLUTIONS, DAY_MS, MIN, MAX, SUM, COUNT, merge_stats, rollups
+
+UNITS = {"s": 1000, "m": 60_000, "h": 3_600_000, "d": DAY_MS}
+
+# Bucket sizes used when the caller asks for none, or for too many points
+NICE_BUCKETS = ("1m", "5m", "15m", "30m", "1h", "3h", "6h", "12h", "1d", "7d")
+MAX_POINTS = 1000
+DEFAULT_POINTS = 300
+
+
+def parse_bucket(bucket: str) -> int:
+    """"5m" -> 300000 ms. Raises ValueError for malformed sizes."""
+    match = re.fullmatch(r"(\d+)([smhd])", bucket.strip())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid bucket '{bucket}', expected e.g. 30s, 5m, 1h or 1d")
+    return int(match.group(1)) * UNITS[match.group(2)]
+
+
+def choose_bucket(from_ts: int, to_ts: int, bucket: str = "") -> str:
+    """Requested bucket, coarsened to a nice size when it would exceed MAX_POINTS."""
+    span = max(1, to_ts - from_ts)
+    if bucket and span / parse_bucket(bucket) <= MAX_POINTS:
+        return bucket
+    target = MAX_POINTS if bucket else DEFAULT_POINTS
+    for nice in NICE_BUCKETS:
+        if span / parse_bucket(nice) <= target:
+            return nice
+    return NICE_BUCKETS[-1]
+
+
+def _rollup_resolution(bucket_ms: int, from_ts: int):
+    """Coarsest rollup resolution dividing the bucket, preferring ones retained back to from_ts."""
+    now_ms = int(time.time() * 1000)
+    candidates = [r for r, width in sorted(RESOLUTIONS.items(), key=lambda i: -i[1]) if bucket_ms % width == 0]
+    for resolution in candidates:
+        days = retention.days("telemetry_rollups", resolution)
+        if not days or from_ts >= now_ms - days * DAY_MS:
+            return resolution
+    return candidates[0] if candidates else None
+
+
+def build_series(session, device_id: str, fields: list, from_ts: int, to_ts: int, bucket_ms: int) -> dict:
+    """{field: {bucket_ts: [min, max, sum, count]}} for the given range."""
+    series = {}
+    resolution = _rollup_resolution(bucket_ms, from_ts)
+    rollup_fields = [f for f in fields if f in ROLLUP_FIELDS] if resolution else []
+    raw_fields = [f for f in fields if f not in rollup_fields]
+    start = from_ts - from_ts % bucket_ms
+
+    if rollup_fields:
+        rows = session.execute(
+            select(TelemetryRollup.field, TelemetryRollup.bucket_ts, TelemetryRollup.min, TelemetryRollup.max,
+                   TelemetryRollup.sum, TelemetryRollup.count, TelemetryRollup.last, TelemetryRollup.last_ts)
+            .where(
+                TelemetryRollup.device_id == device_id,
+                TelemetryRollup.resolution == resolution,
+                TelemetryRollup.field.in_(rollup_fields),
+                TelemetryRollup.bucket_ts >= start,
+                TelemetryRollup.bucket_ts <= to_ts,
+            )
+        ).all()
+        stats = {(r[0], r[1]): list(r[2:]) for r in rows}
+        for key, pending in rollups.pending(device_id, resolution, rollup_fields, start, to_ts).items():
+            stats[key] = merge_stats(stats[key], pending) if key in stats else pending
+        for (field, bucket_ts), s in stats.items():
+            buckets = series.setdefault(field, {})
+            b = bucket_ts - bucket_ts % bucket_ms
+            current = buckets.get(b)
+            buckets[b] = [min(current[0], s[MIN]), max(current[1], s[MAX]), current[2] + s[SUM], current[3] + s[COUNT]] \
+                if current else [s[MIN], s[MAX], s[SUM], s[COUNT]]
+
+    for field in raw_fields:
+        column = getattr(Telemetry, field)
+        b = (Telemetry.ts // bucket_ms) * bucket_ms
+        rows = session.execute(
+            select(b, func.min(column), func.max(column), func.sum(column), func.count(column))
+            .where(
+                Telemetry.device_id == device_id,
+                Telemetry.ts >= start,
+                Telemetry.ts <= to_ts,
+                column.is_not(None),
+            )
+            .group_by(b)
+        ).all()
+        series[field] = {int(r[0]): list(r[1:]) for r in rows}
+
+    if raw_fields and start < cold_storage.hot_cutoff("telemetry"):
+        for row in cold_storage.read("telemetry", device_id, start, to_ts, columns=raw_fields):
+            b = row["ts"] - row["ts"] % bucket_ms
+            for field in raw_fields:
+                value = row.get(field)
+                if value is None:
+                    continue
+                current = series[field].get(b)
+                series[field][b] = [min(current[0], value), max(current[1], value), current[2] + value, current[3] + 1] \
+                    if current else [value, value, value, 1]
+    return series
+
+
+def format_series(series: dict, fields: list) -> dict:
+    """Aligned arrays: {"ts": [...], "series": {field: {"min", "avg", "max"}}} with null gaps."""
+    timestamps = sorted({ts for buckets in series.values() for ts in buckets})
+    out = {}
+    for field in fields:
+        buckets = series.get(field, {})
+        mins, avgs, maxs = [], [], []
+        for ts in timestamps:
+            s = buckets.get(ts)
+            if s is None or not s[3]:
+                mins.append(None)
+                avgs.append(None)
+                maxs.append(None)
+                continue
+            mins.append(round(s[0], 3))
+            avgs.append(round(s[2] / s[3], 3))
+            maxs.append(round(s[1], 3))
+        out[field] = {"min": mins, "avg": avgs, "max": maxs}
+    return {"ts": timestamps, "series": out}
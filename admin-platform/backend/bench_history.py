@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the history endpoints (telemetry, events, logs).
+
+Seeds a throwaway SQLite database with one device's rows and times 500-row
+pages through the TestClient. Each endpoint is compared with the previous
+path, mounted on a separate app: ORM objects, json.loads of every stored
+payload (or LogResponse validation for logs) and FastAPI's jsonable_encoder.
+
+Run from the backend directory:
+    python bench_history.py [rows] [requests]
+"""
+
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+# The app reads its settings at import time
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_history.db"
+os.environ["API_TOKEN"] = ""
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from app.db import Base, SessionLocal, engine
+from app.main import app
+from app.models import DeviceLog, Event, Telemetry
+from app.raw_json import orjson
+from app.routers.logs import LogResponse
+
+DEVICE = "pi-1"
+TELEMETRY = {
+    "temp_c": 48.3, "load": [0.52, 0.41, 0.33], "mem_total_kb": 3884000, "mem_available_kb": 2511000,
+    "uptime_seconds": 123456, "disk_total_bytes": 31000000000, "disk_used_bytes": 9000000000,
+    "wifi": {"ssid": "net", "rssi": -61}, "ip": "10.0.0.12", "chromium": "running",
+}
+
+baseline = FastAPI()
+
+
+@baseline.get("/telemetry")
+def old_telemetry(limit: int):
+    with SessionLocal() as session:
+        rows = session.execute(
+            select(Telemetry).where(Telemetry.device_id == DEVICE).order_by(Telemetry.id.desc()).limit(limit)
+        ).scalars()
+        return [{"id": r.id, "ts": r.ts, "payload": json.loads(r.payload)} for r in rows]
+
+
+@baseline.get("/events")
+def old_events(limit: int):
+    with SessionLocal() as session:
+        rows = session.execute(
+            select(Event).where(Event.device_id == DEVICE).order_by(Event.id.desc()).limit(limit)
+        ).scalars()
+        return [{"id": r.id, "ts": r.ts, "type": r.type, "payload": json.loads(r.payload)} for r in rows]
+
+
+@baseline.get("/logs")
+def old_logs(limit: int):
+    with SessionLocal() as session:
+        rows = session.execute(select(DeviceLog).order_by(DeviceLog.id.desc()).limit(limit)).scalars()
+        return [LogResponse.model_validate(r) for r in rows]
+
+
+def seed(rows: int) -> None:
+    Base.metadata.create_all(bind=engine)
+    now = int(time.time() * 1000)
+    with SessionLocal() as session:
+        for i in range(rows):
+            ts = now - i * 60_000
+            session.add(Telemetry(device_id=DEVICE, ts=ts, payload=json.dumps(TELEMETRY),
+                                  temp_c=TELEMETRY["temp_c"], mem_available_kb=TELEMETRY["mem_available_kb"]))
+            session.add(Event(device_id=DEVICE, ts=ts, type="status",
+                              payload=json.dumps({"state": "ok", "n": i, "msg": "Skærm tændt"})))
+            session.add(DeviceLog(device_id=DEVICE, level="info", category="system", message=f"m{i}",
+                                  details=json.dumps({"k": i})))
+        session.commit()
+
+
+def bench(client: TestClient, url: str, rows: int, requests: int) -> float:
+    """Milliseconds per request, after a short warm-up."""
+    body = client.get(url).json()
+    assert len(body) == rows, f"{url}: {len(body)} rows"
+    for _ in range(5):
+        client.get(url)
+    started = time.perf_counter()
+    for _ in range(requests):
+        client.get(url)
+    return (time.perf_counter() - started) / requests * 1000
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    logging.disable(logging.INFO)
+    seed(rows)
+
+    # No `with`: startup (MQTT bridge, background threads) is not needed here
+    current, previous = TestClient(app), TestClient(baseline)
+    print(f"Encoder: {'orjson' if orjson else 'json (orjson not installed)'}, {rows} rows, {requests} requests")
+    for name, url, old_url in (
+        ("telemetry", f"/devices/{DEVICE}/telemetry?limit={rows}", f"/telemetry?limit={rows}"),
+        ("events", f"/devices/{DEVICE}/events?limit={rows}", f"/events?limit={rows}"),
+        ("logs", f"/logs?limit={rows}", f"/logs?limit={rows}"),
+    ):
+        old = bench(previous, old_url, rows, requests)
+        new = bench(current, url, rows, requests)
+        print(f"{name:10s} before: {old:6.2f} ms ({rows / old * 1000:7.0f} rows/s)  "
+              f"after: {new:6.2f} ms ({rows / new * 1000:7.0f} rows/s)  {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
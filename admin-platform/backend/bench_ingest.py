@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the MQTT payload decode path.
+
+Compares the per-message CPU cost of the previous path (str decode, json.loads,
+INFO log line, json.dumps for storage) with the current one (decode_payload on
+the raw bytes, original text stored verbatim, debug-level logging).
+
+Run from the backend directory:
+    python bench_ingest.py [messages]
+"""
+
+import io
+import json
+import logging
+import sys
+import time
+
+from app.payload_codec import decode_payload, orjson, payload_text
+
+TELEMETRY = {
+    "temp_c": 51.2, "load": [0.31, 0.28, 0.25], "mem_total_kb": 3884292, "mem_available_kb": 2811344,
+    "uptime_seconds": 864213, "disk_total_bytes": 31268536320, "disk_used_bytes": 6120148992,
+    "disk_free_bytes": 23841513472, "ip": "192.168.1.42", "ts": 1760000000000,
+}
+FULLY_EVENT = {"deviceId": "a1b2c3", "event": "screenOn", "ts": 1760000000000}
+
+
+def make_logger(level: int) -> logging.Logger:
+    log = logging.getLogger(f"bench-{level}")
+    log.propagate = False
+    log.setLevel(level)
+    handler = logging.StreamHandler(io.StringIO())
+    handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+    log.addHandler(handler)
+    return log
+
+
+def old_path(topic: str, data: bytes, log: logging.Logger) -> str:
+    log.info(f"[MQTT] Received: {topic}")
+    payload_raw = data.decode("utf-8", errors="ignore")
+    try:
+        payload = json.loads(payload_raw) if payload_raw else {}
+    except json.JSONDecodeError:
+        payload = {"raw": payload_raw}
+    payload.get("ts")
+    return json.dumps(payload)
+
+
+def new_path(topic: str, data: bytes, log: logging.Logger) -> str:
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(f"[MQTT] Received: {topic}")
+    payload, raw = decode_payload(data)
+    payload.get("ts")
+    return payload_text(payload, raw)
+
+
+def bench(fn, messages: list, log: logging.Logger) -> float:
+    """CPU microseconds per message."""
+    started = time.process_time()
+    for topic, data in messages:
+        fn(topic, data, log)
+    return (time.process_time() - started) / len(messages) * 1e6
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    messages = []
+    for i in range(count):
+        if i % 10:
+            messages.append((f"devices/pi-{i % 500}/telemetry", json.dumps(TELEMETRY).encode()))
+        else:
+            messages.append((f"fully/event/screenOn/{i % 500}", json.dumps(FULLY_EVENT).encode()))
+
+    log = make_logger(logging.INFO)
+    print(f"Parser: {'orjson' if orjson else 'json (orjson not installed)'}, {count} messages")
+    old = bench(old_path, messages, log)
+    new = bench(new_path, messages, log)
+    print(f"before: {old:6.2f} us/msg")
+    print(f"after:  {new:6.2f} us/msg  ({old / new:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
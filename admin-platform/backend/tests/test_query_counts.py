@@ -0,0 +1,105 @@
+"""The customer list endpoints must issue a fixed number of SQL statements.
+
+Each endpoint is called against a small and a large data set; the statement
+count has to be the same for both (no per-row queries). Run from the backend
+directory with `python -m pytest`.
+"""
+
+import os
+import tempfile
+from contextlib import contextmanager
+
+_db_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_dir}/query_counts.db"
+os.environ["API_TOKEN"] = ""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, event
+
+from app.db import Base, SessionLocal, engine
+from app.main import app
+from app.models import Customer, CustomerCode, Device, DeviceAssignment
+
+# Statements each endpoint may issue, whatever the number of rows
+EXPECTED = {
+    "/customers": 2,  # customers + grouped device counts
+    "/customers/{id}/devices": 2,  # customer + assignments joined with devices
+    "/customer-codes": 2,  # codes + IN load of customer names
+}
+
+
+@contextmanager
+def count_queries():
+    """Collect the SQL statements run on the engine inside the block."""
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", on_execute)
+
+
+def seed(customers: int) -> int:
+    """Replace the data with `customers` customers, each with two devices (one unknown) and a code."""
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as session:
+        for model in (CustomerCode, DeviceAssignment, Device, Customer):
+            session.execute(delete(model))
+        rows = [Customer(name=f"Customer {i}") for i in range(customers)]
+        session.add_all(rows)
+        session.flush()
+        for i, customer in enumerate(rows):
+            session.add(Device(id=f"pi-{i}", name=f"Screen {i}"))
+            session.add(DeviceAssignment(device_id=f"pi-{i}", customer_id=customer.id))
+            # Assigned but never seen over MQTT: no device row
+            session.add(DeviceAssignment(device_id=f"ghost-{i}", customer_id=customer.id))
+            session.add(CustomerCode(customer_id=customer.id, code=f"{i:04d}", start_url="https://example.com"))
+        session.commit()
+        return rows[0].id
+
+
+def statement_counts(client: TestClient, customers: int) -> dict:
+    first = seed(customers)
+    counts = {}
+    for name, url in (
+        ("/customers", "/customers"),
+        ("/customers/{id}/devices", f"/customers/{first}/devices"),
+        ("/customer-codes", "/customer-codes"),
+    ):
+        with count_queries() as statements:
+            response = client.get(url)
+        assert response.status_code == 200, response.text
+        counts[name] = len(statements)
+    return counts
+
+
+@pytest.fixture(scope="module")
+def client():
+    # No `with`: startup (MQTT bridge, background threads) is not needed here
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("customers", [3, 40])
+def test_customer_lists_issue_fixed_statement_counts(client, customers):
+    assert statement_counts(client, customers) == EXPECTED
+
+
+def test_customer_lists_return_all_rows(client):
+    first = seed(40)
+    customers = client.get("/customers").json()
+    assert len(customers) == 40
+    assert {c["device_count"] for c in customers} == {2}
+
+    devices = client.get(f"/customers/{first}/devices").json()
+    assert [d["device_id"] for d in devices] == ["pi-0", "ghost-0"]
+    assert devices[0]["device"]["name"] == "Screen 0"
+    assert devices[1]["device"] is None
+
+    codes = client.get("/customer-codes").json()
+    assert len(codes) == 40
+    assert all(c["customer_name"] == f"Customer {int(c['code'])}" for c in codes)
@@ -6,6 +6,12 @@ export async function fetchDevices() {
   return res.json();
 }
 
+export async function fetchDevicesOverview(events = 8) {
+  const res = await fetch(`${API_URL}/devices/overview?events=${events}`);
+  if (!res.ok) throw new Error('Failed to fetch devices');
+  return res.json();
+}
+
 export async function fetchTelemetry(deviceId, limit = 1) {
   const res = await fetch(`${API_URL}/devices/${deviceId}/telemetry?limit=${limit}`);
   if (!res.ok) throw new Error('Failed to fetch telemetry');
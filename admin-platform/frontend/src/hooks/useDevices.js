@@ -1,9 +1,8 @@
 import { useCallback, useEffect, useState } from 'react';
 import {
   approveDevice,
-  fetchDevices,
+  fetchDevicesOverview,
   fetchEvents,
-  fetchTelemetry,
   sendCommand,
 } from '../api.js';
 
@@ -17,24 +16,10 @@ export function useDevices() {
   const loadDevices = useCallback(async () => {
     try {
       setLoading(true);
-      const data = await fetchDevices();
+      const data = await fetchDevicesOverview(8);
       setDevices(data);
-
-      const telemPairs = await Promise.all(
-        data.map(async (d) => {
-          const t = await fetchTelemetry(d.id, 1).catch(() => []);
-          return [d.id, t[0]?.payload || null];
-        })
-      );
-      setTelemetry(Object.fromEntries(telemPairs));
-
-      const eventPairs = await Promise.all(
-        data.map(async (d) => {
-          const e = await fetchEvents(d.id, 8).catch(() => []);
-          return [d.id, e];
-        })
-      );
-      setEvents(Object.fromEntries(eventPairs));
+      setTelemetry(Object.fromEntries(data.map((d) => [d.id, d.telemetry?.payload || null])));
+      setEvents(Object.fromEntries(data.map((d) => [d.id, d.events])));
 
       setError('');
     } catch (err) {